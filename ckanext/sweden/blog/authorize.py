@@ -1,15 +1,56 @@
+from sqlalchemy import and_
+
+import ckan.model as model
 import ckan.plugins.toolkit as toolkit
 
+from ckanext.sweden.cache import TTLCache, after_commit_listener
+
+BLOG_ADMINS_GROUP = 'blogadmins'
+
+# The ids of the members of the blogadmins group. Membership changes made in
+# this process remove it once they are committed, the ones made in other
+# processes are picked up when it expires.
+_blog_admins_cache = TTLCache(ttl=300)
+
+
+def _get_blog_admin_ids():
+    '''Return the set of ids of the users in the blogadmins group, or None if
+    the group doesn't exist.'''
+    rows = model.Session.query(model.Group.id, model.Member.table_id).\
+        outerjoin(model.Member, and_(
+            model.Member.group_id == model.Group.id,
+            model.Member.table_name == 'user',
+            model.Member.state == 'active')).\
+        filter(model.Group.name == BLOG_ADMINS_GROUP).\
+        all()
+    if not rows:
+        return None
+    return frozenset(user_id for group_id, user_id in rows if user_id)
+
+
+def get_blog_admin_ids():
+    '''Return the (cached) set of ids of the users in the blogadmins group, or
+    None if the group doesn't exist.'''
+    return _blog_admins_cache.get_or_set(BLOG_ADMINS_GROUP,
+                                         _get_blog_admin_ids)
+
+
+def invalidate_blog_admins():
+    '''Remove the cached ids of the blogadmins.'''
+    _blog_admins_cache.invalidate()
+
+
+# Mapper event listener for the blogadmins group and its members
+blog_admins_changed = after_commit_listener(invalidate_blog_admins)
+
 
 def blog_admin(context, data_dict=None):
     # Get the user name of the logged-in user.
     user_name = context.get('user')
 
-    # Get a list of the members of the 'blogadmins' group.
-    try:
-        members = toolkit.get_action('member_list')(
-            data_dict={'id': 'blogadmins', 'object_type': 'user'})
-    except toolkit.ObjectNotFound:
+    # Get the ids of the members of the 'blogadmins' group.
+    member_ids = get_blog_admin_ids()
+    if member_ids is None:
         # The blogadmins group doesn't exist.
         return {'success': False,
                 'msg': toolkit._(
@@ -17,22 +58,23 @@ def blog_admin(context, data_dict=None):
                    "are authorized to administrate the blog.")
                 }
 
-    # 'members' is a list of (user_id, object_type, capacity) tuples, we're
-    # only interested in the user_ids.
-    member_ids = [member_tuple[0] for member_tuple in members]
-
-    # We have the logged-in user's user name, get their user id.
-    convert_user_name_or_id_to_id = toolkit.get_converter(
-        'convert_user_name_or_id_to_id')
-    try:
-        user_id = convert_user_name_or_id_to_id(user_name, context)
-    except toolkit.Invalid:
-        # The user doesn't exist (e.g. they're not logged-in).
-        return {'success': False,
-                'msg': toolkit._(
-                    'You must be logged-in as a member of the blogadmins '
-                    'group to administrate the blog.')
-                }
+    # We have the logged-in user's user name, get their user id. check_access
+    # has usually looked the user up already.
+    user_obj = context.get('auth_user_obj')
+    if user_obj is not None and user_obj.name == user_name:
+        user_id = user_obj.id
+    else:
+        convert_user_name_or_id_to_id = toolkit.get_converter(
+            'convert_user_name_or_id_to_id')
+        try:
+            user_id = convert_user_name_or_id_to_id(user_name, context)
+        except toolkit.Invalid:
+            # The user doesn't exist (e.g. they're not logged-in).
+            return {'success': False,
+                    'msg': toolkit._(
+                        'You must be logged-in as a member of the blogadmins '
+                        'group to administrate the blog.')
+                    }
 
     # Finally, we can test whether the user is a member of the blogadmins group.
     if user_name and user_id in member_ids:
@@ -42,3 +84,12 @@ def blog_admin(context, data_dict=None):
                 'msg': toolkit._(
                     'Only blogadmins are allowed to administrate the blog')
         }
+
+
+@toolkit.auth_allow_anonymous_access
+def blog_post_show(context, data_dict=None):
+    # Anyone can read the published posts.
+    return {'success': True}
+
+
+blog_post_list = blog_post_search = blog_post_show
@@ -0,0 +1,50 @@
+import logging
+import sys
+
+from ckan.lib.cli import CkanCommand
+# No other CKAN imports allowed until _load_config is run,
+# or logging is disabled
+
+
+class ExportNews(CkanCommand):
+    """Export the news pages to static files
+
+    Usage:
+
+      sweden_blog_export [DIRECTORY] [--force]
+        - Write the news page, the news feeds and the published posts to
+          DIRECTORY (default: ckanext.sweden.blog.export_dir), rendering
+          them from ckan.site_url. Only the posts that changed since the
+          last export, and the listings showing them, are written unless
+          --force is given. The files of deleted posts are removed.
+    """
+    summary = __doc__.split('\n')[0]
+    usage = __doc__
+    max_args = 1
+    min_args = 0
+
+    def __init__(self, name):
+        super(ExportNews, self).__init__(name)
+        self.parser.add_option('--force', action='store_true', dest='force',
+                               default=False,
+                               help='Write all the pages')
+
+    def command(self):
+        self._load_config()
+        log = logging.getLogger(__name__)
+
+        import ckan.model as model
+        model.Session.remove()
+        model.Session.configure(bind=model.meta.engine)
+
+        from ckanext.sweden.blog import export
+        export_dir = self.args[0] if self.args else export.get_export_dir()
+        if not export_dir:
+            print 'No export directory given, and ' \
+                'ckanext.sweden.blog.export_dir is not set'
+            sys.exit(1)
+
+        exporter = export.NewsExporter(export_dir)
+        written, removed = exporter.export_all(force=self.options.force)
+        log.info("Exported {0} news pages to {1}, removed {2}".format(
+            written, export_dir, removed))
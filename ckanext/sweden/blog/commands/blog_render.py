@@ -0,0 +1,37 @@
+import logging
+
+from ckan.lib.cli import CkanCommand
+# No other CKAN imports allowed until _load_config is run,
+# or logging is disabled
+
+
+class RenderPosts(CkanCommand):
+    """Render the HTML of existing blog posts
+
+    Usage:
+
+      sweden_blog_render
+        - Add any missing columns to the blog_post table, and store the
+          rendered HTML content and excerpt, and the search vector, of the
+          posts that don't have them yet
+    """
+    summary = __doc__.split('\n')[0]
+    usage = __doc__
+    max_args = 0
+    min_args = 0
+
+    def __init__(self, name):
+        super(RenderPosts, self).__init__(name)
+
+    def command(self):
+        self._load_config()
+        log = logging.getLogger(__name__)
+
+        import ckan.model as model
+        model.Session.remove()
+        model.Session.configure(bind=model.meta.engine)
+
+        import ckanext.sweden.blog.model.post as post_model
+        post_model.init_tables(model.meta.engine)
+        count = post_model.render_all()
+        log.info("Rendered {0} blog posts".format(count))
@@ -1,13 +1,29 @@
+import hashlib
+import json
 import logging
-from webhelpers.markdown import markdown
+from pylons import config
+from webob.datetime_utils import UTC
 from ckan import model
 from ckan.lib.base import (h, c, BaseController, request, response, abort)
 from ckan.lib.helpers import flash_notice
 import ckan.plugins.toolkit as toolkit
 from sqlalchemy.orm.exc import NoResultFound
 
+from ckanext.sweden.blog import export
+from ckanext.sweden.cache import TTLCache
+
 log = logging.getLogger(__name__)
 
+FEED_CONTENT_TYPES = {
+    'rss': 'application/rss+xml',
+    'atom': 'application/atom+xml',
+    'json': 'application/json',
+}
+
+# The feed items, shared by all the feed formats. Only the items of the
+# current posts version are kept for each language and limit.
+_feed_cache = TTLCache(ttl=3600)
+
 
 class ValidationError(Exception):
     pass
@@ -32,13 +48,177 @@ def _validate_blog_post(data_dict, original_title=None):
     return title, content
 
 
+def _etag(*parts):
+    '''Return a strong ETag for a response that only depends on `parts`.'''
+    return hashlib.sha1(u'|'.join(
+        unicode(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+def _not_modified(etag, last_modified):
+    '''
+    Set the ETag and Last-Modified headers of the response, and return True
+    (with a 304 status) if the client already has this version, in which case
+    there is no need to render it.
+    '''
+    response.etag = etag
+    if last_modified is not None:
+        last_modified = last_modified.replace(microsecond=0, tzinfo=UTC)
+        response.last_modified = last_modified
+
+    if request.if_none_match:
+        fresh = etag in request.if_none_match
+    elif request.if_modified_since and last_modified is not None:
+        fresh = last_modified <= request.if_modified_since
+    else:
+        fresh = False
+
+    if fresh:
+        response.status_int = 304
+    return fresh
+
+
+def _site_url():
+    return config.get('ckan.site_url', '').rstrip('/')
+
+
+def _feed_items(version, limit):
+    '''Return the `limit` newest visible posts as a list of feed item dicts,
+    cached for the given posts version.'''
+    from ckanext.sweden.blog.model.post import Post
+
+    def _items():
+        posts = model.Session.query(Post).\
+            filter(Post.visible == True).\
+            order_by(Post.created.desc(), Post.id.desc()).\
+            limit(limit)
+        return [{
+            'id': post.id,
+            'title': post.title,
+            'url': _site_url() + h.url_for('news_post', title=post.url),
+            'created': post.created,
+            'modified': post.last_modified,
+            'author': post.author.display_name if post.author else None,
+            'content_html': unicode(post.content_html or
+                                    h.render_markdown(post.content)),
+        } for post in posts]
+
+    key = (h.lang(), limit)
+    version = tuple(version)
+    cached = _feed_cache.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    items = _items()
+    _feed_cache.set(key, (version, items))
+    return items
+
+
+def _json_feed(items):
+    '''Return the feed items as a JSON Feed (https://jsonfeed.org/).'''
+    site_url = _site_url()
+    return json.dumps({
+        'version': 'https://jsonfeed.org/version/1',
+        'title': u'{0} - {1}'.format(config.get('ckan.site_title', ''),
+                                     toolkit._('News')),
+        'home_page_url': site_url + h.url_for('news'),
+        'feed_url': site_url + h.url_for('news_feed_json'),
+        'items': [{
+            'id': item['url'],
+            'url': item['url'],
+            'title': item['title'],
+            'content_html': item['content_html'],
+            'date_published': item['created'].isoformat() + 'Z',
+            'date_modified': item['modified'].isoformat() + 'Z',
+            'author': {'name': item['author']} if item['author'] else None,
+        } for item in items],
+    })
+
+
+def _api_response(action, data_dict, etag, last_modified):
+    '''
+    Return the result of a blog API action as JSON, or an empty 304
+    response if the client already has the version identified by `etag`.
+    The responses can be cached by anyone, but must be revalidated.
+    '''
+    response.headers['Cache-Control'] = 'public, no-cache'
+    if 'Pragma' in response.headers:
+        del response.headers['Pragma']
+    if _not_modified(etag, last_modified):
+        return ''
+
+    response.headers['Content-Type'] = 'application/json'
+    response.charset = 'utf-8'
+    try:
+        result = toolkit.get_action(action)({'user': c.user}, data_dict)
+    except toolkit.ValidationError, e:
+        # Errors are not versions of the resource
+        response.etag = None
+        response.status_int = 400
+        return json.dumps({'error': e.error_dict})
+    except toolkit.ObjectNotFound:
+        abort(404, toolkit._('Post not found'))
+    return json.dumps(result)
+
+
 class BlogController(BaseController):
 
+    def _get_page(self):
+        '''Set the page of visible posts requested by the `before` or `after`
+        params in c.posts, and the cursors of the adjacent pages in c.newer
+        and c.older.'''
+        from ckanext.sweden.blog.model import post as post_model
+
+        q = model.Session.query(post_model.Post).\
+            filter(post_model.Post.visible == True)
+        limit = toolkit.asint(
+            config.get('ckanext.sweden.blog.posts_per_page', 20))
+        try:
+            c.posts, c.newer, c.older = post_model.get_page(
+                q, before=request.params.get('before'),
+                after=request.params.get('after'), limit=limit)
+        except ValueError:
+            abort(400, toolkit._('Invalid page'))
+
+    def _search(self, q):
+        '''Set the page of visible posts matching `q` requested by the `page`
+        param in c.page and c.posts, best match first.'''
+        from ckanext.sweden.blog.model import post as post_model
+
+        query = model.Session.query(post_model.Post).\
+            filter(post_model.Post.visible == True)
+        limit = toolkit.asint(
+            config.get('ckanext.sweden.blog.posts_per_page', 20))
+        try:
+            page = int(request.params.get('page', 1))
+            if page < 1:
+                raise ValueError
+        except ValueError:
+            abort(400, toolkit._('Invalid page'))
+
+        posts, count = post_model.search(query, q, limit=limit,
+                                         offset=(page - 1) * limit)
+
+        def pager_url(q=None, page=None):
+            return h.url_for('news', q=q, page=page)
+
+        c.q = q
+        c.page = h.Page(collection=posts, page=page, url=pager_url,
+                        item_count=count, items_per_page=limit)
+        c.page.items = c.posts = posts
+
     def index(self):
-        from ckanext.sweden.blog.model.post import Post
+        from ckanext.sweden.blog.model import post as post_model
 
-        c.posts = model.Session.query(Post).\
-            filter(Post.visible == True).order_by('created desc')
+        count, last_modified = post_model.get_version()
+        etag = _etag('news', count, last_modified, h.lang(), c.user,
+                     request.query_string)
+        if _not_modified(etag, last_modified):
+            return ''
+
+        q = request.params.get('q', u'').strip()
+        if q:
+            self._search(q)
+        else:
+            self._get_page()
 
         return toolkit.render('blog/index.html')
 
@@ -50,10 +230,7 @@ class BlogController(BaseController):
         except toolkit.NotAuthorized:
             h.redirect_to('/news')
 
-        from ckanext.sweden.blog.model.post import Post
-
-        c.posts = model.Session.query(Post).\
-            filter(Post.visible == True).order_by('created desc')
+        self._get_page()
 
         return toolkit.render('blog/admin_list.html')
 
@@ -74,8 +251,10 @@ class BlogController(BaseController):
         except NoResultFound:
             abort(404)
 
+        removed = (post.url, post.created, post.id)
         model.Session.delete(post)
         model.Session.commit()
+        export.post_removed(*removed)
         flash_notice(toolkit._("The blog post has been removed!"))
 
         h.redirect_to(
@@ -92,10 +271,13 @@ class BlogController(BaseController):
         except NoResultFound:
             abort(404)
 
-        c.content_markdown = markdown(c.post.content)
-        c.post_author = (model.User.get(c.post.user_id)
-                         or model.Session.query(model.User).filter_by(
-                             id=c.post.user_id).first())
+        etag = _etag('post', c.post.id, c.post.last_modified, h.lang(),
+                     c.user)
+        if _not_modified(etag, c.post.last_modified):
+            return ''
+
+        c.content_markdown = c.post.content_html
+        c.post_author = c.post.author
 
         return toolkit.render('blog/post.html')
 
@@ -124,6 +306,7 @@ class BlogController(BaseController):
             newPost = Post(title, content, c.userobj.id)
             model.Session.add(newPost)
             model.Session.commit()
+            export.post_saved(newPost)
             flash_notice(toolkit._("Your blog post has been saved!"))
 
             controller = 'ckanext.sweden.blog.controllers.blog:BlogController'
@@ -167,7 +350,9 @@ class BlogController(BaseController):
 
             c.post.title = title
             c.post.content = content
+            c.post.render()
             model.Session.commit()
+            export.post_saved(c.post)
 
             flash_notice(toolkit._("Your blog post has been updated!"))
 
@@ -178,13 +363,51 @@ class BlogController(BaseController):
             'blog/admin_edit.html',
             extra_vars={'data_dict': data_dict, 'errors': ''})
 
-    def feed(self):
-        from ckanext.sweden.blog.model.post import Post
+    def api_list(self):
+        '''Return a page of the published posts as JSON, with the
+        parameters of the `blog_post_list` action.'''
+        from ckanext.sweden.blog.model import post as post_model
+
+        count, last_modified = post_model.get_version()
+        etag = _etag('api_list', count, last_modified, request.query_string)
+        return _api_response('blog_post_list', dict(request.params), etag,
+                             last_modified)
 
-        c.posts = model.Session.query(Post).\
-            filter(Post.visible == True).order_by('created desc')
+    def api_show(self, title):
+        '''Return a published post as JSON, with the parameters of the
+        `blog_post_show` action.'''
+        from ckanext.sweden.blog.model.post import Post
 
-        response.headers['Content-Type'] = 'application/rss+xml'
+        version = model.Session.query(Post.id, Post.created, Post.modified).\
+            filter(Post.url == title).\
+            filter(Post.visible == True).\
+            first()
+        if version is None:
+            abort(404, toolkit._('Post not found'))
+        last_modified = version.modified or version.created
+
+        etag = _etag('api_show', version.id, last_modified,
+                     request.query_string)
+        data_dict = dict(request.params)
+        data_dict['id'] = version.id
+        return _api_response('blog_post_show', data_dict, etag,
+                             last_modified)
+
+    def feed(self, format='rss'):
+        from ckanext.sweden.blog.model import post as post_model
+
+        limit = toolkit.asint(config.get('ckanext.sweden.blog.feed_items', 20))
+        version = post_model.get_version()
+        etag = _etag('feed', format, version[0], version[1], h.lang(), limit)
+        if _not_modified(etag, version[1]):
+            return ''
+
+        c.items = _feed_items(version, limit)
+        c.last_modified = version[1]
+
+        response.headers['Content-Type'] = FEED_CONTENT_TYPES[format]
         response.charset = 'utf-8'
 
-        return toolkit.render('blog/rss.html')
+        if format == 'json':
+            return _json_feed(c.items)
+        return toolkit.render('blog/{0}.html'.format(format))
@@ -0,0 +1,224 @@
+import errno
+import gzip
+import os
+import threading
+import time
+
+import requests
+from pylons import config
+from sqlalchemy import func, tuple_
+
+import ckan.model as model
+
+log = __import__('logging').getLogger(__name__)
+
+# The paths of the listings of the newest posts
+LISTING_PATH = '/news'
+FEED_PATHS = ('/news.rss', '/news.atom', '/news.json')
+
+FETCH_TIMEOUT = 30
+
+
+def get_export_dir():
+    '''Return the directory the news pages are exported to, from the
+    `ckanext.sweden.blog.export_dir` config option, or None if they are not
+    exported.'''
+    return config.get('ckanext.sweden.blog.export_dir') or None
+
+
+def post_path(name):
+    return '/news/' + name
+
+
+def fetch_url(path):
+    '''Return the body of the page at `path` of the site, as seen by an
+    anonymous visitor.'''
+    url = config.get('ckan.site_url', '').rstrip('/') + path
+    response = requests.get(url, timeout=FETCH_TIMEOUT,
+                            allow_redirects=False)
+    response.raise_for_status()
+    return response.content
+
+
+def _in_newest(created, post_id, limit):
+    '''Return True if a post with the given (created, id) is, or would be,
+    one of the `limit` newest visible posts.'''
+    from ckanext.sweden.blog.model.post import Post
+    newer = model.Session.query(func.count(Post.id)).\
+        filter(Post.visible == True).\
+        filter(tuple_(Post.created, Post.id) > tuple_(created, post_id)).\
+        scalar()
+    return newer < limit
+
+
+def listing_paths(created, post_id):
+    '''Return the paths of the listings showing a post with the given
+    (created, id).'''
+    paths = []
+    if _in_newest(created, post_id, int(
+            config.get('ckanext.sweden.blog.posts_per_page', 20))):
+        paths.append(LISTING_PATH)
+    if _in_newest(created, post_id, int(
+            config.get('ckanext.sweden.blog.feed_items', 20))):
+        paths.extend(FEED_PATHS)
+    return paths
+
+
+class NewsExporter(object):
+    '''
+    Write the news pages to files under `export_dir`, so they can be served
+    by the web server: `/news` to `news.html`, `/news/<name>` to
+    `news/<name>.html` and the feeds to `news.rss`, `news.atom` and
+    `news.json`, each with a gzipped `.gz` copy.
+
+    The pages are rendered by `fetch(path)`, which requests them from the
+    site by default.
+    '''
+
+    def __init__(self, export_dir, fetch=None):
+        self.export_dir = export_dir
+        self.fetch = fetch or fetch_url
+
+    def file_path(self, path):
+        name = path.lstrip('/')
+        if not os.path.splitext(name)[1]:
+            name += '.html'
+        return os.path.join(self.export_dir, *name.split('/'))
+
+    def write(self, path, mtime=None):
+        '''Render the page at `path` and write it, and its gzipped copy,
+        replacing the old files at once. `mtime` is the timestamp to give
+        the files, if any.'''
+        content = self.fetch(path)
+        file_path = self.file_path(path)
+        directory = os.path.dirname(file_path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        tmp_path = file_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        gz_tmp_path = file_path + '.gz.tmp'
+        with open(gz_tmp_path, 'wb') as f:
+            gz = gzip.GzipFile(filename='', mode='wb', fileobj=f, mtime=0)
+            gz.write(content)
+            gz.close()
+        for tmp in (tmp_path, gz_tmp_path):
+            if mtime is not None:
+                os.utime(tmp, (mtime, mtime))
+            os.rename(tmp, tmp[:-len('.tmp')])
+
+    def remove(self, path):
+        file_path = self.file_path(path)
+        for name in (file_path, file_path + '.gz'):
+            try:
+                os.remove(name)
+            except OSError, e:
+                if e.errno != errno.ENOENT:
+                    raise
+
+    def export(self, paths, removed=(), mtimes=None):
+        '''Write the pages at `paths` and remove the ones at `removed`.
+        Failures are logged, and don't stop the other pages from being
+        exported. Returns the number of pages written.'''
+        mtimes = mtimes or {}
+        for path in removed:
+            try:
+                self.remove(path)
+            except OSError, e:
+                log.error('Could not remove the export of {0}: {1}'.format(
+                    path, e))
+        written = 0
+        for path in paths:
+            try:
+                self.write(path, mtime=mtimes.get(path))
+                written += 1
+            except (requests.RequestException, IOError, OSError), e:
+                log.error('Could not export {0}: {1}'.format(path, e))
+        return written
+
+    def _mtime(self, path):
+        try:
+            return os.path.getmtime(self.file_path(path))
+        except OSError:
+            return None
+
+    def export_all(self, force=False):
+        '''
+        Bring the export up to date: write the posts whose files are missing
+        or older than the post, remove the files of the posts that are no
+        longer published, and rewrite the listings if any of the posts they
+        show changed. With `force`, write all the pages.
+
+        Returns a (written, removed) pair with the number of pages.
+        '''
+        from ckanext.sweden.blog.model.post import Post
+
+        posts = model.Session.query(Post.id, Post.url, Post.created,
+                                    Post.modified).\
+            filter(Post.visible == True).all()
+
+        paths, mtimes, listings = [], {}, set()
+        for post in posts:
+            path = post_path(post.url)
+            mtime = _timestamp(post.modified or post.created)
+            mtimes[path] = mtime
+            exported = self._mtime(path)
+            if force or exported is None or exported < mtime:
+                paths.append(path)
+                listings.update(listing_paths(post.created, post.id))
+
+        names = set(post.url for post in posts)
+        removed = [post_path(name) for name in self._exported_posts()
+                   if name not in names]
+        if removed or force:
+            listings.update((LISTING_PATH,) + FEED_PATHS)
+        listings.update(path for path in (LISTING_PATH,) + FEED_PATHS
+                        if self._mtime(path) is None)
+
+        written = self.export(paths + sorted(listings), removed=removed,
+                              mtimes=mtimes)
+        return written, len(removed)
+
+    def _exported_posts(self):
+        directory = os.path.join(self.export_dir, 'news')
+        if not os.path.isdir(directory):
+            return []
+        return [name[:-len('.html')] for name in os.listdir(directory)
+                if name.endswith('.html')]
+
+
+def _timestamp(dt):
+    return time.mktime(dt.timetuple())
+
+
+def _export_in_background(paths, removed=(), mtimes=None):
+    '''Export the pages in a separate thread, so the request that changed
+    them doesn't wait for them to be rendered (and, with a single threaded
+    server, can finish so they can be rendered).'''
+    exporter = NewsExporter(get_export_dir())
+    thread = threading.Thread(target=exporter.export,
+                              args=(paths, removed, mtimes))
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+def post_saved(post):
+    '''Export a post that was created or edited, and the listings showing
+    it, if the news pages are exported. Call it after committing.'''
+    if not get_export_dir():
+        return None
+    path = post_path(post.url)
+    paths = [path] + listing_paths(post.created, post.id)
+    return _export_in_background(
+        paths, mtimes={path: _timestamp(post.last_modified)})
+
+
+def post_removed(name, created, post_id):
+    '''Remove the export of a deleted post, and export the listings that
+    showed it, if the news pages are exported. Call it after committing.'''
+    if not get_export_dir():
+        return None
+    return _export_in_background(listing_paths(created, post_id),
+                                 removed=[post_path(name)])
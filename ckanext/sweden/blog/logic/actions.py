@@ -0,0 +1,206 @@
+from pylons import config
+from sqlalchemy import or_
+from sqlalchemy.orm import lazyload, load_only
+
+import ckan.lib.helpers as h
+import ckan.model as model
+import ckan.plugins.toolkit as toolkit
+
+# The maximum number of posts returned by a list or search
+MAX_ROWS = 100
+
+# The fields of the post dicts, and the columns of the blog_post table
+# needed for each
+POST_FIELDS = {
+    'id': ('id',),
+    'title': ('title',),
+    'name': ('url',),
+    'url': ('url',),
+    'created': ('created',),
+    'modified': ('modified', 'created'),
+    'author': ('user_id',),
+    'excerpt_html': ('excerpt_html',),
+    'content': ('content',),
+    'content_html': ('content_html',),
+}
+
+# The fields returned when none are asked for. The posts lists leave out
+# the content.
+LIST_FIELDS = ('id', 'title', 'name', 'url', 'created', 'modified', 'author',
+               'excerpt_html')
+SHOW_FIELDS = LIST_FIELDS + ('content', 'content_html')
+
+
+def _int_param(data_dict, key, default, minimum=0, maximum=None):
+    try:
+        value = int(data_dict.get(key) or default)
+        if value < minimum or (maximum is not None and value > maximum):
+            raise ValueError
+    except ValueError:
+        if maximum is None:
+            msg = toolkit._('Must be an integer of at least {0}').format(
+                minimum)
+        else:
+            msg = toolkit._('Must be an integer between {0} and {1}').format(
+                minimum, maximum)
+        raise toolkit.ValidationError({key: [msg]})
+    return value
+
+
+def _limit_param(data_dict):
+    return _int_param(
+        data_dict, 'limit',
+        config.get('ckanext.sweden.blog.posts_per_page', 20),
+        minimum=1, maximum=MAX_ROWS)
+
+
+def _fields_param(data_dict, default):
+    '''Return the list of fields asked for in the `fields` param, either a
+    list or a comma separated string.'''
+    fields = data_dict.get('fields')
+    if not fields:
+        return list(default)
+    if isinstance(fields, basestring):
+        fields = [field.strip() for field in fields.split(',')]
+    unknown = [field for field in fields if field not in POST_FIELDS]
+    if unknown:
+        raise toolkit.ValidationError({'fields': [
+            toolkit._('Unknown fields: {0}. Valid fields are: {1}').format(
+                ', '.join(unknown), ', '.join(sorted(POST_FIELDS)))]})
+    return fields
+
+
+def _posts_query(fields, extra_columns=()):
+    '''Return a query of the visible posts, loading only the columns needed
+    for `fields` (and `extra_columns`).'''
+    from ckanext.sweden.blog.model.post import Post
+
+    columns = set(extra_columns)
+    for field in fields:
+        columns.update(POST_FIELDS[field])
+    q = model.Session.query(Post).\
+        filter(Post.visible == True).\
+        options(load_only(*columns))
+    if 'author' not in fields:
+        q = q.options(lazyload(Post.author))
+    return q
+
+
+def _post_dict(post, fields):
+    values = {
+        'id': lambda: post.id,
+        'title': lambda: post.title,
+        'name': lambda: post.url,
+        'url': lambda: h.url_for('news_post', title=post.url, qualified=True),
+        'created': lambda: post.created.isoformat(),
+        'modified': lambda: post.last_modified.isoformat(),
+        'author': lambda: (post.author.display_name if post.author
+                           else None),
+        'excerpt_html': lambda: post.excerpt_html,
+        'content': lambda: post.content,
+        'content_html': lambda: post.content_html,
+    }
+    return dict((field, values[field]()) for field in fields)
+
+
+@toolkit.side_effect_free
+def blog_post_list(context, data_dict):
+    '''
+    Return the published news posts, newest first, as a dict with the
+    `results` and the `newer` and `older` cursors of the adjacent pages
+    (None if there are no posts in that direction).
+
+    :param fields: the fields of the posts to return, a list or a comma
+        separated string, out of ``id``, ``title``, ``name``, ``url``,
+        ``created``, ``modified``, ``author``, ``excerpt_html``,
+        ``content`` and ``content_html`` (default: all but the content)
+    :param limit: the maximum number of posts to return (default:
+        ``ckanext.sweden.blog.posts_per_page``, at most 100)
+    :param before: only return the posts older than this cursor (optional)
+    :param after: only return the posts newer than this cursor (optional)
+    '''
+    toolkit.check_access('blog_post_list', context, data_dict)
+
+    from ckanext.sweden.blog.model import post as post_model
+
+    fields = _fields_param(data_dict, LIST_FIELDS)
+    limit = _limit_param(data_dict)
+    # The posts are paginated on (created, id)
+    q = _posts_query(fields, extra_columns=('id', 'created'))
+    try:
+        posts, newer, older = post_model.get_page(
+            q, before=data_dict.get('before'), after=data_dict.get('after'),
+            limit=limit)
+    except ValueError:
+        raise toolkit.ValidationError(
+            {'before': [toolkit._('Invalid cursor')]}
+            if data_dict.get('before') else
+            {'after': [toolkit._('Invalid cursor')]})
+
+    return {
+        'results': [_post_dict(post, fields) for post in posts],
+        'newer': newer,
+        'older': older,
+    }
+
+
+@toolkit.side_effect_free
+def blog_post_show(context, data_dict):
+    '''
+    Return a published news post as a dict.
+
+    :param id: the id or name (as in its URL) of the post
+    :param fields: the fields of the post to return, like for
+        ``blog_post_list`` (default: all, including the content)
+    '''
+    toolkit.check_access('blog_post_show', context, data_dict)
+
+    from ckanext.sweden.blog.model.post import Post
+
+    post_id = data_dict.get('id')
+    if not post_id:
+        raise toolkit.ValidationError({'id': [toolkit._('Missing value')]})
+    fields = _fields_param(data_dict, SHOW_FIELDS)
+
+    post = _posts_query(fields).\
+        filter(or_(Post.id == post_id, Post.url == post_id)).\
+        first()
+    if post is None:
+        raise toolkit.ObjectNotFound(toolkit._('Post not found'))
+
+    return _post_dict(post, fields)
+
+
+@toolkit.side_effect_free
+def blog_post_search(context, data_dict):
+    '''
+    Search the published news posts, returning a dict with the total
+    `count` of matching posts and the `results`, best match first.
+
+    Each result is a dict with the `id`, `title`, `name`, `url`, `created`,
+    `modified`, `author` and `excerpt_html` of a post, but not its content.
+
+    :param q: the words to search for, in the title (which counts most) or
+        the content of the posts
+    :param limit: the maximum number of posts to return (default:
+        ``ckanext.sweden.blog.posts_per_page``, at most 100)
+    :param offset: the number of posts to skip (default: 0)
+    '''
+    toolkit.check_access('blog_post_search', context, data_dict)
+
+    from ckanext.sweden.blog.model import post as post_model
+
+    q = (data_dict.get('q') or u'').strip()
+    if not q:
+        raise toolkit.ValidationError({'q': [toolkit._('Missing value')]})
+    limit = _limit_param(data_dict)
+    offset = _int_param(data_dict, 'offset', 0)
+
+    query = model.Session.query(post_model.Post).\
+        filter(post_model.Post.visible == True)
+    posts, count = post_model.search(query, q, limit=limit, offset=offset)
+
+    return {
+        'count': count,
+        'results': [_post_dict(post, LIST_FIELDS) for post in posts],
+    }
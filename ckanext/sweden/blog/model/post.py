@@ -1,10 +1,14 @@
 import uuid
 
 from datetime import datetime
-from sqlalchemy import Column, MetaData
+from sqlalchemy import Column, Index, MetaData, func, inspect, tuple_
 from sqlalchemy import types
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import deferred, load_only, relationship
 from slugify import slugify
+from webhelpers.markdown import markdown
+from webhelpers.text import truncate
 
 import ckan.model as model
 
@@ -12,6 +16,19 @@ log = __import__('logging').getLogger(__name__)
 
 Base = declarative_base()
 
+# The length of the markdown source of the post excerpts
+EXCERPT_LENGTH = 320
+
+CURSOR_DATE_FORMATS = ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S')
+
+# The text search configurations the posts are indexed with. Posts are
+# mostly in Swedish, with some in English.
+SEARCH_CONFIGS = ('swedish', 'english')
+
+# The columns loaded for search results, which leave out the post bodies
+SEARCH_RESULT_COLUMNS = ('id', 'title', 'url', 'created', 'user_id',
+                         'visible', 'excerpt_html', 'modified')
+
 
 def make_uuid():
     return unicode(uuid.uuid4())
@@ -23,6 +40,12 @@ class Post(Base):
     """
     """
     __tablename__ = 'blog_post'
+    __table_args__ = (
+        # The lists of posts are paginated on (created, id) for visible posts
+        Index('idx_blog_post_visible_created', 'visible', 'created'),
+        Index('idx_blog_post_search_vector', 'search_vector',
+              postgresql_using='gin'),
+    )
 
     id = Column(types.UnicodeText, primary_key=True, default=make_uuid)
     title = Column(types.UnicodeText, nullable=False)
@@ -31,6 +54,20 @@ class Post(Base):
     created = Column(types.DateTime, default=datetime.now)
     user_id = Column(types.UnicodeText, nullable=False, index=True)
     visible = Column(types.Boolean, default=False)
+    content_html = Column(types.UnicodeText)
+    excerpt_html = Column(types.UnicodeText)
+    modified = Column(types.DateTime, default=datetime.now,
+                      onupdate=datetime.now)
+    # Only used in the WHERE clause of searches, so never loaded
+    search_vector = deferred(Column(TSVECTOR))
+
+    # The user table is not in this metadata, so there is no foreign key
+    # and the join has to be spelled out. The author is loaded in the same
+    # query as the posts.
+    author = relationship(model.User,
+                          primaryjoin=lambda: Post.user_id == model.User.id,
+                          foreign_keys=lambda: [Post.user_id],
+                          viewonly=True, lazy='joined')
 
     def __init__(self, title, content, user):
         self.user_id = user
@@ -38,6 +75,24 @@ class Post(Base):
         self.content = content
         self.url = slugify(title)
         self.visible = True
+        self.render()
+
+    def render(self):
+        '''Render the markdown content of the post, and an excerpt of it, to
+        HTML, and update its search vector. Call this whenever the title or
+        content changes.'''
+        self.content_html = markdown(self.content)
+        self.excerpt_html = markdown(unicode(truncate(
+            self.content, length=EXCERPT_LENGTH, indicator='...',
+            whole_word=True)))
+        # Computed by PostgreSQL when the post is flushed
+        self.search_vector = search_vector(self.title, self.content)
+
+    @property
+    def last_modified(self):
+        '''When the post was last edited (or created, for posts created
+        before edits were recorded).'''
+        return self.modified or self.created
 
     @classmethod
     def get(cls, id):
@@ -52,5 +107,141 @@ class Post(Base):
                                                 self.visible)
 
 
+def get_version():
+    '''
+    Return the number of visible posts and the last time one of them was
+    created or edited, as a (count, last_modified) pair. It changes whenever
+    a post is added, edited or removed.
+    '''
+    return model.Session.query(
+        func.count(Post.id),
+        func.max(func.coalesce(Post.modified, Post.created))).\
+        filter(Post.visible == True).one()
+
+
+def search_vector(title, content):
+    '''Return the SQL expression of the text search vector of a post, with
+    the words of the title weighted above the ones of the content.'''
+    vector = None
+    for weight, text in (('A', title), ('B', content)):
+        for search_config in SEARCH_CONFIGS:
+            part = func.setweight(
+                func.to_tsvector(search_config, func.coalesce(text, u'')),
+                weight)
+            vector = part if vector is None else vector.op('||')(part)
+    return vector
+
+
+def search_query(text):
+    '''Return the SQL expression of the text search query of the words in
+    `text`, matching them in any of the search configurations.'''
+    query = None
+    for search_config in SEARCH_CONFIGS:
+        part = func.plainto_tsquery(search_config, text)
+        query = part if query is None else query.op('||')(part)
+    return query
+
+
+def search(q, text, limit=20, offset=0):
+    '''
+    Return the posts of query `q` matching the words in `text`, best match
+    first, as a (posts, count) pair where `count` is the total number of
+    matching posts.
+
+    Only the columns in `SEARCH_RESULT_COLUMNS` of the posts are loaded.
+    '''
+    query = search_query(text)
+    q = q.filter(Post.search_vector.op('@@')(query))
+    count = q.with_entities(func.count(Post.id)).scalar()
+    if not count:
+        return [], 0
+    posts = q.options(load_only(*SEARCH_RESULT_COLUMNS)).\
+        order_by(func.ts_rank_cd(Post.search_vector, query).desc(),
+                 Post.created.desc(), Post.id.desc()).\
+        offset(offset).limit(limit).all()
+    return posts, count
+
+
+def get_cursor(post):
+    '''Return the pagination cursor of a post, from its (created, id).'''
+    return u'{0},{1}'.format(post.created.isoformat(), post.id)
+
+
+def parse_cursor(cursor):
+    '''Return the (created, id) pair of a pagination cursor. Raises
+    ValueError if the cursor is not valid.'''
+    created, sep, post_id = cursor.partition(',')
+    if not sep or not post_id:
+        raise ValueError('Invalid cursor: {0}'.format(cursor))
+    for date_format in CURSOR_DATE_FORMATS:
+        try:
+            return datetime.strptime(created, date_format), post_id
+        except ValueError:
+            pass
+    raise ValueError('Invalid cursor: {0}'.format(cursor))
+
+
+def get_page(q, before=None, after=None, limit=20):
+    '''
+    Return a page of the posts of query `q`, newest first, with keyset
+    pagination on (created, id), as a (posts, newer, older) tuple.
+
+    `before` and `after` are cursors returned by `get_cursor`: only the
+    posts older than `before` or newer than `after` are returned. `newer` and
+    `older` are the cursors to pass as `after` and `before` to get the
+    adjacent pages, or None if there are no posts in that direction.
+    '''
+    key = tuple_(Post.created, Post.id)
+    if after:
+        posts = q.filter(key > tuple_(*parse_cursor(after))).\
+            order_by(Post.created, Post.id).\
+            limit(limit + 1).all()
+        if posts:
+            newer = get_cursor(posts[limit - 1]) \
+                if len(posts) > limit else None
+            posts = list(reversed(posts[:limit]))
+            return posts, newer, get_cursor(posts[-1])
+        # There are no newer posts any more, show the first page
+        before = None
+
+    if before:
+        q = q.filter(key < tuple_(*parse_cursor(before)))
+    posts = q.order_by(Post.created.desc(), Post.id.desc()).\
+        limit(limit + 1).all()
+    older = get_cursor(posts[limit - 1]) if len(posts) > limit else None
+    posts = posts[:limit]
+    newer = get_cursor(posts[0]) if before and posts else None
+    return posts, newer, older
+
+
+def render_all():
+    '''Store the rendered HTML and search vector of the posts that don't
+    have them yet, e.g. the ones created by older versions. Returns the
+    number of posts rendered.'''
+    posts = model.Session.query(Post).filter(
+        Post.content_html.is_(None) | Post.search_vector.is_(None)).all()
+    for post in posts:
+        post.render()
+    model.Session.commit()
+    return len(posts)
+
+
 def init_tables(e):
     Base.metadata.create_all(e)
+
+    # Add the columns missing from tables created by older versions
+    columns = [column['name'] for column in
+               inspect(e).get_columns(Post.__tablename__)]
+    new_columns = [('content_html', 'text'), ('excerpt_html', 'text'),
+                   ('modified', 'timestamp without time zone'),
+                   ('search_vector', 'tsvector')]
+    for column, column_type in new_columns:
+        if column not in columns:
+            e.execute('ALTER TABLE blog_post ADD COLUMN {0} {1}'.format(
+                column, column_type))
+
+    indexes = [index['name'] for index in
+               inspect(e).get_indexes(Post.__tablename__)]
+    for index in Post.__table__.indexes:
+        if index.name not in indexes:
+            index.create(e)
@@ -1,13 +1,15 @@
 from logging import getLogger
 
 import ckan.plugins as p
-from webhelpers.markdown import markdown
-from webhelpers.text import truncate
 from ckan import model
 from ckan.model import Session
+from sqlalchemy import event
 from sqlalchemy.orm.exc import NoResultFound
 
-from ckanext.sweden.blog.authorize import blog_admin
+from ckanext.sweden.blog import authorize
+from ckanext.sweden.blog.logic import actions
+from ckanext.sweden.cache import after_commit_listener
+from ckanext.sweden.theme import fragmentcache
 
 log = getLogger(__name__)
 
@@ -24,7 +26,7 @@ def latest_post():
         from ckanext.sweden.blog.model.post import Post
         post = Session.query(Post).\
             filter(Post.visible == True).\
-            order_by('created desc').\
+            order_by(Post.created.desc()).\
             first()
     except NoResultFound:
         return None
@@ -32,35 +34,54 @@ def latest_post():
     if post is None:
         return None
 
-    post.content_markdown = markdown(
-        unicode(truncate(post.content, length=320, indicator='...',
-                         whole_word=True)))
-    post.post_author = (model.User.get(post.user_id)
-                        or Session.query(model.User).filter_by(
-                        id=post.user_id).first())
+    post.content_markdown = post.excerpt_html
+    post.post_author = post.author
 
     return post
 
 
+def _invalidate_posts():
+    '''Remove the cached template fragments showing blog posts.'''
+    fragmentcache.invalidate_tags('blog')
+
+
+_post_changed = after_commit_listener(_invalidate_posts)
+
+
 class BlogPlugin(p.SingletonPlugin):
     """This extension adds blogging functionality to ckan
 
-    This extension implements four interfaces
+    This extension implements these interfaces
 
       - ``IConfigurer`` allows to modify the configuration
       - ``IConfigurable`` get the configuration
       - ``IAuthFunctions`` to add custom authorization
+      - ``IActions`` to add the blog API actions
+      - ``ITemplateHelpers`` to add the ``latest_post`` helper
       - ``IRoutes`` to add custom routes
+      - ``IMiddleware`` to add the ``{% cache %}`` template tag
     """
     p.implements(p.IConfigurer, inherit=True)
     p.implements(p.IConfigurable, inherit=True)
     p.implements(p.IAuthFunctions, inherit=True)
+    p.implements(p.IActions)
     p.implements(p.ITemplateHelpers, inherit=False)
     p.implements(p.IRoutes, inherit=True)
+    p.implements(p.IMiddleware, inherit=True)
 
     def get_auth_functions(self):
         return {
-            'blog_admin': blog_admin
+            'blog_admin': authorize.blog_admin,
+            'blog_post_list': authorize.blog_post_list,
+            'blog_post_show': authorize.blog_post_show,
+            'blog_post_search': authorize.blog_post_search,
+        }
+
+    def get_actions(self):
+        return {
+            'blog_post_list': actions.blog_post_list,
+            'blog_post_show': actions.blog_post_show,
+            'blog_post_search': actions.blog_post_search,
         }
 
     def get_helpers(self):
@@ -71,6 +92,14 @@ class BlogPlugin(p.SingletonPlugin):
         map.connect('news', '/news', controller=blog_controller, action='index')
         map.connect('news_feed', '/news.rss', controller=blog_controller,
                     action='feed')
+        map.connect('news_feed_atom', '/news.atom',
+                    controller=blog_controller, action='feed', format='atom')
+        map.connect('news_feed_json', '/news.json',
+                    controller=blog_controller, action='feed', format='json')
+        map.connect('news_api_posts', '/news/api/posts',
+                    controller=blog_controller, action='api_list')
+        map.connect('news_api_post', '/news/api/posts/{title}',
+                    controller=blog_controller, action='api_show')
         map.connect('blog_admin', '/blog/admin/create',
                     controller=blog_controller, action='admin')
         map.connect('blog_admin_list', '/blog/admin',
@@ -91,3 +120,20 @@ class BlogPlugin(p.SingletonPlugin):
         '''
         p.toolkit.add_template_directory(config, 'templates')
         p.toolkit.add_resource('fanstatic', 'blog')
+
+    def configure(self, config):
+        from ckanext.sweden.blog.model.post import Post
+
+        for identifier in ('after_insert', 'after_update', 'after_delete'):
+            if not event.contains(Post, identifier, _post_changed):
+                event.listen(Post, identifier, _post_changed)
+            # The blogadmins group and its members
+            for mapped in (model.Member, model.Group):
+                if not event.contains(mapped, identifier,
+                                      authorize.blog_admins_changed):
+                    event.listen(mapped, identifier,
+                                 authorize.blog_admins_changed)
+
+    def make_middleware(self, app, config):
+        fragmentcache.install(config)
+        return app
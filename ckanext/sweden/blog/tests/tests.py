@@ -73,10 +73,21 @@ class FunctionalTestBaseClass(object):
 
     def setup(self):
         import ckan.model as model
+        # Make a copy of the config, so the changes made by a test (e.g. to
+        # the number of posts per page) are undone before the next one.
+        self.test_config = config.copy()
         model.Session.close_all()
         model.repo.rebuild_db()
         _initialise_blog_post_db_table()
         _reset_blog_post_db_table()
+        # rebuild_db() doesn't go through the ORM, so nothing has told the
+        # cache that the blogadmins are gone.
+        from ckanext.sweden.blog.authorize import invalidate_blog_admins
+        invalidate_blog_admins()
+
+    def teardown(self):
+        config.clear()
+        config.update(self.test_config)
 
     @classmethod
     def teardown_class(cls):
@@ -523,3 +534,700 @@ class TestBlog(FunctionalTestBaseClass):
         # Check that the blog post's page is still there.
         url = toolkit.url_for('news_post', title=slug)
         self.app.get(url, status=200)
+
+    def test_blog_post_html_is_stored(self):
+        '''The HTML of a post is rendered when it's created and edited.'''
+        import ckan.model as model
+        from ckanext.sweden.blog.model.post import Post
+        sysadmin = custom_factories.Sysadmin()
+        extra_environ = {'REMOTE_USER': str(sysadmin['name'])}
+        self._create_blog_post(content='Some **bold** text',
+                               extra_environ=extra_environ)
+
+        post = model.Session.query(Post).one()
+        assert '<strong>bold</strong>' in post.content_html
+        assert '<strong>bold</strong>' in post.excerpt_html
+
+        url = toolkit.url_for('blog_admin_edit', title='test-blog-post')
+        response = self.app.get(url, extra_environ=extra_environ)
+        form = response.forms[1]
+        form['content'] = 'Some *italic* text'
+        form.submit(extra_environ=extra_environ)
+
+        model.Session.remove()
+        post = model.Session.query(Post).one()
+        assert '<em>italic</em>' in post.content_html
+        assert '<em>italic</em>' in post.excerpt_html
+
+    def test_render_all(self):
+        '''render_all() renders the posts without stored HTML.'''
+        import ckan.model as model
+        from ckanext.sweden.blog.model import post as post_model
+        sysadmin = custom_factories.Sysadmin()
+        extra_environ = {'REMOTE_USER': str(sysadmin['name'])}
+        self._create_blog_post(content='Some **bold** text',
+                               extra_environ=extra_environ)
+        post = model.Session.query(post_model.Post).one()
+        post.content_html = None
+        post.excerpt_html = None
+        model.Session.commit()
+
+        assert post_model.render_all() == 1
+
+        post = model.Session.query(post_model.Post).one()
+        assert '<strong>bold</strong>' in post.content_html
+        assert post_model.render_all() == 0
+
+
+class TestPostPagination(FunctionalTestBaseClass):
+
+    def _create_posts(self, count):
+        import datetime
+        import ckan.model as model
+        from ckanext.sweden.blog.model.post import Post
+        created = datetime.datetime(2015, 1, 1)
+        for i in range(count):
+            post = Post('Post {0}'.format(i), 'Content', 'user-id')
+            # Two posts per timestamp, to test the tie breaking on id
+            post.created = created + datetime.timedelta(days=i / 2)
+            model.Session.add(post)
+        model.Session.commit()
+
+    def _titles(self, posts):
+        return [post.title for post in posts]
+
+    def test_get_page(self):
+        import ckan.model as model
+        from ckanext.sweden.blog.model import post as post_model
+        self._create_posts(5)
+        q = model.Session.query(post_model.Post)
+        all_posts = self._titles(q.order_by(post_model.Post.created.desc(),
+                                            post_model.Post.id.desc()))
+
+        posts, newer, older = post_model.get_page(q, limit=2)
+        assert self._titles(posts) == all_posts[0:2]
+        assert newer is None
+
+        posts, newer, older = post_model.get_page(q, before=older, limit=2)
+        assert self._titles(posts) == all_posts[2:4]
+
+        posts, last_newer, last_older = post_model.get_page(
+            q, before=older, limit=2)
+        assert self._titles(posts) == all_posts[4:]
+        assert last_older is None
+
+        # And back
+        posts, newer, older = post_model.get_page(q, after=newer, limit=2)
+        assert self._titles(posts) == all_posts[0:2]
+        assert newer is None
+
+    def test_news_pages(self):
+        import ckan.model as model
+        from ckanext.sweden.blog.model.post import Post
+        config['ckanext.sweden.blog.posts_per_page'] = 2
+        self._create_posts(3)
+        oldest = model.Session.query(Post).order_by(Post.created,
+                                                    Post.id).first()
+
+        response = self.app.get(toolkit.url_for('news'))
+        assert oldest.title not in response.html.text
+        assert 'Newer posts' not in response.html.text
+
+        response = response.click('Older posts')
+        assert oldest.title in response.html.text
+        assert 'Older posts' not in response.html.text
+        assert 'Newer posts' in response.html.text
+
+    def test_invalid_cursor(self):
+        self.app.get(toolkit.url_for('news'), params={'before': 'foo'},
+                     status=400)
+
+
+class TestConditionalGet(FunctionalTestBaseClass):
+
+    def _create_posts(self, count):
+        import ckan.model as model
+        from ckanext.sweden.blog.model.post import Post
+        for i in range(count):
+            model.Session.add(Post('Post {0}'.format(i), 'Content', 'user'))
+        model.Session.commit()
+
+    def test_feed_not_modified(self):
+        self._create_posts(1)
+        url = toolkit.url_for('news_feed')
+
+        response = self.app.get(url)
+        etag = response.headers['ETag']
+        assert 'Last-Modified' in response.headers
+
+        response = self.app.get(url, headers={'If-None-Match': etag},
+                                status=304)
+        assert response.body == ''
+
+    def test_feed_modified_by_new_post(self):
+        self._create_posts(1)
+        url = toolkit.url_for('news_feed')
+        etag = self.app.get(url).headers['ETag']
+
+        self._create_posts(1)
+
+        self.app.get(url, headers={'If-None-Match': etag}, status=200)
+
+    def test_post_page_modified_by_edit(self):
+        import ckan.model as model
+        from ckanext.sweden.blog.model.post import Post
+        self._create_posts(1)
+        url = toolkit.url_for('news_post', title='post-0')
+        etag = self.app.get(url).headers['ETag']
+        self.app.get(url, headers={'If-None-Match': etag}, status=304)
+
+        post = model.Session.query(Post).one()
+        post.content = 'Updated content'
+        post.render()
+        model.Session.commit()
+
+        response = self.app.get(url, headers={'If-None-Match': etag})
+        assert 'Updated content' in response.body
+
+    def test_news_not_modified(self):
+        self._create_posts(1)
+        url = toolkit.url_for('news')
+        etag = self.app.get(url).headers['ETag']
+
+        self.app.get(url, headers={'If-None-Match': etag}, status=304)
+
+    def test_feed_items_limit(self):
+        config['ckanext.sweden.blog.feed_items'] = 2
+        self._create_posts(3)
+
+        response = self.app.get(toolkit.url_for('news_feed'))
+
+        assert response.body.count('<item>') == 2
+
+    def test_feed_cache_keeps_current_version(self):
+        from ckanext.sweden.blog.controllers import blog
+        blog._feed_cache.invalidate()
+        self._create_posts(1)
+        self.app.get(toolkit.url_for('news_feed'))
+        self._create_posts(1)
+
+        response = self.app.get(toolkit.url_for('news_feed'))
+
+        assert response.body.count('<item>') == 2
+        assert len(blog._feed_cache._entries) == 1
+
+    def test_atom_and_json_feeds(self):
+        import json
+        self._create_posts(2)
+
+        response = self.app.get(toolkit.url_for('news_feed_atom'))
+        assert response.content_type == 'application/atom+xml'
+        assert response.body.count('<entry>') == 2
+
+        response = self.app.get(toolkit.url_for('news_feed_json'))
+        assert response.content_type == 'application/json'
+        feed = json.loads(response.body)
+        assert len(feed['items']) == 2
+        assert feed['items'][0]['content_html']
+
+
+class TestAuthorLoading(FunctionalTestBaseClass):
+    '''The blog views should load the posts and their authors in a constant
+    number of queries, whatever the number of posts.'''
+
+    def _create_posts(self, count):
+        import ckan.model as model
+        from ckanext.sweden.blog.model.post import Post
+        for i in range(count):
+            author = factories.User()
+            model.Session.add(Post('Post {0}'.format(i), 'Content',
+                                   author['id']))
+        model.Session.commit()
+
+    def _statements(self, url, **kwargs):
+        '''Return the SQL statements run while requesting `url`.'''
+        import sqlalchemy
+        import ckan.model as model
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        sqlalchemy.event.listen(model.meta.engine, 'before_cursor_execute',
+                                before_cursor_execute)
+        try:
+            self.app.get(url, **kwargs)
+        finally:
+            sqlalchemy.event.remove(model.meta.engine,
+                                    'before_cursor_execute',
+                                    before_cursor_execute)
+        return statements
+
+    def _assert_constant_queries(self, url, **kwargs):
+        self._create_posts(1)
+        one_post = self._statements(url, **kwargs)
+
+        self._create_posts(4)
+        five_posts = self._statements(url, **kwargs)
+
+        assert len(one_post) == len(five_posts), (one_post, five_posts)
+        return five_posts
+
+    def _assert_authors_joined(self, statements, logged_in=False):
+        # The user table is only read for the authors, and that has to be
+        # done in the query for the posts. The logged in user, if any, is
+        # looked up by name.
+        for statement in statements:
+            if logged_in and '"user".name = ' in statement:
+                continue
+            if 'FROM "user"' in statement or 'JOIN "user"' in statement:
+                assert 'blog_post' in statement, statement
+
+    def test_index(self):
+        statements = self._assert_constant_queries(toolkit.url_for('news'))
+        self._assert_authors_joined(statements)
+
+    def test_feed(self):
+        for route in ('news_feed', 'news_feed_atom', 'news_feed_json'):
+            _reset_blog_post_db_table()
+            statements = self._assert_constant_queries(toolkit.url_for(route))
+            self._assert_authors_joined(statements)
+
+    def test_admin_list(self):
+        sysadmin = custom_factories.Sysadmin()
+        extra_environ = {'REMOTE_USER': str(sysadmin['name'])}
+
+        statements = self._assert_constant_queries(
+            toolkit.url_for('blog_admin_list'), extra_environ=extra_environ)
+        self._assert_authors_joined(statements, logged_in=True)
+
+    def test_post_page(self):
+        self._create_posts(1)
+        url = toolkit.url_for('news_post', title='post-0')
+
+        self._assert_authors_joined(self._statements(url))
+        assert 'Mr. Test User' in self.app.get(url).body
+
+
+class TestHomepage(FunctionalTestBaseClass):
+    '''The homepage, with the news snippets of the theme plugin.'''
+
+    @classmethod
+    def setup_class(cls):
+        original_config = config.copy()
+        _load_plugin('sweden_theme')
+        super(TestHomepage, cls).setup_class()
+        cls.original_config = original_config
+
+    def test_homepage_with_published_posts(self):
+        import datetime
+        import ckan.model as model
+        from ckanext.sweden.blog.model.post import Post
+        author = factories.User()
+        for i in range(4):
+            post = Post('Published post {0}'.format(i), 'Content',
+                        author['id'])
+            post.created = datetime.datetime(2014, 1, i + 1)
+            model.Session.add(post)
+        model.Session.commit()
+
+        response = self.app.get('/')
+
+        assert 'Published post 3' in response.body
+        assert 'Published post 0' not in response.body
+
+
+class TestBlogAdmins(FunctionalTestBaseClass):
+
+    def _is_blog_admin(self, user):
+        try:
+            toolkit.check_access('blog_admin', {'user': user['name']})
+            return True
+        except toolkit.NotAuthorized:
+            return False
+
+    def _add_member(self, user, capacity='member'):
+        toolkit.get_action('member_create')(
+            {'ignore_auth': True, 'user': ''},
+            {'id': 'blogadmins', 'object': user['id'],
+             'object_type': 'user', 'capacity': capacity})
+
+    def test_no_blogadmins_group(self):
+        user = factories.User()
+
+        assert not self._is_blog_admin(user)
+
+    def test_member_of_blogadmins(self):
+        factories.Group(name='blogadmins')
+        user = factories.User()
+        other_user = factories.User()
+        self._add_member(user)
+
+        assert self._is_blog_admin(user)
+        assert not self._is_blog_admin(other_user)
+
+    def test_group_created_after_check(self):
+        user = factories.User()
+        assert not self._is_blog_admin(user)
+
+        factories.Group(name='blogadmins')
+        self._add_member(user)
+
+        assert self._is_blog_admin(user)
+
+    def test_member_added_and_removed(self):
+        factories.Group(name='blogadmins')
+        user = factories.User()
+        assert not self._is_blog_admin(user)
+
+        self._add_member(user)
+        assert self._is_blog_admin(user)
+
+        toolkit.get_action('member_delete')(
+            {'ignore_auth': True, 'user': ''},
+            {'id': 'blogadmins', 'object': user['id'], 'object_type': 'user'})
+        assert not self._is_blog_admin(user)
+
+    def test_cache_cleared_on_commit(self):
+        import ckan.model as model
+        from ckanext.sweden.blog import authorize
+        group = factories.Group(name='blogadmins')
+        user = factories.User()
+        assert not self._is_blog_admin(user)
+
+        model.repo.new_revision()
+        model.Session.add(model.Member(
+            group_id=group['id'], table_id=user['id'], table_name='user',
+            capacity='member', state='active'))
+        model.Session.flush()
+        assert authorize._blog_admins_cache.get('blogadmins') == frozenset()
+
+        model.Session.commit()
+        assert authorize._blog_admins_cache.get('blogadmins') is None
+        assert self._is_blog_admin(user)
+
+    def test_cached_check_does_not_query(self):
+        import sqlalchemy
+        import ckan.model as model
+        factories.Group(name='blogadmins')
+        user = factories.User()
+        self._add_member(user)
+        user_obj = model.User.get(user['id'])
+        context = {'user': user['name'], 'auth_user_obj': user_obj}
+        toolkit.check_access('blog_admin', dict(context))
+
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        sqlalchemy.event.listen(model.meta.engine, 'before_cursor_execute',
+                                before_cursor_execute)
+        try:
+            from ckanext.sweden.blog.authorize import blog_admin
+            result = blog_admin(dict(context))
+        finally:
+            sqlalchemy.event.remove(model.meta.engine,
+                                    'before_cursor_execute',
+                                    before_cursor_execute)
+
+        assert result['success']
+        assert statements == []
+
+
+class TestPostSearch(FunctionalTestBaseClass):
+
+    def _create_post(self, title, content, visible=True):
+        import ckan.model as model
+        from ckanext.sweden.blog.model.post import Post
+        post = Post(title, content, 'user')
+        post.visible = visible
+        model.Session.add(post)
+        model.Session.commit()
+
+    def test_title_ranked_above_content(self):
+        self._create_post('Nyheter om vatten', 'Inget om luft.')
+        self._create_post('Nyheter om luft', 'Luft och vatten i Sverige.')
+        self._create_post('Nyheter om skog', 'Inget om det.')
+
+        result = toolkit.get_action('blog_post_search')(
+            {}, {'q': 'vatten'})
+
+        assert result['count'] == 2
+        assert [post['name'] for post in result['results']] == [
+            'nyheter-om-vatten', 'nyheter-om-luft']
+
+    def test_english_posts(self):
+        self._create_post('Open data', 'Publishing datasets in Sweden.')
+
+        result = toolkit.get_action('blog_post_search')(
+            {}, {'q': 'published'})
+
+        assert result['count'] == 1
+
+    def test_hidden_posts_not_found(self):
+        self._create_post('Hemlig post', 'Hemlig.', visible=False)
+
+        result = toolkit.get_action('blog_post_search')({}, {'q': 'hemlig'})
+
+        assert result['count'] == 0
+
+    def test_results_without_content(self):
+        self._create_post('Nyheter', 'Innehall')
+
+        result = toolkit.get_action('blog_post_search')({}, {'q': 'nyheter'})
+
+        post = result['results'][0]
+        assert 'content' not in post
+        assert post['excerpt_html']
+
+    def test_pagination(self):
+        for i in range(3):
+            self._create_post('Nyheter {0}'.format(i), 'Innehall')
+
+        result = toolkit.get_action('blog_post_search')(
+            {}, {'q': 'nyheter', 'limit': 2, 'offset': 2})
+
+        assert result['count'] == 3
+        assert len(result['results']) == 1
+
+    def test_missing_query(self):
+        import nose.tools
+        nose.tools.assert_raises(
+            toolkit.ValidationError, toolkit.get_action('blog_post_search'),
+            {}, {'q': ''})
+
+    def test_news_search_page(self):
+        config['ckanext.sweden.blog.posts_per_page'] = 1
+        self._create_post('Nyheter om vatten', 'Vatten')
+        self._create_post('Mer om vatten', 'Vatten')
+        self._create_post('Nyheter om skog', 'Skog')
+
+        response = self.app.get(toolkit.url_for('news', q='vatten'))
+
+        assert '2 posts found' in response.body
+        assert 'Nyheter om skog' not in response.body
+        assert 'page=2' in response.body
+
+    def test_post_search_vector_is_updated(self):
+        import ckan.model as model
+        from ckanext.sweden.blog.model.post import Post
+        self._create_post('Nyheter', 'Vatten')
+        post = model.Session.query(Post).one()
+        post.content = 'Skog'
+        post.render()
+        model.Session.commit()
+
+        search = toolkit.get_action('blog_post_search')
+        assert search({}, {'q': 'vatten'})['count'] == 0
+        assert search({}, {'q': 'skog'})['count'] == 1
+
+
+class TestPostAPI(FunctionalTestBaseClass):
+
+    def _create_posts(self, count):
+        import ckan.model as model
+        from ckanext.sweden.blog.model.post import Post
+        for i in range(count):
+            model.Session.add(Post('Post {0}'.format(i), 'Content', 'user'))
+        model.Session.commit()
+
+    def test_list_fields(self):
+        self._create_posts(2)
+
+        result = toolkit.get_action('blog_post_list')(
+            {}, {'fields': 'title,url'})
+
+        assert len(result['results']) == 2
+        for post in result['results']:
+            assert sorted(post.keys()) == ['title', 'url']
+
+    def test_list_default_fields(self):
+        self._create_posts(1)
+
+        result = toolkit.get_action('blog_post_list')({}, {})
+
+        post = result['results'][0]
+        assert post['name'] == 'post-0'
+        assert post['excerpt_html']
+        assert 'content' not in post
+
+    def test_list_pagination(self):
+        import ckan.model as model
+        from ckanext.sweden.blog.model.post import Post
+        self._create_posts(3)
+        # Make sure the posts are created in order
+        for i, post in enumerate(model.Session.query(Post).order_by(Post.url)):
+            post.created = post.created.replace(year=2000 + i)
+        model.Session.commit()
+        list_posts = toolkit.get_action('blog_post_list')
+
+        first = list_posts({}, {'fields': ['name'], 'limit': 2})
+        assert [post['name'] for post in first['results']] == [
+            'post-2', 'post-1']
+        assert first['newer'] is None
+
+        second = list_posts({}, {'fields': ['name'], 'limit': 2,
+                                 'before': first['older']})
+        assert [post['name'] for post in second['results']] == ['post-0']
+        assert second['older'] is None
+
+    def test_unknown_field(self):
+        import nose.tools
+        nose.tools.assert_raises(
+            toolkit.ValidationError, toolkit.get_action('blog_post_list'),
+            {}, {'fields': 'title,password'})
+
+    def test_show(self):
+        self._create_posts(1)
+
+        post = toolkit.get_action('blog_post_show')({}, {'id': 'post-0'})
+
+        assert post['title'] == 'Post 0'
+        assert post['content'] == 'Content'
+
+    def test_show_hidden_post(self):
+        import nose.tools
+        import ckan.model as model
+        from ckanext.sweden.blog.model.post import Post
+        post = Post('Hidden', 'Content', 'user')
+        post.visible = False
+        model.Session.add(post)
+        model.Session.commit()
+
+        nose.tools.assert_raises(
+            toolkit.ObjectNotFound, toolkit.get_action('blog_post_show'),
+            {}, {'id': 'hidden'})
+
+    def test_list_route_not_modified(self):
+        import json
+        self._create_posts(2)
+        url = toolkit.url_for('news_api_posts', fields='title')
+
+        response = self.app.get(url)
+        assert response.content_type == 'application/json'
+        assert len(json.loads(response.body)['results']) == 2
+        etag = response.headers['ETag']
+
+        self.app.get(url, headers={'If-None-Match': etag}, status=304)
+
+        self._create_posts(1)
+        self.app.get(url, headers={'If-None-Match': etag}, status=200)
+
+    def test_show_route_not_modified(self):
+        import json
+        self._create_posts(1)
+        url = toolkit.url_for('news_api_post', title='post-0')
+
+        response = self.app.get(url)
+        assert json.loads(response.body)['title'] == 'Post 0'
+        etag = response.headers['ETag']
+
+        self.app.get(url, headers={'If-None-Match': etag}, status=304)
+
+    def test_show_route_not_found(self):
+        self.app.get(toolkit.url_for('news_api_post', title='missing'),
+                     status=404)
+
+    def test_list_route_invalid_params(self):
+        response = self.app.get(
+            toolkit.url_for('news_api_posts', fields='password'), status=400)
+        assert 'ETag' not in response.headers
+
+
+class TestNewsExport(FunctionalTestBaseClass):
+
+    def setup(self):
+        import tempfile
+        super(TestNewsExport, self).setup()
+        self.export_dir = tempfile.mkdtemp()
+
+    def teardown(self):
+        import shutil
+        shutil.rmtree(self.export_dir)
+        super(TestNewsExport, self).teardown()
+
+    def _exporter(self):
+        from ckanext.sweden.blog.export import NewsExporter
+        return NewsExporter(self.export_dir,
+                            fetch=lambda path: self.app.get(path).body)
+
+    def _create_post(self, title, year):
+        import datetime
+        import ckan.model as model
+        from ckanext.sweden.blog.model.post import Post
+        post = Post(title, 'Content of {0}'.format(title), 'user')
+        post.created = post.modified = datetime.datetime(year, 1, 1)
+        model.Session.add(post)
+        model.Session.commit()
+        return post
+
+    def _read(self, *path):
+        import os
+        with open(os.path.join(self.export_dir, *path)) as f:
+            return f.read()
+
+    def test_export_all(self):
+        import gzip
+        import os
+        self._create_post('First post', 2014)
+
+        written, removed = self._exporter().export_all()
+
+        assert (written, removed) == (5, 0)
+        assert 'Content of First post' in self._read('news', 'first-post.html')
+        assert 'First post' in self._read('news.html')
+        assert '<item>' in self._read('news.rss')
+        gz = gzip.open(os.path.join(self.export_dir, 'news.rss.gz'))
+        assert gz.read() == self._read('news.rss')
+
+    def test_export_is_incremental(self):
+        import datetime
+        import ckan.model as model
+        self._create_post('Old post', 2013)
+        post = self._create_post('New post', 2014)
+        exporter = self._exporter()
+        exporter.export_all()
+
+        assert exporter.export_all() == (0, 0)
+
+        post = model.Session.merge(post)
+        post.content = 'Updated content'
+        post.render()
+        model.Session.commit()
+        post.modified = datetime.datetime.now() + datetime.timedelta(days=1)
+        model.Session.commit()
+
+        # The post, the news page and the three feeds
+        assert exporter.export_all() == (5, 0)
+        assert 'Updated content' in self._read('news', 'new-post.html')
+
+    def test_deleted_post_is_removed(self):
+        import os
+        import ckan.model as model
+        post = self._create_post('Old post', 2013)
+        exporter = self._exporter()
+        exporter.export_all()
+
+        model.Session.delete(model.Session.merge(post))
+        model.Session.commit()
+
+        written, removed = exporter.export_all()
+        assert removed == 1
+        assert not os.path.exists(
+            os.path.join(self.export_dir, 'news', 'old-post.html'))
+        assert 'Old post' not in self._read('news.html')
+
+    def test_listing_paths(self):
+        from ckanext.sweden.blog.export import listing_paths
+        config['ckanext.sweden.blog.posts_per_page'] = 1
+        config['ckanext.sweden.blog.feed_items'] = 2
+        old = self._create_post('Old post', 2012)
+        self._create_post('Newer post', 2013)
+        self._create_post('Newest post', 2014)
+
+        assert listing_paths(old.created, old.id) == []
+
+        config['ckanext.sweden.blog.feed_items'] = 3
+        assert listing_paths(old.created, old.id) == [
+            '/news.rss', '/news.atom', '/news.json']
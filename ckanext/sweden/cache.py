@@ -0,0 +1,97 @@
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+# The key of the callbacks to call after the transaction is committed, in
+# the `info` dict of the session
+_AFTER_COMMIT_KEY = 'ckanext.sweden.after_commit'
+
+
+class TTLCache(object):
+    '''A small thread safe in-process cache.
+
+    Entries expire `ttl` seconds after being set. The cache is local to each
+    CKAN process, so it should only hold data that can be a bit out of date
+    in other processes until it expires.
+    '''
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires, value = entry
+            if expires < time.time():
+                del self._entries[key]
+                return default
+            return value
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.ttl
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+
+    def get_or_set(self, key, create, ttl=None):
+        '''Return the value for `key`, calling `create()` to set it if it is
+        missing or has expired.'''
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = create()
+            self.set(key, value, ttl=ttl)
+        return value
+
+    def invalidate(self, key=None):
+        '''Remove `key` from the cache, or all the entries if no key is
+        given.'''
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+
+def call_after_commit(session, callback):
+    '''
+    Call `callback()` once the current transaction of `session` is committed,
+    so caches are only cleared once the changes can be read by other requests
+    (and, for datasets, have been indexed). Each callback is called once per
+    transaction however many times it was added. If `session` is None the
+    callback is called straight away.
+
+    The callbacks of a transaction that is rolled back are called after the
+    next commit of the same session, if any, which only clears the caches
+    once more than needed.
+    '''
+    if session is None:
+        callback()
+        return
+    if not event.contains(Session, 'after_commit', _after_commit):
+        event.listen(Session, 'after_commit', _after_commit)
+    callbacks = session.info.setdefault(_AFTER_COMMIT_KEY, [])
+    if callback not in callbacks:
+        callbacks.append(callback)
+
+
+def after_commit_listener(callback):
+    '''Return a mapper event listener that calls `callback()` after the
+    session of the changed object is committed.'''
+    def listener(mapper, connection, target):
+        call_after_commit(object_session(target), callback)
+    return listener
+
+
+def _after_commit(session):
+    if session.transaction is not None and session.transaction.nested:
+        # A savepoint was released, the changes are not committed yet
+        return
+    for callback in session.info.pop(_AFTER_COMMIT_KEY, []):
+        callback()
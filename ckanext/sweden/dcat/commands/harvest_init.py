@@ -0,0 +1,34 @@
+import logging
+
+from ckan.lib.cli import CkanCommand
+# No other CKAN imports allowed until _load_config is run,
+# or logging is disabled
+
+
+class InitDB(CkanCommand):
+    """Create the sweden_validation_cache table
+
+    Usage:
+
+      sweden_harvest_init
+        - Create the table the validation results are cached in
+    """
+    summary = __doc__.split('\n')[0]
+    usage = __doc__
+    max_args = 0
+    min_args = 0
+
+    def __init__(self, name):
+        super(InitDB, self).__init__(name)
+
+    def command(self):
+        self._load_config()
+        log = logging.getLogger(__name__)
+
+        import ckan.model as model
+        model.Session.remove()
+        model.Session.configure(bind=model.meta.engine)
+
+        from ckanext.sweden.dcat.model import validation as validation_model
+        validation_model.init_tables(model.meta.engine)
+        log.info('The sweden_validation_cache table is set up')
@@ -0,0 +1,88 @@
+import datetime
+import hashlib
+import json
+
+from sqlalchemy import Column
+from sqlalchemy import types
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.declarative import declarative_base
+
+import ckan.model as model
+
+log = __import__('logging').getLogger(__name__)
+
+Base = declarative_base()
+
+
+class ValidationResult(Base):
+    '''
+    What the validation service said about a remote DCAT document, keyed by
+    `cache_key`, so it doesn't have to be asked again while the document
+    doesn't change.
+
+    `errors` is a JSON list of the errors found, if any.
+    '''
+    __tablename__ = 'sweden_validation_cache'
+
+    key = Column(types.Unicode(64), primary_key=True)
+    valid = Column(types.Boolean, nullable=False)
+    errors = Column(types.UnicodeText, nullable=False)
+    created = Column(types.DateTime, nullable=False,
+                     default=datetime.datetime.utcnow)
+
+    def __repr__(self):
+        return u"<ValidationResult: %s, created:%s>" % (self.key,
+                                                        self.created)
+
+
+def cache_key(content, validation_service):
+    '''Return the SHA-256 hex digest of a document and the URL of the
+    validation service it is sent to.'''
+    if isinstance(content, unicode):
+        content = content.encode('utf-8')
+    if isinstance(validation_service, unicode):
+        validation_service = validation_service.encode('utf-8')
+    sha = hashlib.sha256()
+    sha.update(validation_service)
+    sha.update('\0')
+    sha.update(content)
+    return unicode(sha.hexdigest())
+
+
+# The validation cache is read and written with its own connections, so it
+# doesn't commit (or roll back) the objects of the harvest in the session.
+
+def get_result(key, ttl):
+    '''Return the cached (valid, errors) result for `key`, or None if there
+    is none newer than `ttl` seconds.'''
+    table = ValidationResult.__table__
+    since = datetime.datetime.utcnow() - datetime.timedelta(seconds=ttl)
+    row = model.meta.engine.execute(
+        table.select().
+        where(table.c.key == key).
+        where(table.c.created >= since)).first()
+    if row is None:
+        return None
+    return row.valid, json.loads(row.errors)
+
+
+def set_result(key, valid, errors, ttl):
+    '''Cache the (valid, errors) result for `key`, removing the expired
+    entries.'''
+    table = ValidationResult.__table__
+    now = datetime.datetime.utcnow()
+    try:
+        with model.meta.engine.begin() as connection:
+            connection.execute(table.delete().where(
+                (table.c.key == key) |
+                (table.c.created < now - datetime.timedelta(seconds=ttl))))
+            connection.execute(table.insert().values(
+                key=key, valid=valid, errors=json.dumps(errors),
+                created=now))
+    except IntegrityError:
+        # Another harvest job validated the same document in the meantime
+        log.debug('Validation result {0} already cached'.format(key))
+
+
+def init_tables(e):
+    Base.metadata.create_all(e)
@@ -1,17 +1,26 @@
 import json
+import logging
+
 import requests
 import rdflib
 
 from pylons import config
+from sqlalchemy.exc import SQLAlchemyError
 
 import ckan.plugins as p
 
 from ckanext.dcat.interfaces import IDCATRDFHarvester
 from ckanext.sweden.dcat import template_helpers
+from ckanext.sweden.dcat import validation_client
+from ckanext.sweden.dcat.model import validation as validation_model
 
+log = logging.getLogger(__name__)
 
 VALIDATION_SERVICE = 'https://sandbox.oppnadata.se/validator'
 
+# How long the validation results of a document are reused for, in seconds
+VALIDATION_CACHE_TTL = 7 * 24 * 60 * 60
+
 # Assume that remote files with this media types are RDF/XML
 rdflib.plugin.register(
     'application/octet-stream', rdflib.parser.Parser,
@@ -30,12 +39,52 @@ rdflib.plugin.register(
     'rdflib.plugins.parsers.rdfxml', 'RDFXMLParser')
 
 
+def _validation_result(response):
+    '''Return whether a response of the validation service is all clear,
+    and the list of errors in it, as a (valid, errors) pair.'''
+    if not any([response.get('rdfError'),
+                response.get('errors'),
+                response.get('warnings')]):
+        return True, []
+
+    errors = []
+    if response.get('rdfError'):
+        errors.append(response.get('rdfError'))
+    else:
+        if response.get('mandatoryError'):
+            for _class in response['mandatoryError']:
+                errors.append(p.toolkit._(
+                    'Mandatory class {0} missing'.format(_class)))
+
+        for resource in response.get('resources', []):
+            errors.append(json.dumps(resource))
+    return False, errors
+
+
 class SwedenDCATRDFHarvester(p.SingletonPlugin):
 
     p.implements(IDCATRDFHarvester, inherit=True)
     p.implements(p.IConfigurer)
+    p.implements(p.IConfigurable)
     p.implements(p.ITemplateHelpers)
 
+    def _get_cached_result(self, key, ttl):
+        '''Return the cached (valid, errors) validation result for `key`, or
+        None. Failures of the cache (e.g. if `sweden_harvest_init` hasn't
+        been run) are logged, and the document is then validated again.'''
+        try:
+            return validation_model.get_result(key, ttl)
+        except SQLAlchemyError, e:
+            log.warning('Could not read the validation cache: {0}'.format(e))
+            return None
+
+    def _set_cached_result(self, key, valid, errors, ttl):
+        try:
+            validation_model.set_result(key, valid, errors, ttl)
+        except SQLAlchemyError, e:
+            log.warning('Could not cache the validation result: {0}'.format(
+                e))
+
     def after_download(self, content, harvest_job):
 
         if not p.toolkit.asbool(config.get('ckanext.sweden.harvest.use_validation', True)):
@@ -45,9 +94,36 @@ class SwedenDCATRDFHarvester(p.SingletonPlugin):
 
         stop_on_errors = p.toolkit.asbool(config.get('ckanext.sweden.harvest.stop_on_validation_errors', False))
 
+        # Only the results of the validation service are cached, so
+        # documents are validated again after an error contacting it
+        cache_ttl = p.toolkit.asint(config.get('ckanext.sweden.harvest.validation_cache_ttl', VALIDATION_CACHE_TTL))
+        if cache_ttl > 0:
+            cache_key = validation_model.cache_key(content, validation_service)
+            result = self._get_cached_result(cache_key, cache_ttl)
+            if result is not None:
+                log.debug('Using the cached validation result {0}'.format(
+                    cache_key))
+                valid, errors = result
+                if not valid and stop_on_errors:
+                    return None, errors
+                return content, errors
+
         errors = []
         try:
-            r = requests.post(validation_service, data=content)
+            r = validation_client.get_client().post(validation_service,
+                                                    content)
+        except validation_client.CircuitOpenError, e:
+            # Don't wait for a service that is down, but say that the
+            # document wasn't validated
+            log.warning('Skipping validation: {0}'.format(e))
+            errors.append(p.toolkit._(
+                'The document was not validated, as the validation service '
+                'is not available: {0}'.format(e)))
+
+            if stop_on_errors:
+                return None, errors
+            else:
+                return content, errors
         except requests.exceptions.RequestException, e:
             errors.append(p.toolkit._(
                 'Error contacting the validation service: {0}'.format(str(e)))
@@ -70,25 +146,14 @@ class SwedenDCATRDFHarvester(p.SingletonPlugin):
                 return content, errors
 
         else:
-            response = r.json()
+            valid, errors = _validation_result(r.json())
+            if cache_ttl > 0:
+                self._set_cached_result(cache_key, valid, errors, cache_ttl)
 
-            if not any([response.get('rdfError'),
-                        response.get('errors'),
-                        response.get('warnings')]):
+            if valid:
                 # All clear
                 return content, []
 
-            if response.get('rdfError'):
-                errors.append(response.get('rdfError'))
-            else:
-                if response.get('mandatoryError'):
-                    for _class in response['mandatoryError']:
-                        errors.append(p.toolkit._(
-                            'Mandatory class {0} missing'.format(_class)))
-
-                for resource in response.get('resources', []):
-                    errors.append(json.dumps(resource))
-
             if stop_on_errors:
                 return None, errors
             else:
@@ -99,6 +164,10 @@ class SwedenDCATRDFHarvester(p.SingletonPlugin):
         p.toolkit.add_template_directory(config, 'templates')
         p.toolkit.add_resource('fanstatic', 'dcat')
 
+    # IConfigurable
+    def configure(self, config):
+        validation_client.configure_client(config)
+
     # ITemplateHelpers
     def get_helpers(self):
         return {
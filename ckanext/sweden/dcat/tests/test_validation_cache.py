@@ -0,0 +1,155 @@
+import BaseHTTPServer
+import json
+import threading
+
+import nose
+from pylons import config
+
+import ckan.model as model
+
+from ckanext.sweden.dcat import validation_client
+from ckanext.sweden.dcat.model import validation as validation_model
+from ckanext.sweden.dcat.plugin import SwedenDCATRDFHarvester
+
+eq_ = nose.tools.eq_
+
+
+class _ValidationService(BaseHTTPServer.HTTPServer):
+    '''A local validation service, answering `response` to every POST and
+    counting them. The first POSTs get the error `statuses` instead, if
+    any.'''
+
+    def __init__(self, response, statuses=()):
+        self.response = response
+        self.statuses = list(statuses)
+        self.requests = 0
+        BaseHTTPServer.HTTPServer.__init__(
+            self, ('127.0.0.1', 0), _ValidationHandler)
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{0}/validator'.format(self.server_port)
+
+
+class _ValidationHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.getheader('content-length', 0)))
+        self.server.requests += 1
+        if self.server.statuses:
+            self.send_response(self.server.statuses.pop(0))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = json.dumps(self.server.response)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ValidationServiceTestBase(object):
+    '''Set up the validation cache and config for the harvester, and start
+    local validation services with `_start_service`.'''
+
+    @classmethod
+    def setup_class(cls):
+        cls.original_config = config.copy()
+        validation_model.init_tables(model.meta.engine)
+
+    @classmethod
+    def teardown_class(cls):
+        config.clear()
+        config.update(cls.original_config)
+
+    def setup(self):
+        model.meta.engine.execute(
+            validation_model.ValidationResult.__table__.delete())
+        config['ckanext.sweden.harvest.use_validation'] = 'true'
+        config['ckanext.sweden.harvest.stop_on_validation_errors'] = 'false'
+        config['ckanext.sweden.harvest.validation_retries'] = '0'
+        config.pop('ckanext.sweden.harvest.validation_circuit_failures', None)
+        validation_client.configure_client(config)
+        self.services = []
+
+    def teardown(self):
+        for service in self.services:
+            service.shutdown()
+            service.server_close()
+
+    def _start_service(self, response, statuses=()):
+        service = _ValidationService(response, statuses)
+        thread = threading.Thread(target=service.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.services.append(service)
+        config['ckanext.sweden.harvest.validation_service'] = service.url
+        return service
+
+
+class TestValidationCache(ValidationServiceTestBase):
+
+    def test_cache_key(self):
+        key = validation_model.cache_key('<rdf/>', 'http://a')
+
+        eq_(len(key), 64)
+        eq_(key, validation_model.cache_key(u'<rdf/>', u'http://a'))
+        assert key != validation_model.cache_key('<rdf />', 'http://a')
+        assert key != validation_model.cache_key('<rdf/>', 'http://b')
+
+    def test_unchanged_document_is_not_validated_again(self):
+        service = self._start_service({})
+        plugin = SwedenDCATRDFHarvester()
+
+        eq_(plugin.after_download('<rdf/>', None), ('<rdf/>', []))
+        eq_(plugin.after_download('<rdf/>', None), ('<rdf/>', []))
+
+        eq_(service.requests, 1)
+
+    def test_changed_document_is_validated(self):
+        service = self._start_service({})
+        plugin = SwedenDCATRDFHarvester()
+
+        plugin.after_download('<rdf/>', None)
+        plugin.after_download('<rdf>changed</rdf>', None)
+
+        eq_(service.requests, 2)
+
+    def test_cached_errors(self):
+        service = self._start_service({'rdfError': 'Invalid RDF'})
+        config['ckanext.sweden.harvest.stop_on_validation_errors'] = 'true'
+        plugin = SwedenDCATRDFHarvester()
+
+        eq_(plugin.after_download('<rdf', None), (None, ['Invalid RDF']))
+        eq_(plugin.after_download('<rdf', None), (None, ['Invalid RDF']))
+
+        eq_(service.requests, 1)
+
+    def test_expired_result(self):
+        service = self._start_service({})
+        config['ckanext.sweden.harvest.validation_cache_ttl'] = '0'
+        plugin = SwedenDCATRDFHarvester()
+
+        plugin.after_download('<rdf/>', None)
+        plugin.after_download('<rdf/>', None)
+
+        eq_(service.requests, 2)
+
+    def test_service_errors_are_not_cached(self):
+        service = self._start_service({})
+        url = service.url
+        service.shutdown()
+        service.server_close()
+        self.services.remove(service)
+        config['ckanext.sweden.harvest.validation_service'] = url
+        plugin = SwedenDCATRDFHarvester()
+
+        content, errors = plugin.after_download('<rdf/>', None)
+
+        eq_(len(errors), 1)
+        eq_(validation_model.get_result(
+            validation_model.cache_key('<rdf/>', url), 60), None)
@@ -0,0 +1,145 @@
+import time
+
+import nose
+import requests
+from pylons import config
+
+from ckanext.sweden.dcat import validation_client
+from ckanext.sweden.dcat.plugin import SwedenDCATRDFHarvester
+from ckanext.sweden.dcat.tests.test_validation_cache import \
+    ValidationServiceTestBase
+
+eq_ = nose.tools.eq_
+
+
+class TestCircuitBreaker(object):
+
+    def test_opens_after_consecutive_failures(self):
+        breaker = validation_client.CircuitBreaker(max_failures=2,
+                                                   reset_timeout=60)
+
+        breaker.record_failure()
+        assert breaker.allow()
+        breaker.record_failure()
+        assert not breaker.allow()
+
+    def test_success_resets_failures(self):
+        breaker = validation_client.CircuitBreaker(max_failures=2,
+                                                   reset_timeout=60)
+
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+
+        assert breaker.allow()
+
+    def test_lets_one_call_through_after_reset_timeout(self):
+        breaker = validation_client.CircuitBreaker(max_failures=1,
+                                                   reset_timeout=60)
+        breaker.record_failure()
+        breaker.opened_at = time.time() - 61
+
+        assert breaker.allow()
+        assert not breaker.allow()
+
+        breaker.record_success()
+        assert breaker.allow()
+
+    def test_never_opens_without_max_failures(self):
+        breaker = validation_client.CircuitBreaker(max_failures=0)
+
+        for i in range(10):
+            breaker.record_failure()
+
+        assert breaker.allow()
+
+
+class TestValidationClient(ValidationServiceTestBase):
+    '''The validation service client, with the validation cache disabled so
+    every download is sent to the service.'''
+
+    def setup(self):
+        super(TestValidationClient, self).setup()
+        config['ckanext.sweden.harvest.validation_cache_ttl'] = '0'
+
+    def _client(self, **kwargs):
+        kwargs.setdefault('backoff', 0)
+        return validation_client.ValidationClient(**kwargs)
+
+    def test_retries_unavailable_service(self):
+        service = self._start_service({}, statuses=[503, 502])
+        client = self._client(retries=2)
+
+        response = client.post(service.url, '<rdf/>')
+
+        eq_(response.status_code, 200)
+        eq_(service.requests, 3)
+
+    def test_gives_up_after_retries(self):
+        service = self._start_service({}, statuses=[503, 503, 503])
+        client = self._client(retries=1)
+
+        response = client.post(service.url, '<rdf/>')
+
+        eq_(response.status_code, 503)
+        eq_(service.requests, 2)
+        eq_(client.breaker.failures, 1)
+
+    def test_does_not_retry_client_errors(self):
+        service = self._start_service({}, statuses=[400])
+        client = self._client(retries=2)
+
+        response = client.post(service.url, '<rdf/>')
+
+        eq_(response.status_code, 400)
+        eq_(service.requests, 1)
+
+    def test_circuit_opens(self):
+        service = self._start_service({}, statuses=[500, 500])
+        client = self._client(retries=0, max_failures=2)
+
+        client.post(service.url, '<rdf/>')
+        client.post(service.url, '<rdf/>')
+
+        nose.tools.assert_raises(validation_client.CircuitOpenError,
+                                 client.post, service.url, '<rdf/>')
+        eq_(service.requests, 2)
+
+    def test_connection_errors(self):
+        service = self._start_service({})
+        url = service.url
+        service.shutdown()
+        service.server_close()
+        self.services.remove(service)
+        client = self._client(retries=1)
+
+        nose.tools.assert_raises(requests.exceptions.ConnectionError,
+                                 client.post, url, '<rdf/>')
+        eq_(client.breaker.failures, 1)
+
+    def test_validation_skipped_when_circuit_open(self):
+        service = self._start_service({}, statuses=[500])
+        config['ckanext.sweden.harvest.validation_circuit_failures'] = '1'
+        validation_client.configure_client(config)
+        plugin = SwedenDCATRDFHarvester()
+
+        plugin.after_download('<rdf/>', None)
+
+        content, errors = plugin.after_download('<rdf/>', None)
+        eq_(content, '<rdf/>')
+        eq_(len(errors), 1)
+        eq_(service.requests, 1)
+
+    def test_stops_when_circuit_open_and_stop_on_errors(self):
+        service = self._start_service({}, statuses=[500])
+        config['ckanext.sweden.harvest.validation_circuit_failures'] = '1'
+        config['ckanext.sweden.harvest.stop_on_validation_errors'] = 'true'
+        validation_client.configure_client(config)
+        plugin = SwedenDCATRDFHarvester()
+
+        plugin.after_download('<rdf/>', None)
+
+        content, errors = plugin.after_download('<rdf/>', None)
+        eq_(content, None)
+        eq_(len(errors), 1)
+        eq_(service.requests, 1)
@@ -0,0 +1,167 @@
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+log = __import__('logging').getLogger(__name__)
+
+# The responses worth trying again, as the service may just be restarting
+RETRY_STATUSES = (502, 503, 504)
+
+
+class CircuitOpenError(Exception):
+    '''The validation service failed too many times in a row, and is not
+    being called for now.'''
+    pass
+
+
+class CircuitBreaker(object):
+    '''
+    Stop calling a service after `max_failures` consecutive failures, for
+    `reset_timeout` seconds. After that, one call is let through: if it
+    succeeds the service is called again as usual, otherwise it is left
+    alone for another `reset_timeout` seconds.
+    '''
+
+    def __init__(self, max_failures=5, reset_timeout=300):
+        self.max_failures = max_failures
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        '''Return True if the service can be called.'''
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.time() - self.opened_at >= self.reset_timeout:
+                # Let one call through, and keep the others out until it
+                # is done
+                self.opened_at = time.time()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.max_failures and self.failures >= self.max_failures:
+                self.opened_at = time.time()
+
+
+class ValidationClient(object):
+    '''
+    POST documents to the validation service over a pool of kept alive
+    connections, with timeouts, retries and a circuit breaker.
+
+    Connection errors, timeouts and the `RETRY_STATUSES` responses are tried
+    again up to `retries` times, waiting a random time of up to `backoff`
+    seconds the first time, and twice as long each following time (but no
+    more than `max_backoff`).
+    '''
+
+    def __init__(self, connect_timeout=10, read_timeout=120, retries=2,
+                 backoff=1.0, max_backoff=30, max_failures=5,
+                 reset_timeout=300, pool_size=4):
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = CircuitBreaker(max_failures, reset_timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _sleep(self, attempt):
+        time.sleep(random.uniform(
+            0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+
+    def post(self, url, data):
+        '''
+        POST `data` to `url` and return the response.
+
+        Raises CircuitOpenError if the service is not being called after too
+        many failures, or the requests exception of the last attempt.
+        '''
+        if not self.breaker.allow():
+            raise CircuitOpenError(
+                'The validation service failed {0} times in a row'.format(
+                    self.breaker.failures))
+
+        for attempt in range(self.retries + 1):
+            last_attempt = attempt == self.retries
+            try:
+                response = self.session.post(url, data=data,
+                                             timeout=self.timeout)
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout), e:
+                if last_attempt:
+                    self.breaker.record_failure()
+                    raise
+                log.info('Error contacting the validation service, trying '
+                         'again: {0}'.format(e))
+            except requests.exceptions.RequestException:
+                self.breaker.record_failure()
+                raise
+            else:
+                if response.status_code not in RETRY_STATUSES or \
+                        last_attempt:
+                    if response.status_code >= 500:
+                        self.breaker.record_failure()
+                    else:
+                        self.breaker.record_success()
+                    return response
+                log.info('The validation service returned {0}, trying '
+                         'again'.format(response.status_code))
+            self._sleep(attempt)
+
+
+_client = None
+
+
+def configure_client(config):
+    '''
+    Set up the validation service client from the config options:
+
+    * `ckanext.sweden.harvest.validation_connect_timeout` (default: `10`)
+      and `ckanext.sweden.harvest.validation_read_timeout` (default: `120`),
+      in seconds
+    * `ckanext.sweden.harvest.validation_retries` (default: `2`)
+    * `ckanext.sweden.harvest.validation_retry_backoff` (default: `1`), in
+      seconds
+    * `ckanext.sweden.harvest.validation_circuit_failures` (default: `5`),
+      `0` to never stop calling the service
+    * `ckanext.sweden.harvest.validation_circuit_reset` (default: `300`), in
+      seconds
+    '''
+    global _client
+    _client = ValidationClient(
+        connect_timeout=float(config.get(
+            'ckanext.sweden.harvest.validation_connect_timeout', 10)),
+        read_timeout=float(config.get(
+            'ckanext.sweden.harvest.validation_read_timeout', 120)),
+        retries=int(config.get(
+            'ckanext.sweden.harvest.validation_retries', 2)),
+        backoff=float(config.get(
+            'ckanext.sweden.harvest.validation_retry_backoff', 1)),
+        max_failures=int(config.get(
+            'ckanext.sweden.harvest.validation_circuit_failures', 5)),
+        reset_timeout=float(config.get(
+            'ckanext.sweden.harvest.validation_circuit_reset', 300)))
+    return _client
+
+
+def get_client():
+    if _client is None:
+        from pylons import config
+        configure_client(config)
+    return _client
@@ -1,6 +1,8 @@
 from pylons import config
 from nose import tools as nosetools
 import ckan.logic as logic
+
+from ckanext.sweden.cache import TTLCache
 try:
     import ckan.tests.factories as factories
     import ckan.tests.helpers as helpers
@@ -136,3 +138,36 @@ class TestOrgSchema(object):
 
         assert_raises(logic.ValidationError, helpers.call_action, 'organization_update',
                       name='org2', url=url)
+
+
+class TestTTLCache(object):
+
+    def test_get_or_set_only_creates_once(self):
+        cache = TTLCache(ttl=60)
+        calls = []
+
+        def create():
+            calls.append(1)
+            return 'value'
+
+        assert_equal(cache.get_or_set('key', create), 'value')
+        assert_equal(cache.get_or_set('key', create), 'value')
+        assert_equal(len(calls), 1)
+
+    def test_expired_entries_are_missing(self):
+        cache = TTLCache()
+        cache.set('key', 'value', ttl=-1)
+
+        assert_equal(cache.get('key', 'default'), 'default')
+
+    def test_invalidate(self):
+        cache = TTLCache()
+        cache.set('a', 1)
+        cache.set('b', 2)
+
+        cache.invalidate('a')
+        assert_equal(cache.get('a'), None)
+        assert_equal(cache.get('b'), 2)
+
+        cache.invalidate()
+        assert_equal(cache.get('b'), None)
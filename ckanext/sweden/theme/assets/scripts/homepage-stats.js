@@ -4,6 +4,7 @@
 
       /* Default options */
       options: {
+        url: null,
         rawdata: [],
         xaxis: {},
         yaxis: {},
@@ -22,8 +23,21 @@
       },
 
       initialize: function () {
-        var d1 = this.options.rawdata;
-        $.plot(this.el.find(".demo-placeholder"), d1, this.options);
+        $.proxyAll(this, /_on/);
+        if (this.options.url) {
+          $.getJSON(this.options.url, this._onData);
+        } else {
+          this._onData(this.options.rawdata);
+        }
+      },
+
+      _onData: function (data) {
+        var placeholder = this.el.find(".demo-placeholder");
+        if (!data.length) {
+          placeholder.remove();
+          return;
+        }
+        $.plot(placeholder, data, this.options);
       }
     };
   });
@@ -0,0 +1,55 @@
+import logging
+
+from ckan.lib.cli import CkanCommand
+# No other CKAN imports allowed until _load_config is run,
+# or logging is disabled
+
+
+class StatsCommand(CkanCommand):
+    """Manage the pre-aggregated dataset statistics
+
+    Usage:
+
+      sweden_stats init
+        - Create the sweden_weekly_stats and sweden_most_viewed tables
+
+      sweden_stats rebuild
+        - Recompute the sweden_weekly_stats table from the revision tables
+
+      sweden_stats most_viewed
+        - Recompute the most viewed datasets rankings from the
+          tracking_summary table (run it after `paster tracking update`)
+    """
+    summary = __doc__.split('\n')[0]
+    usage = __doc__
+    max_args = 1
+    min_args = 1
+
+    def __init__(self, name):
+        super(StatsCommand, self).__init__(name)
+
+    def command(self):
+        self._load_config()
+        log = logging.getLogger(__name__)
+
+        import ckan.model as model
+        model.Session.remove()
+        model.Session.configure(bind=model.meta.engine)
+
+        import ckanext.sweden.theme.model.stats as stats_model
+        cmd = self.args[0]
+        if cmd == 'init':
+            stats_model.init_tables(model.meta.engine)
+            log.info("Stats DB tables are setup")
+        elif cmd == 'rebuild':
+            from ckanext.sweden.theme import helpers
+            stats_model.init_tables(model.meta.engine)
+            helpers.rebuild_weekly_stats()
+            log.info("Weekly stats rebuilt")
+        elif cmd == 'most_viewed':
+            from ckanext.sweden.theme import helpers
+            stats_model.init_tables(model.meta.engine)
+            helpers.rebuild_most_viewed()
+            log.info("Most viewed datasets rankings rebuilt")
+        else:
+            print 'Command {0} not recognized'.format(cmd)
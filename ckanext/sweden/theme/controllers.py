@@ -0,0 +1,55 @@
+import json
+
+from pylons import config
+
+import ckan.plugins.toolkit as toolkit
+
+from ckanext.sweden.theme import helpers
+
+
+class StatsController(toolkit.BaseController):
+
+    def chart(self, chart):
+        '''
+        Return the series of a homepage stats chart as JSON, so the homepage
+        can load them after rendering.
+
+        The optional `points` parameter downsamples each series to that many
+        points. Responses can be cached by browsers and proxies for
+        `ckanext.sweden.stats.chart_max_age` seconds (default: one day),
+        except for the category chart, which features a random category on
+        each request.
+        '''
+        try:
+            toolkit.check_access('sweden_stats_show', {})
+        except toolkit.NotAuthorized:
+            toolkit.abort(403, toolkit._('Not authorized to see this page'))
+
+        points = toolkit.request.params.get('points')
+        if points:
+            try:
+                points = int(points)
+                if points < 3:
+                    raise ValueError
+            except ValueError:
+                toolkit.abort(400, toolkit._(
+                    'points must be an integer of at least 3'))
+
+        try:
+            chart_data = helpers.get_chart_data(chart, points=points)
+        except ValueError:
+            toolkit.abort(404, toolkit._('Chart not found'))
+
+        if chart == 'category':
+            cache_control = 'no-cache'
+        else:
+            cache_control = 'public, max-age={0}'.format(toolkit.asint(
+                config.get('ckanext.sweden.stats.chart_max_age', 86400)))
+        toolkit.response.headers.update({
+            'Content-type': 'application/json',
+            'Cache-Control': cache_control,
+        })
+        if 'Pragma' in toolkit.response.headers:
+            del toolkit.response.headers['Pragma']
+
+        return json.dumps(chart_data)
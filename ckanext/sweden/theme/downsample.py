@@ -0,0 +1,46 @@
+def largest_triangle_three_buckets(data, threshold):
+    '''
+    Downsample a list of (x, y) points to `threshold` points with the
+    Largest-Triangle-Three-Buckets algorithm, which keeps the visual shape
+    of the line (peaks and dips) much better than picking every nth point.
+
+    The first and last points are always kept. The data is returned as is if
+    it already has `threshold` points or less.
+
+    See Sveinn Steinarsson, "Downsampling Time Series for Visual
+    Representation" (2013).
+    '''
+    length = len(data)
+    if threshold >= length or threshold < 3:
+        return list(data)
+
+    sampled = [data[0]]
+    # The points between the first and last ones are split in
+    # threshold - 2 buckets, and one point is picked from each.
+    every = float(length - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # Average point of the next bucket
+        avg_start = int(every * (i + 1)) + 1
+        avg_end = min(int(every * (i + 2)) + 1, length)
+        avg_length = avg_end - avg_start
+        avg_x = sum(point[0] for point in data[avg_start:avg_end]) \
+            / float(avg_length)
+        avg_y = sum(point[1] for point in data[avg_start:avg_end]) \
+            / float(avg_length)
+
+        # Pick the point of this bucket making the largest triangle with the
+        # previously picked point and the average of the next bucket
+        a_x, a_y = data[a][0], data[a][1]
+        max_area = -1
+        for j in range(int(every * i) + 1, int(every * (i + 1)) + 1):
+            area = abs((a_x - avg_x) * (data[j][1] - a_y) -
+                       (a_x - data[j][0]) * (avg_y - a_y))
+            if area > max_area:
+                max_area = area
+                next_a = j
+        sampled.append(data[next_a])
+        a = next_a
+
+    sampled.append(data[-1])
+    return sampled
@@ -0,0 +1,179 @@
+import collections
+import threading
+import time
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+try:
+    import redis
+except ImportError:
+    redis = None
+
+from ckan.lib.helpers import lang
+
+log = __import__('logging').getLogger(__name__)
+
+
+class LRUBackend(object):
+    '''Keep the fragments in the memory of the process, dropping the least
+    recently used ones once there are more than `max_entries`.'''
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._tags = collections.defaultdict(set)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.time():
+                return None
+            # Move it to the end, as the most recently used
+            self._entries[key] = entry
+            return value
+
+    def set(self, key, value, ttl, tags=()):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time() + ttl, value)
+            for tag in tags:
+                self._tags[tag].add(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_tags(self, tags):
+        with self._lock:
+            for tag in tags:
+                for key in self._tags.pop(tag, ()):
+                    self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+
+class RedisBackend(object):
+    '''Share the fragments between processes in Redis. Each tag is a Redis
+    set with the keys of its fragments.'''
+
+    prefix = 'ckanext-sweden:fragment:'
+
+    def __init__(self, url):
+        if redis is None:
+            raise ImportError('The redis fragment cache backend needs the '
+                              'redis package to be installed')
+        self.client = redis.StrictRedis.from_url(url)
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            return None
+        return Markup(value.decode('utf-8'))
+
+    def set(self, key, value, ttl, tags=()):
+        pipe = self.client.pipeline()
+        pipe.setex(self.prefix + key, ttl, unicode(value).encode('utf-8'))
+        for tag in tags:
+            pipe.sadd(self.prefix + 'tag:' + tag, self.prefix + key)
+        pipe.execute()
+
+    def invalidate_tags(self, tags):
+        for tag in tags:
+            tag_key = self.prefix + 'tag:' + tag
+            keys = self.client.smembers(tag_key)
+            self.client.delete(tag_key, *keys)
+
+    def clear(self):
+        keys = self.client.keys(self.prefix + '*')
+        if keys:
+            self.client.delete(*keys)
+
+
+_backend = LRUBackend()
+
+
+def configure_backend(config):
+    '''
+    Set the backend of the fragment cache from the config:
+    `ckanext.sweden.fragment_cache.backend` is either `lru` (default) or
+    `redis`, with `ckanext.sweden.fragment_cache.max_entries` (default:
+    `1000`) and `ckanext.sweden.fragment_cache.redis_url` (default:
+    `redis://localhost:6379/0`) respectively.
+    '''
+    global _backend
+    backend = config.get('ckanext.sweden.fragment_cache.backend', 'lru')
+    if backend == 'redis':
+        _backend = RedisBackend(
+            config.get('ckanext.sweden.fragment_cache.redis_url',
+                       'redis://localhost:6379/0'))
+    elif backend == 'lru':
+        _backend = LRUBackend(int(
+            config.get('ckanext.sweden.fragment_cache.max_entries', 1000)))
+    else:
+        raise ValueError('Unknown fragment cache backend: {0}'.format(
+            backend))
+
+
+def get_backend():
+    return _backend
+
+
+def invalidate_tags(*tags):
+    '''Remove the fragments cached with any of the given tags.'''
+    _backend.invalidate_tags(tags)
+
+
+def install(config):
+    '''Add the `cache` tag to the Jinja environment of CKAN.'''
+    config['pylons.app_globals'].jinja_env.add_extension(
+        FragmentCacheExtension)
+
+
+class FragmentCacheExtension(Extension):
+    '''
+    Cache the HTML rendered by a block of a template:
+
+        {% cache 'most_viewed', 300, 'datasets' %}
+          ...
+        {% endcache %}
+
+    The first argument is the key of the fragment (which is also cached per
+    language), the second the number of seconds to cache it for, and any
+    further ones are tags, so it can be removed from the cache early with
+    `invalidate_tags`.
+    '''
+    tags = set(['cache'])
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_cache', args), [], [],
+                               body).set_lineno(lineno)
+
+    def _cache(self, key, ttl, *tags, **kwargs):
+        caller = kwargs['caller']
+        key = u'{0}:{1}'.format(lang(), key)
+        try:
+            value = _backend.get(key)
+        except Exception, e:
+            # A cache failure should not break the page
+            log.warning('Could not read fragment {0}: {1}'.format(key, e))
+            return caller()
+
+        if value is None:
+            value = caller()
+            try:
+                _backend.set(key, value, ttl, tags)
+            except Exception, e:
+                log.warning('Could not cache fragment {0}: {1}'.format(
+                    key, e))
+        return value
@@ -1,15 +1,89 @@
 import random
+import bisect
 from itertools import groupby
 import datetime
 import calendar
-from sqlalchemy import Table, select, func, and_
+import json
+from sqlalchemy import select, func, distinct
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.sql.expression import false
+from pylons import config
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 from ckan.plugins import toolkit
+import ckan.lib.helpers as h
 import ckan.model as model
 
+from ckanext.sweden.cache import TTLCache
+from ckanext.sweden.theme.downsample import largest_triangle_three_buckets
+from ckanext.sweden.theme.hyperloglog import HyperLogLog
+from ckanext.sweden.theme import sources
+from ckanext.sweden.theme.model import stats as stats_model
 
-def table(name):
-    return Table(name, model.meta.metadata, autoload=True)
+log = __import__('logging').getLogger(__name__)
+
+SOLR_DATE_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+# A Monday, so weekly range facet buckets start on Mondays like the rest of
+# the stats.
+FACET_RANGE_START = '2000-01-03T00:00:00Z'
+
+_category_index = TTLCache()
+
+# The charts of the homepage stats, served by the `sweden_stats_chart` route
+CHARTS = ('growth', 'activity', 'category')
+
+_chart_cache = TTLCache()
+
+# The dataset lists of the homepage and the Solr sort of each
+HOMEPAGE_DATASET_LISTS = {
+    'most_viewed': 'views_recent desc',
+    'recently_updated': 'metadata_modified desc',
+}
+HOMEPAGE_DATASET_ROWS = 3
+# Only the fields shown by the snippets/package_item.html template
+HOMEPAGE_DATASET_FIELDS = 'id,name,title,notes,res_format,views_total,' \
+    'views_recent,metadata_modified'
+
+_homepage_datasets = TTLCache()
+
+# The periods of the most viewed rankings and their length in days
+MOST_VIEWED_PERIODS = {'all': None, '30d': 30, '7d': 7}
+# The number of datasets kept in each ranking
+MOST_VIEWED_LIMIT = 100
+
+# The number of groups kept in the top groups ranking
+TOP_GROUPS_LIMIT = 20
+
+_top_groups = TTLCache()
+
+
+def _new_datasets_select(pkg_ids=None):
+    '''
+    Return a select of (id, timestamp) rows with the date each dataset was
+    created, from the configured stats source.
+    '''
+    return sources.get_stats_source().new_datasets_select(pkg_ids=pkg_ids)
+
+
+def _package_revisions_select():
+    '''
+    Return a select of (id, timestamp) rows, one for each dataset change,
+    from the configured stats source.
+    '''
+    return sources.get_stats_source().package_revisions_select()
+
+
+def _org_datasets_select(series, org_id=None):
+    '''
+    Return a select of (id, org, timestamp) rows for the `new` or `active`
+    series, from the configured stats source.
+    '''
+    return sources.get_stats_source().org_datasets_select(series,
+                                                          org_id=org_id)
 
 
 def get_new_datasets(pkg_ids=None):
@@ -19,19 +93,7 @@ def get_new_datasets(pkg_ids=None):
 
     If pkg_ids list is passed, limit query to just those packages.
     '''
-    # Can't filter by time in select because 'min' function has to
-    # be 'for all time' else you get first revision in the time period.
-    package_revision = table('package_revision')
-    revision = table('revision')
-    s = select([package_revision.c.id, func.min(revision.c.timestamp)],
-               from_obj=[package_revision.join(revision)])
-    if pkg_ids:
-        s = s.where(and_(package_revision.c.id.in_(pkg_ids),
-                         package_revision.c.type == 'dataset'))
-    else:
-        s = s.where(package_revision.c.type == 'dataset')
-    s = s.group_by(package_revision.c.id).\
-        order_by(func.min(revision.c.timestamp))
+    s = _new_datasets_select(pkg_ids).order_by('timestamp')
     res = model.Session.execute(s).fetchall()  # [(id, datetime), ...]
     res_pickleable = []
     for pkg_id, created_datetime in res:
@@ -43,38 +105,680 @@ def get_package_revisions():
     '''
     Return a list of revision id and datetime, in format: [(id, date), ...]
     '''
-    package_revision = table('package_revision')
-    revision = table('revision')
-    s = select([package_revision.c.id, revision.c.timestamp],
-               from_obj=[package_revision.join(revision)]).\
-        order_by(revision.c.timestamp)
-    s = s.where(package_revision.c.type == 'dataset')
+    s = _package_revisions_select().order_by('timestamp')
     res = model.Session.execute(s).fetchall()  # [(id, datetime), ...]
     return res
 
 
-def get_weekly_new_dataset_totals(timestamp=True, zero_week=True):
-    '''For each week, return the cumulative total number of datasets.'''
-    new_datasets = get_new_datasets()
+def use_sql_bucketing():
+    '''Whether the weekly counts can be computed by the database.
+
+    This needs PostgreSQL, and can be turned off with
+    `ckanext.sweden.stats.sql_bucketing`.
+    '''
+    if not toolkit.asbool(
+            config.get('ckanext.sweden.stats.sql_bucketing', True)):
+        return False
+    return model.meta.engine.dialect.name == 'postgresql'
+
+
+def _period_counts(id_date_select, cumulative=False, granularity='week',
+                   since=None, until=None, group_column=None,
+                   distinct_ids=False):
+    '''
+    Count the rows of a select of (id, timestamp) rows for each period in the
+    database, and return the result rows as (period start, count) tuples.
+
+    If `group_column` is given, the rows are also grouped by that column of
+    the select, and the result rows are (group, period start, count) tuples.
+
+    If `distinct_ids` is True, each id is only counted once per period.
+    '''
+    id_dates = id_date_select.alias('id_dates')
+    period_start = func.date_trunc(granularity, id_dates.c.timestamp)
+    groups = []
+    if group_column:
+        groups = [id_dates.c[group_column]]
+    if distinct_ids:
+        count = func.count(distinct(id_dates.c.id))
+    else:
+        count = func.count(id_dates.c.id)
+    if cumulative:
+        count = func.sum(count).over(partition_by=groups or None,
+                                     order_by=period_start)
+    s = select(groups + [period_start.label('period_start'),
+                         count.label('count')]).\
+        group_by(*(groups + [period_start]))
+    if since is not None and not cumulative:
+        # Cumulative counts need the earlier rows too.
+        s = s.where(id_dates.c.timestamp >= since)
+
+    counts = s.alias('counts')
+    columns = [counts.c[group_column]] if group_column else []
+    s = select(columns + [counts.c.period_start, counts.c.count]).\
+        order_by(*(columns + [counts.c.period_start]))
+    if since is not None:
+        s = s.where(counts.c.period_start >= since)
+    if until is not None:
+        s = s.where(counts.c.period_start <= until)
+    return model.Session.execute(s).fetchall()
+
+
+def get_period_counts(id_date_select, cumulative=False, granularity='week',
+                      since=None, until=None, distinct=False):
+    '''
+    For a select of (id, timestamp) rows, return a list of (period start date,
+    count) pairs, one for each period with rows, grouped and counted by the
+    database.
+
+    `granularity` is the length of the periods, one of `day`, `week` or
+    `month`. If cumulative is True, each count includes the counts of all the
+    previous periods. `since` and `until` limit the results to the periods
+    starting between these dates. If distinct is True, each id is only
+    counted once per period.
+    '''
+    res = _period_counts(id_date_select, cumulative=cumulative,
+                         granularity=granularity, since=since, until=until,
+                         distinct_ids=distinct)
+    return [(start.date(), int(total)) for start, total in res]
+
+
+def get_grouped_period_counts(id_date_select, group_column, cumulative=False,
+                              granularity='week', since=None, until=None):
+    '''
+    Like `get_period_counts`, but for a select that also has a
+    `group_column` column. Return a dict mapping each value of that column to
+    its list of (period start date, count) pairs, all in a single query.
+    '''
+    res = _period_counts(id_date_select, cumulative=cumulative,
+                         granularity=granularity, since=since, until=until,
+                         group_column=group_column)
+    grouped = {}
+    for group, start, total in res:
+        grouped.setdefault(group, []).append((start.date(), int(total)))
+    return grouped
+
+
+def use_materialized_stats():
+    '''Whether the weekly stats are read from the `sweden_weekly_stats` table
+    instead of being computed from the revision tables.'''
+    return toolkit.asbool(
+        config.get('ckanext.sweden.stats.materialized', False))
+
+
+def record_dataset_change(pkg_dict, new=False):
+    '''Update the `sweden_weekly_stats` table for a created or updated
+    dataset.'''
+    if not use_materialized_stats():
+        return
+    if (pkg_dict.get('type') or 'dataset') != 'dataset':
+        return
+
+    week_start = _transform_to_week_start(datetime.datetime.utcnow())
+    # The stats can be rebuilt, so failing to update them should not fail
+    # the dataset action they are called from
+    savepoint = model.Session.begin_nested()
+    try:
+        if new:
+            stats_model.record_new_dataset(week_start, pkg_dict['id'])
+        else:
+            stats_model.record_dataset_activity(week_start, pkg_dict['id'])
+        savepoint.commit()
+    except (SQLAlchemyError, RuntimeError), e:
+        savepoint.rollback()
+        log.error('Could not update the weekly stats for dataset {0}, run '
+                  '`paster sweden_stats rebuild` to fix them: {1}'.format(
+                      pkg_dict['id'], e))
+
+
+def rebuild_weekly_stats():
+    '''Recompute the `sweden_weekly_stats` table from the revision tables.'''
+    if use_sql_bucketing():
+        new_weeks = get_period_counts(_new_datasets_select())
+        active_weeks = get_period_counts(_package_revisions_select())
+        revisions = _package_revisions_select().alias('revisions')
+        week_start = func.date_trunc('week', revisions.c.timestamp)
+        s = select([week_start, revisions.c.id]).distinct()
+        active_ids = [(start.date(), pkg_id) for start, pkg_id
+                      in model.Session.execute(s)]
+    else:
+        pkg_revisions = get_package_revisions()
+        new_weeks = _weekly_totals(get_new_datasets(), zero_week=False)
+        active_weeks = _weekly_totals(pkg_revisions, zero_week=False)
+        active_ids = set((_transform_to_week_start(date_time), pkg_id)
+                         for pkg_id, date_time in pkg_revisions)
+    stats_model.rebuild(new_weeks, active_weeks, active_ids)
+
 
-    return _weekly_totals(new_datasets, timestamp=timestamp, cumulative=True,
-                          zero_week=zero_week)
+def _distinct_per_period(id_date_list, granularity='week'):
+    '''
+    Only keep the first (id, datetime) tuple of each id in each period, so
+    that counting the result counts distinct ids.
+    '''
+    seen = set()
+    distinct_list = []
+    for pkg_id, date_time in id_date_list:
+        key = (pkg_id, _transform_to_period_start(date_time, granularity))
+        if key not in seen:
+            seen.add(key)
+            distinct_list.append((pkg_id, date_time))
+    return distinct_list
+
+
+def _dataset_series(series, timestamp=True, zero_week=True,
+                    granularity='week', since=None, until=None,
+                    distinct=None):
+    '''
+    Return the (date, count) pairs of one of the dataset stats series:
+    `total` (cumulative new datasets), `new` or `active`.
+
+    The counts are read from the `sweden_weekly_stats` table if enabled,
+    otherwise they are computed by the database if possible, and in Python
+    as a last resort.
+
+    For the `active` series, `distinct` can be set to count the distinct
+    datasets updated in each period instead of the number of updates:
+    `exact` counts them, `approximate` estimates them from the sketches of
+    the `sweden_weekly_stats` table (if enabled, otherwise they are counted).
+    '''
+    cumulative = series == 'total'
+    distinct = distinct if series == 'active' else None
+    materialized = granularity == 'week' and use_materialized_stats()
+    if materialized and distinct == 'approximate':
+        period_counts = [
+            (start, sketch.count()) for start, sketch in
+            stats_model.get_weekly_sketches(since=since, until=until)]
+    elif materialized and not distinct:
+        period_counts = stats_model.get_weekly_stats(series, since=since,
+                                                     until=until)
+    elif use_sql_bucketing():
+        if series == 'active':
+            id_date_select = _package_revisions_select()
+        else:
+            id_date_select = _new_datasets_select()
+        period_counts = get_period_counts(id_date_select,
+                                          cumulative=cumulative,
+                                          granularity=granularity,
+                                          since=since, until=until,
+                                          distinct=bool(distinct))
+    else:
+        if series == 'active':
+            id_date_list = get_package_revisions()
+        else:
+            id_date_list = get_new_datasets()
+        if distinct:
+            id_date_list = _distinct_per_period(id_date_list, granularity)
+        period_counts = [
+            (start, count) for start, count in
+            _weekly_totals(id_date_list, cumulative=cumulative,
+                           zero_week=False, granularity=granularity)
+            if (since is None or start >= since) and
+            (until is None or start <= until)]
+
+    return _format_week_totals(period_counts, timestamp=timestamp,
+                               zero_week=zero_week, granularity=granularity)
+
+
+def get_distinct_active_datasets(since=None, until=None):
+    '''
+    Return the number of distinct datasets updated in the weeks starting
+    between `since` and `until`, as a dict with a `count` and whether it is
+    `approximate`.
+
+    If the `sweden_weekly_stats` table is enabled, the count is estimated by
+    merging the sketches of the weeks, otherwise the revisions are counted.
+    '''
+    if use_materialized_stats():
+        sketch = HyperLogLog()
+        for week_start, week_sketch in stats_model.get_weekly_sketches(
+                since=since, until=until):
+            sketch.merge(week_sketch)
+        return {'count': sketch.count(), 'approximate': True}
+
+    if use_sql_bucketing():
+        revisions = _package_revisions_select().alias('revisions')
+        s = select([func.count(distinct(revisions.c.id))])
+        if since is not None:
+            s = s.where(revisions.c.timestamp >= since)
+        if until is not None:
+            s = s.where(
+                func.date_trunc('week', revisions.c.timestamp) <= until)
+        count = model.Session.execute(s).scalar()
+    else:
+        count = len(set(
+            pkg_id for pkg_id, date_time in get_package_revisions()
+            if (since is None or date_time.date() >= since) and
+            (until is None or _transform_to_week_start(date_time) <= until)))
+    return {'count': count, 'approximate': False}
+
+
+def _org_dataset_series(series, org_id=None, granularity='week', since=None,
+                        until=None):
+    '''
+    Return a dict mapping organization names to the (date, count) pairs of
+    one of the dataset stats series: `total`, `new` or `active`.
+    '''
+    cumulative = series == 'total'
+    org_select = _org_datasets_select(
+        'active' if series == 'active' else 'new', org_id=org_id)
+    if use_sql_bucketing():
+        return get_grouped_period_counts(org_select, 'org',
+                                         cumulative=cumulative,
+                                         granularity=granularity,
+                                         since=since, until=until)
+
+    id_date_lists = {}
+    res = model.Session.execute(org_select.order_by('timestamp')).fetchall()
+    for pkg_id, org, date_time in res:
+        id_date_lists.setdefault(org, []).append((pkg_id, date_time))
+
+    org_period_counts = {}
+    for org, id_date_list in id_date_lists.items():
+        org_period_counts[org] = [
+            (start, count) for start, count in
+            _weekly_totals(id_date_list, cumulative=cumulative,
+                           zero_week=False, granularity=granularity)
+            if (since is None or start >= since) and
+            (until is None or start <= until)]
+    return org_period_counts
+
+
+def get_org_weekly_stats(org_id=None, timestamp=True, granularity='week',
+                         since=None, until=None):
+    '''
+    For each organization (or just the given one), return the `new`,
+    `active` and `total` weekly dataset series, as a dict mapping
+    organization names to dicts of series.
+
+    Each series is computed for all organizations at once, so the number of
+    queries doesn't depend on the number of organizations.
+    '''
+    org_stats = {}
+    for series in ('new', 'active', 'total'):
+        org_series = _org_dataset_series(series, org_id=org_id,
+                                         granularity=granularity,
+                                         since=since, until=until)
+        for org, period_counts in org_series.items():
+            stats = org_stats.setdefault(
+                org, {'new': [], 'active': [], 'total': []})
+            stats[series] = _format_week_totals(period_counts,
+                                                timestamp=timestamp,
+                                                zero_week=False,
+                                                granularity=granularity)
+    return org_stats
 
 
-def get_weekly_dataset_activity(timestamp=True, zero_week=True):
-    '''For each week, get the number datasets with some sort of activity.'''
-    pkg_revisions = get_package_revisions()
+def get_weekly_new_dataset_totals(timestamp=True, zero_week=True,
+                                  granularity='week', since=None,
+                                  until=None):
+    '''For each week, return the cumulative total number of datasets.'''
+    return _dataset_series('total', timestamp=timestamp, zero_week=zero_week,
+                           granularity=granularity, since=since, until=until)
 
-    return _weekly_totals(pkg_revisions, timestamp=timestamp,
-                          zero_week=zero_week)
+
+def get_weekly_dataset_activity(timestamp=True, zero_week=True,
+                                granularity='week', since=None, until=None,
+                                distinct=None):
+    '''For each week, get the number datasets with some sort of activity.
+
+    By default each update is counted, set `distinct` to `exact` or
+    `approximate` to count each dataset once per week instead.
+    '''
+    return _dataset_series('active', timestamp=timestamp, zero_week=zero_week,
+                           granularity=granularity, since=since, until=until,
+                           distinct=distinct)
 
 
-def get_weekly_dataset_activity_new(timestamp=True, zero_week=True):
+def get_weekly_dataset_activity_new(timestamp=True, zero_week=True,
+                                    granularity='week', since=None,
+                                    until=None):
     '''For each week, get the number of new datasets.'''
-    new_datasets = get_new_datasets()
+    return _dataset_series('new', timestamp=timestamp, zero_week=zero_week,
+                           granularity=granularity, since=since, until=until)
+
+
+def _search_datasets(params):
+    '''
+    Run a raw query against the search index, limited to public active
+    datasets of this site, and return the decoded Solr response.
+    '''
+    from ckan.lib.search.common import make_connection
+
+    fq = u'+dataset_type:dataset +capacity:public +state:active ' \
+        u'+site_id:"{0}"'.format(config.get('ckan.site_id'))
+    if params.get('fq'):
+        fq = u'{0} {1}'.format(params['fq'], fq)
+
+    query = {'q': '*:*', 'rows': 0, 'wt': 'json'}
+    query.update(params)
+    query['fq'] = fq
+
+    conn = make_connection(decode_dates=False)
+    return json.loads(conn.raw_query(**query))
 
-    return _weekly_totals(new_datasets, timestamp=timestamp,
-                          zero_week=zero_week)
+
+def _homepage_dataset_dict(doc):
+    '''Return a Solr document as the subset of a package dict used by the
+    homepage dataset lists.'''
+    return {
+        'id': doc['id'],
+        'name': doc['name'],
+        'title': doc.get('title'),
+        'notes': doc.get('notes'),
+        'state': 'active',
+        'private': False,
+        'metadata_modified': doc.get('metadata_modified'),
+        'resources': [{'format': res_format}
+                      for res_format in doc.get('res_format', [])],
+        'tracking_summary': {'total': doc.get('views_total', 0),
+                             'recent': doc.get('views_recent', 0)},
+    }
+
+
+def _search_homepage_datasets(params):
+    params = dict(params, rows=HOMEPAGE_DATASET_ROWS,
+                  fl=HOMEPAGE_DATASET_FIELDS)
+    response = _search_datasets(params)
+    return [_homepage_dataset_dict(doc)
+            for doc in response['response']['docs']]
+
+
+def _build_homepage_datasets():
+    '''Return a dict mapping the names of `HOMEPAGE_DATASET_LISTS` to lists
+    of dataset dicts.
+
+    The most viewed datasets are taken from the most viewed ranking of the
+    `ckanext.sweden.homepage.most_viewed_period` period (default: `all`),
+    falling back to the search index if it hasn't been built.'''
+    period = config.get('ckanext.sweden.homepage.most_viewed_period', 'all')
+    ranking = get_most_viewed_ranking(period, limit=HOMEPAGE_DATASET_ROWS)
+
+    datasets = {}
+    for name, sort in HOMEPAGE_DATASET_LISTS.items():
+        if name == 'most_viewed' and ranking:
+            continue
+        datasets[name] = _search_homepage_datasets({'sort': sort})
+
+    if ranking:
+        ids = [dataset['id'] for dataset in ranking]
+        found = dict(
+            (dataset['id'], dataset) for dataset in _search_homepage_datasets(
+                {'fq': u'+id:({0})'.format(u' OR '.join(ids))}))
+        datasets['most_viewed'] = [found[pkg_id] for pkg_id in ids
+                                   if pkg_id in found]
+    return datasets
+
+
+def get_homepage_datasets():
+    '''
+    Return the most viewed and recently updated public datasets shown on the
+    homepage, as a dict with `most_viewed` and `recently_updated` lists.
+
+    Both lists are fetched straight from Solr with only the fields needed to
+    show them (the most viewed ones in the order of the most viewed ranking,
+    if it has been built), and cached for `ckanext.sweden.homepage.cache_ttl`
+    seconds (default: `300`), or until a dataset is created, updated or
+    deleted.
+    '''
+    ttl = toolkit.asint(config.get('ckanext.sweden.homepage.cache_ttl', 300))
+    return _homepage_datasets.get_or_set('datasets',
+                                         _build_homepage_datasets, ttl=ttl)
+
+
+def invalidate_homepage_datasets():
+    _homepage_datasets.invalidate()
+
+
+def _most_viewed_select(days=None):
+    '''
+    Return a select of (package_id, views) rows with the most viewed public
+    datasets, aggregated from the page views in `tracking_summary`.
+
+    If days is passed, only count the views of that many last days.
+    '''
+    tracking_summary = sources.table('tracking_summary')
+    package = sources.table('package')
+    views = func.sum(tracking_summary.c.count).label('views')
+    s = select([tracking_summary.c.package_id, views],
+               from_obj=[tracking_summary.join(
+                   package, package.c.id == tracking_summary.c.package_id)]).\
+        where(tracking_summary.c.tracking_type == 'page').\
+        where(package.c.type == 'dataset').\
+        where(package.c.state == 'active').\
+        where(package.c.private == false())
+    if days:
+        s = s.where(tracking_summary.c.tracking_date >=
+                    datetime.date.today() - datetime.timedelta(days=days))
+    return s.group_by(tracking_summary.c.package_id).\
+        order_by(views.desc(), tracking_summary.c.package_id).\
+        limit(MOST_VIEWED_LIMIT)
+
+
+def rebuild_most_viewed():
+    '''Recompute the `sweden_most_viewed` rankings of all the
+    `MOST_VIEWED_PERIODS` from the tracking data.'''
+    rankings = {}
+    for period, days in MOST_VIEWED_PERIODS.items():
+        rankings[period] = [
+            (row.package_id, row.views)
+            for row in model.Session.execute(_most_viewed_select(days))]
+    stats_model.rebuild_most_viewed(rankings)
+
+
+def get_most_viewed_ranking(period='all', limit=None):
+    '''
+    Return the most viewed datasets of the given period (one of
+    `MOST_VIEWED_PERIODS`) as a list of dicts with the `id`, `name`, `title`
+    and `views` of each, most viewed first.
+
+    The rankings are read from the `sweden_most_viewed` table, so they are
+    as recent as the last `sweden_stats most_viewed` run. An empty list is
+    returned if it hasn't been run yet.
+    '''
+    if period not in MOST_VIEWED_PERIODS:
+        raise ValueError('Unknown period: {0}'.format(period))
+    if not model.meta.engine.has_table(
+            stats_model.MostViewed.__tablename__):
+        return []
+
+    ranking = stats_model.get_most_viewed(period, limit=limit)
+    if not ranking:
+        return []
+    packages = dict(
+        (pkg.id, pkg) for pkg in model.Session.query(
+            model.Package.id, model.Package.name, model.Package.title).
+        filter(model.Package.id.in_([pkg_id for pkg_id, views in ranking])))
+    return [{'id': pkg_id,
+             'name': packages[pkg_id].name,
+             'title': packages[pkg_id].title,
+             'views': views}
+            for pkg_id, views in ranking if pkg_id in packages]
+
+
+def _group_image_display_url(image_url):
+    '''Return the full URL of a group image, which can be an uploaded
+    file.'''
+    if image_url and not image_url.startswith('http'):
+        return h.url_for_static('uploads/group/{0}'.format(image_url),
+                                qualified=True)
+    return image_url
+
+
+def _build_top_groups():
+    '''
+    Return the `TOP_GROUPS_LIMIT` groups with the most public datasets, from
+    the `groups` facet of the search index, with their titles and images
+    read in a single query.
+    '''
+    response = _search_datasets({'facet': 'true',
+                                 'facet.field': 'groups',
+                                 'facet.mincount': 1,
+                                 'facet.limit': TOP_GROUPS_LIMIT})
+    # Solr returns the facet counts as a flat [value, count, ...] list
+    facet = response['facet_counts']['facet_fields']['groups']
+    counts = zip(facet[::2], facet[1::2])
+    if not counts:
+        return []
+
+    groups = dict(
+        (group.name, group) for group in model.Session.query(
+            model.Group.name, model.Group.title, model.Group.image_url).
+        filter(model.Group.name.in_([name for name, count in counts])).
+        filter(model.Group.state == 'active').
+        filter(model.Group.is_organization == false()))
+    return [{'name': name,
+             'title': groups[name].title or name,
+             'image_display_url':
+                 _group_image_display_url(groups[name].image_url),
+             'package_count': count}
+            for name, count in counts if name in groups]
+
+
+def get_top_groups(limit=5):
+    '''
+    Return the groups with the most public datasets as a list of dicts with
+    the `name`, `title`, `image_display_url` and `package_count` of each,
+    largest first.
+
+    The ranking is cached for `ckanext.sweden.homepage.cache_ttl` seconds
+    (default: `300`), or until a group or its members change.
+    '''
+    ttl = toolkit.asint(config.get('ckanext.sweden.homepage.cache_ttl', 300))
+    top_groups = _top_groups.get_or_set('groups', _build_top_groups,
+                                        ttl=ttl)
+    return top_groups[:limit]
+
+
+def invalidate_top_groups():
+    '''Clear the cached top groups.'''
+    _top_groups.invalidate()
+
+
+def _range_facet_week_counts(counts):
+    '''
+    Turn the flat [date, count, date, count, ...] list of a weekly Solr range
+    facet into a list of (week start date, count) pairs, skipping empty weeks.
+    '''
+    week_counts = []
+    for week, count in zip(counts[::2], counts[1::2]):
+        if count:
+            week_start = datetime.datetime.strptime(
+                week, SOLR_DATE_FORMAT).date()
+            week_counts.append((week_start, count))
+    return week_counts
+
+
+def get_eurovoc_label_week_counts():
+    '''
+    Return a dict mapping each eurovoc category label (that has at least one
+    dataset) to a list of (week start date, count) pairs with the number of
+    datasets created in each week.
+
+    On Solr 5.0 or later this is a single query, with a weekly range facet
+    over `metadata_created` pivoted by category. Older versions reject range
+    pivots, in which case the labels are read from a plain facet and a range
+    facet query is run for each category instead.
+    '''
+    from solr import SolrException
+
+    range_params = {
+        'facet': 'true',
+        'facet.mincount': 1,
+        'facet.limit': -1,
+        'facet.range.start': FACET_RANGE_START,
+        'facet.range.end': 'NOW',
+        'facet.range.gap': '+7DAYS',
+    }
+
+    params = {
+        'facet.range': '{!tag=weekly}metadata_created',
+        'facet.pivot': '{!range=weekly}eurovoc_category_label',
+    }
+    params.update(range_params)
+    try:
+        response = _search_datasets(params)
+    except SolrException, e:
+        # Solr 4 answers "Pivot Facet needs at least two fields"
+        log.debug('Range pivots not supported, falling back to a query per '
+                  'category: {0}'.format(e))
+    else:
+        pivots = response['facet_counts'].get('facet_pivot', {}).get(
+            'eurovoc_category_label', [])
+        if all('ranges' in pivot for pivot in pivots):
+            return dict(
+                (pivot['value'], _range_facet_week_counts(
+                    pivot['ranges']['metadata_created']['counts']))
+                for pivot in pivots)
+
+    # Older Solr, one query per category.
+    response = _search_datasets({'facet': 'true',
+                                 'facet.field': 'eurovoc_category_label',
+                                 'facet.mincount': 1,
+                                 'facet.limit': -1})
+    facet = response['facet_counts']['facet_fields']['eurovoc_category_label']
+    label_week_counts = {}
+    for label in facet[::2]:
+        params = {
+            'fq': u'+eurovoc_category_label:"{0}"'.format(label),
+            'facet.range': 'metadata_created',
+        }
+        params.update(range_params)
+        response = _search_datasets(params)
+        counts = response['facet_counts']['facet_ranges'][
+            'metadata_created']['counts']
+        label_week_counts[label] = _range_facet_week_counts(counts)
+    return label_week_counts
+
+
+def _build_category_index():
+    '''
+    Return the active eurovoc category labels, the running total of their
+    dataset counts (for weighted picks) and their cumulative weekly series.
+    '''
+    label_week_counts = get_eurovoc_label_week_counts()
+    labels = sorted(label_week_counts)
+    cumulative_counts = []
+    series = {}
+    total = 0
+    for label in labels:
+        week_counts = label_week_counts[label]
+        total += sum(count for week, count in week_counts)
+        cumulative_counts.append(total)
+        series[label] = _cumulative(week_counts)
+    return {'labels': labels,
+            'cumulative_counts': cumulative_counts,
+            'series': series}
+
+
+def get_category_index():
+    '''
+    Return the cached index of active eurovoc categories built by
+    `_build_category_index`, refreshing it if it has expired.
+
+    The index expires after `ckanext.sweden.stats.cache_ttl` seconds, and
+    whenever a dataset is created, updated or deleted.
+    '''
+    ttl = toolkit.asint(config.get('ckanext.sweden.stats.cache_ttl', 3600))
+    return _category_index.get_or_set('index', _build_category_index,
+                                      ttl=ttl)
+
+
+def invalidate_category_index():
+    _category_index.invalidate()
+
+
+def get_weekly_new_dataset_totals_by_eurovoc_label(timestamp=True,
+                                                   zero_week=True):
+    '''
+    For each eurovoc category label, return the cumulative total number of
+    weekly new datasets, as a dict mapping labels to lists of (date, total)
+    pairs.
+    '''
+    totals = {}
+    for label, week_totals in get_category_index()['series'].items():
+        totals[label] = _format_week_totals(week_totals, timestamp=timestamp,
+                                            zero_week=zero_week)
+    return totals
 
 
 def get_weekly_new_dataset_totals_for_eurovoc_label(eurovoc_label,
@@ -84,46 +788,98 @@ def get_weekly_new_dataset_totals_for_eurovoc_label(eurovoc_label,
     For a given eurovoc category label, return the cumulative total number of
     weekly new datasets.
     '''
-    # get package ids for packages with the relevant eurovoc category.
-    pkgs = toolkit.get_action('package_search')(
-        data_dict={'fq':
-                   u'+eurovoc_category_label:"{0}"'.format(eurovoc_label)}
-    )
-    pkg_ids = [pkg['id'] for pkg in pkgs['results']]
+    week_totals = get_category_index()['series'].get(eurovoc_label, [])
 
-    # get a list of (package_revision id, datetime) for the passed package ids
-    new_datasets_for_pkg_ids = get_new_datasets(pkg_ids=pkg_ids)
+    return _format_week_totals(week_totals, timestamp=timestamp,
+                               zero_week=zero_week)
 
-    return _weekly_totals(new_datasets_for_pkg_ids, timestamp=timestamp,
-                          cumulative=True,
-                          zero_week=zero_week)
 
-
-def get_random_active_eurovoc_label():
+def get_random_active_eurovoc_label(weighted=False):
     '''
     Return a eurovoc category label randomly picked from a list of eurovoc
     categories (that have at least one dataset, otherwise the chart will have
     nothing to show).
-    '''
-    # get active eurovoc category labels from package search
-    search_results = toolkit.get_action('package_search')(
-        data_dict={'facet.field': ['eurovoc_category_label']}
-    )
-    facets = search_results.get('facets')
-    facet_labels = [key for key in facets['eurovoc_category_label'].keys()]
 
-    try:
-        return random.choice(facet_labels)
-    except IndexError:
+    If weighted is True, categories with more datasets are more likely to be
+    picked.
+    '''
+    index = get_category_index()
+    if not index['labels']:
         return None
 
+    if weighted:
+        counts = index['cumulative_counts']
+        position = bisect.bisect_right(counts, random.random() * counts[-1])
+        return index['labels'][position]
+    return random.choice(index['labels'])
+
+
+def _chart_series(chart):
+    '''Return the series of one of the homepage `CHARTS`, as a list of
+    {'label': ..., 'data': [[timestamp, count], ...]} dicts.'''
+    if chart == 'growth':
+        return [{'label': None, 'data': get_weekly_new_dataset_totals()}]
+    elif chart == 'activity':
+        return [{'label': 'All activity',
+                 'data': get_weekly_dataset_activity()},
+                {'label': 'New datasets',
+                 'data': get_weekly_dataset_activity_new()}]
+    else:
+        eurovoc_label = get_random_active_eurovoc_label()
+        if not eurovoc_label:
+            return []
+        return [{'label': eurovoc_label,
+                 'data': get_weekly_new_dataset_totals_for_eurovoc_label(
+                     eurovoc_label=eurovoc_label)}]
+
+
+def get_chart_data(chart, points=None):
+    '''
+    Return the series of one of the homepage `CHARTS`, ready to be plotted.
+
+    If `points` is given, each series is downsampled to that number of
+    points with `largest_triangle_three_buckets`.
+
+    The growth and activity series are cached like the category index. The
+    category chart features a random category on each call, so it is not
+    cached (the category index it is built from is).
+    '''
+    if chart not in CHARTS:
+        raise ValueError('Unknown chart: {0}'.format(chart))
+
+    if chart == 'category':
+        series = _chart_series(chart)
+    else:
+        ttl = toolkit.asint(
+            config.get('ckanext.sweden.stats.cache_ttl', 3600))
+        series = _chart_cache.get_or_set(
+            chart, lambda: _chart_series(chart), ttl=ttl)
+
+    chart_data = []
+    for line in series:
+        label = line['label']
+        if label and chart != 'category':
+            label = toolkit._(label)
+        data = line['data']
+        if points:
+            data = largest_triangle_three_buckets(data, points)
+        chart_data.append({'label': label, 'data': data})
+    return chart_data
+
+
+def invalidate_chart_cache():
+    _chart_cache.invalidate()
+
 
 def _weekly_totals(id_date_list, cumulative=False, timestamp=False,
-                   zero_week=True):
+                   zero_week=True, granularity='week'):
     '''
     For a list of (id, datetime) tuples, count the number of ids in each
     weekly batch (starting Monday).
 
+    Other batch lengths can be used by passing `day` or `month` as
+    granularity.
+
     If cumulative is True, add previous counts to the total for each
     subsequent timestamp (e.g. to determine growth).
 
@@ -135,17 +891,32 @@ def _weekly_totals(id_date_list, cumulative=False, timestamp=False,
     datetime.
 
     e.g.: [(1429488000000, 8), (1430092800000, 10), (1430697600000, 13)]
+
+    If numpy is installed, the batches are counted with array operations by
+    `_weekly_totals_numpy`.
     '''
+    if numpy is not None and id_date_list:
+        return _weekly_totals_numpy(id_date_list, cumulative=cumulative,
+                                    timestamp=timestamp, zero_week=zero_week,
+                                    granularity=granularity)
+    return _weekly_totals_python(id_date_list, cumulative=cumulative,
+                                 timestamp=timestamp, zero_week=zero_week,
+                                 granularity=granularity)
+
 
+def _weekly_totals_python(id_date_list, cumulative=False, timestamp=False,
+                          zero_week=True, granularity='week'):
+    '''Pure Python implementation of `_weekly_totals`.'''
     if zero_week:
         first_date = id_date_list[0][1]
-        previous_week = first_date - datetime.timedelta(weeks=1)
-        previous_week_start = _transform_to_week_start(previous_week)
+        previous_week_start = _previous_period_start(
+            _transform_to_period_start(first_date, granularity), granularity)
         if timestamp:
             previous_week_start = _datetime_to_timestamp(previous_week_start)
 
     # transform each datetime to its week start and convert to timestamp
-    ids_week_start = [(pkg_id, _transform_to_week_start(date_time))
+    ids_week_start = [(pkg_id,
+                       _transform_to_period_start(date_time, granularity))
                       for pkg_id, date_time in id_date_list]
 
     if timestamp:
@@ -168,6 +939,73 @@ def _weekly_totals(id_date_list, cumulative=False, timestamp=False,
     return week_totals
 
 
+def _weekly_totals_numpy(id_date_list, cumulative=False, timestamp=False,
+                         zero_week=True, granularity='week'):
+    '''
+    Array based implementation of `_weekly_totals`, for large lists.
+
+    The dates are floored to the start of their period as day numbers since
+    the epoch, and counted with `numpy.unique`, so there is no per row Python
+    work apart from building the array.
+    '''
+    dates = numpy.array([date_time for _id, date_time in id_date_list],
+                        dtype='datetime64[us]')
+    if granularity == 'month':
+        # Months since January 1970
+        periods = dates.astype('datetime64[M]').astype('int64')
+    else:
+        # Days since 1 January 1970, which was a Thursday
+        periods = dates.astype('datetime64[D]').astype('int64')
+        if granularity == 'week':
+            periods -= (periods + 3) % 7
+
+    period_starts, counts = numpy.unique(periods, return_counts=True)
+    if cumulative:
+        counts = numpy.cumsum(counts)
+
+    epoch = datetime.date(1970, 1, 1)
+    if granularity == 'month':
+        starts = [datetime.date(1970 + int(months) // 12, int(months) % 12 + 1,
+                                1)
+                  for months in period_starts]
+    else:
+        starts = [epoch + datetime.timedelta(days=int(days))
+                  for days in period_starts]
+
+    return _format_week_totals(zip(starts, [int(c) for c in counts]),
+                               timestamp=timestamp, zero_week=zero_week,
+                               granularity=granularity)
+
+
+def _format_week_totals(week_totals, timestamp=False, zero_week=True,
+                        granularity='week'):
+    '''
+    Format a list of already aggregated (week start date, count) pairs the
+    same way as `_weekly_totals` does.
+    '''
+    week_totals = list(week_totals)
+
+    if zero_week and week_totals:
+        week_totals.insert(0, (_previous_period_start(week_totals[0][0],
+                                                      granularity), 0))
+
+    if timestamp:
+        week_totals = [(_datetime_to_timestamp(week), count)
+                       for week, count in week_totals]
+
+    return week_totals
+
+
+def _cumulative(week_counts):
+    '''Add previous counts to each count of a list of (week, count) pairs.'''
+    week_totals = []
+    total = 0
+    for week, count in week_counts:
+        total += count
+        week_totals.append((week, total))
+    return week_totals
+
+
 def _datetime_to_timestamp(dt):
     '''Convert given datetime object to a timestamp in milliseconds'''
     return calendar.timegm(dt.timetuple()) * 1000
@@ -186,3 +1024,24 @@ def _transform_to_week_start(dt):
     iso_year, iso_week, _ = dt.isocalendar()
     year_start = _iso_year_start(iso_year)
     return year_start + datetime.timedelta(weeks=iso_week-1)
+
+
+def _transform_to_period_start(dt, granularity='week'):
+    '''Rewind the given datetime to the start of the day, week (Monday) or
+    month in which it resides.'''
+    if granularity == 'day':
+        return datetime.date(dt.year, dt.month, dt.day)
+    elif granularity == 'month':
+        return datetime.date(dt.year, dt.month, 1)
+    return _transform_to_week_start(dt)
+
+
+def _previous_period_start(period_start, granularity='week'):
+    '''Return the start of the day, week or month before the one starting
+    at the given date.'''
+    if granularity == 'day':
+        return period_start - datetime.timedelta(days=1)
+    elif granularity == 'month':
+        previous = period_start - datetime.timedelta(days=1)
+        return datetime.date(previous.year, previous.month, 1)
+    return period_start - datetime.timedelta(weeks=1)
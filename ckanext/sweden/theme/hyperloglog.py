@@ -0,0 +1,64 @@
+import hashlib
+import math
+
+DEFAULT_PRECISION = 12
+
+
+class HyperLogLog(object):
+    '''
+    A HyperLogLog sketch, to estimate the number of distinct values added to
+    it using a fixed amount of memory (2 ** precision bytes).
+
+    Sketches can be merged, so the number of distinct values of several
+    sketches (e.g. the weeks of a quarter) can be estimated without going
+    back to the values themselves. With the default precision the standard
+    error is about 1.6%.
+    '''
+
+    def __init__(self, registers=None, precision=DEFAULT_PRECISION):
+        self.precision = precision
+        self.size = 1 << precision
+        if registers is None:
+            self.registers = bytearray(self.size)
+        else:
+            self.registers = bytearray(registers)
+            if len(self.registers) != self.size:
+                raise ValueError('Expected {0} registers, got {1}'.format(
+                    self.size, len(self.registers)))
+
+    def add(self, value):
+        if isinstance(value, unicode):
+            value = value.encode('utf-8')
+        # 64 bits of the hash: the first bits select the register, the
+        # position of the first 1 bit in the rest is the rank.
+        hashed = int(hashlib.sha1(value).hexdigest()[:16], 16)
+        bits = 64 - self.precision
+        index = hashed >> bits
+        rank = bits - (hashed & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        '''Add all the values counted by another sketch to this one.'''
+        if other.precision != self.precision:
+            raise ValueError('Cannot merge sketches of different precision')
+        self.registers = bytearray(
+            max(a, b) for a, b in zip(self.registers, other.registers))
+
+    def count(self):
+        '''Return the estimated number of distinct values added.'''
+        alpha = 0.7213 / (1 + 1.079 / self.size)
+        estimate = alpha * self.size ** 2 / sum(
+            2.0 ** -register for register in self.registers)
+        empty = sum(1 for register in self.registers if register == 0)
+        if estimate <= 2.5 * self.size and empty:
+            # Small range correction
+            estimate = self.size * math.log(float(self.size) / empty)
+        return int(round(estimate))
+
+    def to_bytes(self):
+        return str(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data, precision=DEFAULT_PRECISION):
+        return cls(registers=data, precision=precision)
@@ -1,7 +1,46 @@
+import datetime
+
 import ckan.plugins.toolkit as toolkit
 
 from ckanext.sweden.theme import helpers
 
+GRANULARITIES = ('day', 'week', 'month')
+
+
+def _parse_date(data_dict, key):
+    '''
+    Return the given key of data_dict as a date. It can either be an ISO 8601
+    date (e.g. `2015-01-31`) or a timestamp in millisecs, like the ones
+    returned by the stats actions.
+    '''
+    value = data_dict.get(key)
+    if value in (None, ''):
+        return None
+    try:
+        if unicode(value).isdigit():
+            return datetime.datetime.utcfromtimestamp(
+                int(value) / 1000).date()
+        return datetime.datetime.strptime(
+            unicode(value)[:10], '%Y-%m-%d').date()
+    except ValueError:
+        raise toolkit.ValidationError(
+            {key: [toolkit._('Invalid date: {0}').format(value)]})
+
+
+def _period_params(data_dict):
+    '''Return the since, until and granularity parameters shared by the
+    stats actions.'''
+    granularity = data_dict.get('granularity') or 'week'
+    if granularity not in GRANULARITIES:
+        raise toolkit.ValidationError(
+            {'granularity': [toolkit._('Must be one of: {0}').format(
+                ', '.join(GRANULARITIES))]})
+    return {
+        'granularity': granularity,
+        'since': _parse_date(data_dict, 'since'),
+        'until': _parse_date(data_dict, 'until'),
+    }
+
 
 @toolkit.side_effect_free
 def total_datasets_by_week(context, data_dict):
@@ -9,10 +48,18 @@ def total_datasets_by_week(context, data_dict):
     Return a list of [datetime, count] pairs where the datetime is the start
     of a week (Monday), and the count is the total number of datasets in that
     week. `datetime` is a timestamp in millisecs.
+
+    :param since: only return the periods starting on or after this date, an
+        ISO 8601 date or a timestamp in millisecs (optional)
+    :param until: only return the periods starting on or before this date
+        (optional)
+    :param granularity: the length of the periods: ``day``, ``week``
+        (default) or ``month``
     '''
     toolkit.check_access('sweden_stats_show', context, data_dict)
 
-    return helpers.get_weekly_new_dataset_totals(zero_week=False)
+    return helpers.get_weekly_new_dataset_totals(zero_week=False,
+                                                 **_period_params(data_dict))
 
 
 @toolkit.side_effect_free
@@ -21,10 +68,27 @@ def weekly_dataset_activity(context, data_dict):
     Return a list of [datetime, count] pairs where the datetime is the start
     of a week (Monday), and the count is the number of updated datasets in
     that week. `datetime` is a timestamp in millisecs.
+
+    :param since: only return the periods starting on or after this date, an
+        ISO 8601 date or a timestamp in millisecs (optional)
+    :param until: only return the periods starting on or before this date
+        (optional)
+    :param granularity: the length of the periods: ``day``, ``week``
+        (default) or ``month``
+    :param distinct: count each dataset only once per period instead of
+        counting every update: ``exact`` counts them, ``approximate``
+        estimates them from pre-aggregated weekly sketches (optional)
     '''
     toolkit.check_access('sweden_stats_show', context, data_dict)
 
-    return helpers.get_weekly_dataset_activity(zero_week=False)
+    distinct = data_dict.get('distinct') or None
+    if distinct not in (None, 'exact', 'approximate'):
+        raise toolkit.ValidationError(
+            {'distinct': [toolkit._('Must be one of: exact, approximate')]})
+
+    return helpers.get_weekly_dataset_activity(zero_week=False,
+                                               distinct=distinct,
+                                               **_period_params(data_dict))
 
 
 @toolkit.side_effect_free
@@ -33,7 +97,137 @@ def weekly_dataset_activity_new(context, data_dict):
     Return a list of [datetime, count] pairs where the datetime is the start
     of a week (Monday), and the count is the number of new datasets added in
     that week. `datetime` is a timestamp in millisecs.
+
+    :param since: only return the periods starting on or after this date, an
+        ISO 8601 date or a timestamp in millisecs (optional)
+    :param until: only return the periods starting on or before this date
+        (optional)
+    :param granularity: the length of the periods: ``day``, ``week``
+        (default) or ``month``
+    '''
+    toolkit.check_access('sweden_stats_show', context, data_dict)
+
+    return helpers.get_weekly_dataset_activity_new(zero_week=False,
+                                                   **_period_params(data_dict))
+
+
+@toolkit.side_effect_free
+def distinct_active_datasets(context, data_dict):
+    '''
+    Return the number of distinct datasets updated in a range of weeks, as a
+    dict with the `count` and whether it is `approximate`.
+
+    The count is estimated from pre-aggregated weekly sketches when the
+    `sweden_weekly_stats` table is enabled, and exact otherwise.
+
+    :param since: only count the weeks starting on or after this date, an
+        ISO 8601 date or a timestamp in millisecs (optional)
+    :param until: only count the weeks starting on or before this date
+        (optional)
+    '''
+    toolkit.check_access('sweden_stats_show', context, data_dict)
+
+    return helpers.get_distinct_active_datasets(
+        since=_parse_date(data_dict, 'since'),
+        until=_parse_date(data_dict, 'until'))
+
+
+@toolkit.side_effect_free
+def weekly_dataset_totals_by_eurovoc_label(context, data_dict):
+    '''
+    Return a dict mapping each eurovoc category label to a list of
+    [datetime, count] pairs where the datetime is the start of a week
+    (Monday), and the count is the total number of datasets in that category
+    in that week. `datetime` is a timestamp in millisecs.
     '''
     toolkit.check_access('sweden_stats_show', context, data_dict)
 
-    return helpers.get_weekly_dataset_activity_new(zero_week=False)
+    return helpers.get_weekly_new_dataset_totals_by_eurovoc_label(
+        zero_week=False)
+
+
+@toolkit.side_effect_free
+def sweden_org_weekly_stats(context, data_dict):
+    '''
+    Return the weekly dataset stats of each organization, as a dict mapping
+    organization names to dicts with three lists of [datetime, count] pairs:
+    `new` (datasets created in the week), `active` (dataset updates in the
+    week) and `total` (the organization's total number of datasets in the
+    week). `datetime` is a timestamp in millisecs.
+
+    :param id: the id or name of an organization, to only return its stats
+        (optional)
+    :param since: only return the periods starting on or after this date, an
+        ISO 8601 date or a timestamp in millisecs (optional)
+    :param until: only return the periods starting on or before this date
+        (optional)
+    :param granularity: the length of the periods: ``day``, ``week``
+        (default) or ``month``
+    '''
+    toolkit.check_access('sweden_stats_show', context, data_dict)
+
+    org_id = None
+    if data_dict.get('id'):
+        convert_group_name_or_id_to_id = toolkit.get_converter(
+            'convert_group_name_or_id_to_id')
+        try:
+            org_id = convert_group_name_or_id_to_id(data_dict['id'], context)
+        except toolkit.Invalid:
+            raise toolkit.ObjectNotFound(toolkit._('Organization not found'))
+
+    return helpers.get_org_weekly_stats(org_id=org_id,
+                                        **_period_params(data_dict))
+
+
+@toolkit.side_effect_free
+def sweden_most_viewed(context, data_dict):
+    '''
+    Return the most viewed public datasets, as a list of dicts with the
+    `id`, `name`, `title` and `views` of each, most viewed first.
+
+    The rankings are updated by the `sweden_stats most_viewed` paster
+    command.
+
+    :param period: count the views of ``all`` time (default), or of the last
+        30 days (``30d``) or 7 days (``7d``)
+    :param limit: the maximum number of datasets to return (default: 10)
+    '''
+    toolkit.check_access('sweden_stats_show', context, data_dict)
+
+    period = data_dict.get('period') or 'all'
+    if period not in helpers.MOST_VIEWED_PERIODS:
+        raise toolkit.ValidationError(
+            {'period': [toolkit._('Must be one of: {0}').format(
+                ', '.join(sorted(helpers.MOST_VIEWED_PERIODS)))]})
+    try:
+        limit = int(data_dict.get('limit') or 10)
+        if limit < 1:
+            raise ValueError
+    except ValueError:
+        raise toolkit.ValidationError(
+            {'limit': [toolkit._('Must be a positive integer')]})
+
+    return helpers.get_most_viewed_ranking(period, limit=limit)
+
+
+@toolkit.side_effect_free
+def sweden_top_groups(context, data_dict):
+    '''
+    Return the groups with the most public datasets, as a list of dicts with
+    the `name`, `title`, `image_display_url` and `package_count` of each,
+    largest first.
+
+    :param limit: the maximum number of groups to return (default: 5, at
+        most 20)
+    '''
+    toolkit.check_access('sweden_stats_show', context, data_dict)
+
+    try:
+        limit = int(data_dict.get('limit') or 5)
+        if limit < 1:
+            raise ValueError
+    except ValueError:
+        raise toolkit.ValidationError(
+            {'limit': [toolkit._('Must be a positive integer')]})
+
+    return helpers.get_top_groups(limit=limit)
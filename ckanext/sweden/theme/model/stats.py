@@ -0,0 +1,240 @@
+from sqlalchemy import Column
+from sqlalchemy import types
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.declarative import declarative_base
+
+import ckan.model as model
+
+from ckanext.sweden.theme.hyperloglog import HyperLogLog
+
+log = __import__('logging').getLogger(__name__)
+
+Base = declarative_base()
+
+
+class WeeklyStats(Base):
+    '''
+    Pre-aggregated dataset statistics for a single week (starting Monday).
+
+    `new` is the number of datasets created in the week, `active` the number
+    of dataset revisions in the week and `total` the cumulative number of
+    datasets at the end of the week. `active_sketch` is a HyperLogLog sketch
+    of the ids of the datasets with revisions in the week.
+    '''
+    __tablename__ = 'sweden_weekly_stats'
+
+    week_start = Column(types.Date, primary_key=True)
+    new = Column(types.Integer, nullable=False, default=0)
+    active = Column(types.Integer, nullable=False, default=0)
+    total = Column(types.Integer, nullable=False, default=0)
+    active_sketch = Column(types.LargeBinary)
+
+    def __init__(self, week_start, new=0, active=0, total=0,
+                 active_sketch=None):
+        self.week_start = week_start
+        self.new = new
+        self.active = active
+        self.total = total
+        self.active_sketch = active_sketch
+
+    def add_active_dataset(self, pkg_id):
+        sketch = self.get_active_sketch()
+        sketch.add(pkg_id)
+        self.active_sketch = sketch.to_bytes()
+
+    def get_active_sketch(self):
+        if self.active_sketch is None:
+            return HyperLogLog()
+        return HyperLogLog.from_bytes(self.active_sketch)
+
+    @classmethod
+    def get(cls, week_start):
+        return model.Session.query(cls).\
+            filter(cls.week_start == week_start).first()
+
+    def __repr__(self):
+        return u"<WeeklyStats: %s, new:%s, active:%s, total:%s>" % (
+            self.week_start, self.new, self.active, self.total)
+
+
+class MostViewed(Base):
+    '''
+    A dataset in the most viewed ranking of a period (`all`, `30d` or `7d`),
+    aggregated from the `tracking_summary` table by `sweden_stats
+    most_viewed`. `views` is the number of page views of the dataset in the
+    period.
+    '''
+    __tablename__ = 'sweden_most_viewed'
+
+    period = Column(types.Unicode(8), primary_key=True)
+    rank = Column(types.Integer, primary_key=True, autoincrement=False)
+    package_id = Column(types.UnicodeText, nullable=False)
+    views = Column(types.Integer, nullable=False)
+
+    def __init__(self, period, rank, package_id, views):
+        self.period = period
+        self.rank = rank
+        self.package_id = package_id
+        self.views = views
+
+    def __repr__(self):
+        return u"<MostViewed: %s #%s, %s (%s views)>" % (
+            self.period, self.rank, self.package_id, self.views)
+
+
+def _add_week(week_start):
+    '''Add the stats row for the given week, starting with the cumulative
+    total of the closest previous week. Does nothing if another transaction
+    added it first.'''
+    previous = model.Session.query(WeeklyStats).\
+        filter(WeeklyStats.week_start < week_start).\
+        order_by(WeeklyStats.week_start.desc()).\
+        first()
+    savepoint = model.Session.begin_nested()
+    try:
+        model.Session.add(WeeklyStats(
+            week_start, total=previous.total if previous else 0))
+        savepoint.commit()
+    except IntegrityError:
+        savepoint.rollback()
+        log.debug('Weekly stats for {0} added concurrently'.format(
+            week_start))
+
+
+def _lock_week(week_start):
+    '''Return the stats row for the given week, adding it if needed.
+
+    The row is locked until the end of the transaction, so concurrent
+    changes to the same week wait for each other instead of overwriting
+    each other's counts.
+    '''
+    for attempt in range(3):
+        stats = model.Session.query(WeeklyStats).\
+            filter(WeeklyStats.week_start == week_start).\
+            with_for_update().\
+            first()
+        if stats is not None:
+            return stats
+        _add_week(week_start)
+    raise RuntimeError('Could not add the weekly stats for {0}'.format(
+        week_start))
+
+
+def record_new_dataset(week_start, pkg_id):
+    '''Count a dataset created in the given week.
+
+    This is called from within the action that creates the dataset, so it
+    is committed (or rolled back) along with it.
+    '''
+    stats = _lock_week(week_start)
+    stats.new += 1
+    stats.active += 1
+    stats.total += 1
+    stats.add_active_dataset(pkg_id)
+    # Any later weeks (e.g. after a rebuild) also grow by one.
+    model.Session.query(WeeklyStats).\
+        filter(WeeklyStats.week_start > week_start).\
+        update({WeeklyStats.total: WeeklyStats.total + 1},
+               synchronize_session=False)
+
+
+def record_dataset_activity(week_start, pkg_id):
+    '''Count a dataset revision made in the given week.'''
+    stats = _lock_week(week_start)
+    stats.active += 1
+    stats.add_active_dataset(pkg_id)
+
+
+def rebuild(new_weeks, active_weeks, active_ids):
+    '''Replace all stats rows.
+
+    `new_weeks` and `active_weeks` are lists of (week_start, count) pairs,
+    as returned by `ckanext.sweden.theme.helpers._weekly_totals`.
+    `active_ids` is an iterable of (week_start, dataset id) pairs, used to
+    build the sketches of distinct active datasets.
+    '''
+    new_weeks = dict(new_weeks)
+    active_weeks = dict(active_weeks)
+    sketches = {}
+    for week_start, pkg_id in active_ids:
+        sketches.setdefault(week_start, HyperLogLog()).add(pkg_id)
+
+    model.Session.query(WeeklyStats).delete()
+    total = 0
+    for week_start in sorted(set(new_weeks) | set(active_weeks)):
+        total += new_weeks.get(week_start, 0)
+        sketch = sketches.get(week_start)
+        model.Session.add(WeeklyStats(
+            week_start,
+            new=new_weeks.get(week_start, 0),
+            active=active_weeks.get(week_start, 0),
+            total=total,
+            active_sketch=sketch.to_bytes() if sketch else None))
+    model.Session.commit()
+
+
+def get_weekly_stats(column, since=None, until=None):
+    '''
+    Return a list of (week_start, count) pairs for the given column (one of
+    `new`, `active` or `total`), ordered by week. `since` and `until` limit
+    the results to the weeks starting between these dates.
+
+    Only weeks that had some activity for the series are returned: `new` and
+    `total` skip weeks without new datasets and `active` skips weeks without
+    revisions, as the live queries do.
+    '''
+    count = getattr(WeeklyStats, column)
+    q = model.Session.query(WeeklyStats.week_start, count)
+    if column == 'active':
+        q = q.filter(WeeklyStats.active > 0)
+    else:
+        q = q.filter(WeeklyStats.new > 0)
+    if since is not None:
+        q = q.filter(WeeklyStats.week_start >= since)
+    if until is not None:
+        q = q.filter(WeeklyStats.week_start <= until)
+    return q.order_by(WeeklyStats.week_start).all()
+
+
+def get_weekly_sketches(since=None, until=None):
+    '''
+    Return a list of (week_start, HyperLogLog) pairs with the sketches of
+    distinct active datasets of the weeks with revisions, ordered by week.
+    '''
+    q = model.Session.query(WeeklyStats).filter(WeeklyStats.active > 0)
+    if since is not None:
+        q = q.filter(WeeklyStats.week_start >= since)
+    if until is not None:
+        q = q.filter(WeeklyStats.week_start <= until)
+    return [(stats.week_start, stats.get_active_sketch())
+            for stats in q.order_by(WeeklyStats.week_start)]
+
+
+def rebuild_most_viewed(rankings):
+    '''Replace the most viewed rankings.
+
+    `rankings` is a dict mapping each period to a list of (dataset id,
+    views) pairs, most viewed first.
+    '''
+    model.Session.query(MostViewed).delete()
+    for period, ranking in rankings.items():
+        for rank, (pkg_id, views) in enumerate(ranking, 1):
+            model.Session.add(MostViewed(period, rank, pkg_id, views))
+    model.Session.commit()
+
+
+def get_most_viewed(period, limit=None):
+    '''
+    Return a list of (dataset id, views) pairs with the most viewed datasets
+    of the given period, most viewed first.
+    '''
+    q = model.Session.query(MostViewed.package_id, MostViewed.views).\
+        filter(MostViewed.period == period).\
+        order_by(MostViewed.rank)
+    if limit:
+        q = q.limit(limit)
+    return q.all()
+
+
+def init_tables(e):
+    Base.metadata.create_all(e)
@@ -0,0 +1,101 @@
+from webob import Request
+
+from ckanext.sweden.theme.fragmentcache import LRUBackend
+
+# The pages that are cached for anonymous users, and the query string
+# parameters they can be cached with. Requests with any other parameters
+# are not cached, so they can't be used to fill the cache.
+PAGE_CACHE_PATHS = {
+    '/': (),
+    '/news': ('before', 'after'),
+}
+
+# Cookies set for logged in users (or users with flash messages pending)
+SESSION_COOKIES = ('auth_tkt', 'ckan')
+
+_page_cache = LRUBackend(max_entries=200)
+
+
+def configure(max_entries):
+    '''Keep at most `max_entries` pages in the cache, dropping the least
+    recently used ones.'''
+    global _page_cache
+    _page_cache = LRUBackend(max_entries=max_entries)
+
+
+def purge():
+    '''Remove all the cached pages.'''
+    _page_cache.clear()
+
+
+class PageCacheMiddleware(object):
+    '''
+    Cache the pages in `PAGE_CACHE_PATHS` for anonymous users, so they are
+    rendered at most once every `ttl` seconds for each language and query
+    string.
+
+    Only successful HTML responses without cookies are cached. Requests from
+    logged in users, or with query string parameters not allowed for the
+    page, always go through. The cache is local to each process, and holds a
+    limited number of pages; `purge` empties it when the content of the
+    pages changes.
+    '''
+
+    def __init__(self, app, ttl=300):
+        self.app = app
+        self.ttl = ttl
+
+    def _is_cacheable_request(self, environ):
+        if environ['REQUEST_METHOD'] != 'GET':
+            return False
+        params = PAGE_CACHE_PATHS.get(environ.get('PATH_INFO'))
+        if params is None:
+            return False
+        if environ.get('REMOTE_USER'):
+            return False
+        request = Request(environ)
+        if any(name not in params for name in request.GET):
+            return False
+        return not any(name in request.cookies for name in SESSION_COOKIES)
+
+    def _is_cacheable_response(self, status, headers):
+        if not status.startswith('200'):
+            return False
+        headers = dict((name.lower(), value) for name, value in headers)
+        return ('set-cookie' not in headers and
+                headers.get('content-type', '').startswith('text/html'))
+
+    def __call__(self, environ, start_response):
+        if not self._is_cacheable_request(environ):
+            return self.app(environ, start_response)
+
+        key = (environ.get('CKAN_LANG'), environ['PATH_INFO'],
+               environ.get('QUERY_STRING', ''))
+        cached = _page_cache.get(key)
+        if cached is not None:
+            status, headers, body = cached
+            start_response(status, headers + [('X-Page-Cache', 'HIT')])
+            return [body]
+
+        response = {}
+        written = []
+
+        def _start_response(status, headers, exc_info=None):
+            response.update(status=status, headers=headers,
+                            exc_info=exc_info)
+            return written.append
+
+        app_iter = self.app(environ, _start_response)
+        try:
+            written.extend(app_iter)
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+        body = ''.join(written)
+
+        status, headers = response['status'], response['headers']
+        if self._is_cacheable_response(status, headers):
+            _page_cache.set(key, (status, headers, body), self.ttl)
+        start_response(status, headers + [('X-Page-Cache', 'MISS')],
+                       response['exc_info'])
+        return [body]
@@ -1,54 +1,68 @@
+from sqlalchemy import event
 from sqlalchemy.sql.expression import true
 
 import ckan.plugins as p
 from ckan import model
 
+from ckanext.sweden.cache import after_commit_listener, call_after_commit
+from ckanext.sweden.theme import fragmentcache
 from ckanext.sweden.theme import helpers
+from ckanext.sweden.theme import pagecache
 from ckanext.sweden.theme.logic import actions
 from ckanext.sweden.theme.logic import auth
 
 
-def _get_datasets(sort):
-    context = {'model': model, 'session': model.Session,
-               'user': p.toolkit.c.user, 'for_view': True,
-               'auth_user_obj': p.toolkit.c.userobj}
-    data_dict = {'fq': 'dataset_type:dataset', 'rows': 3, 'start': 0,
-                 'sort': sort}
-    query = p.toolkit.get_action('package_search')(context, data_dict)
-    if (query['results']):
-        return query['results']
-    return False
-
-
 def get_most_viewed_datasets():
-    return _get_datasets('views desc')
+    return helpers.get_homepage_datasets()['most_viewed'] or False
 
 
 def get_recently_updated_datasets():
-    return _get_datasets('metadata_modified desc')
-
-
-def get_top_groups():
-    return
+    return helpers.get_homepage_datasets()['recently_updated'] or False
 
 
 def get_recent_blog_posts():
     from ckanext.sweden.blog.model.post import Post
     posts = model.Session.query(Post).\
-        filter(Post.visible == true()).order_by('created desc').limit(3)
+        filter(Post.visible == true()).order_by(Post.created.desc()).limit(3)
     return posts
 
 
+def _invalidate_datasets():
+    helpers.invalidate_category_index()
+    helpers.invalidate_chart_cache()
+    helpers.invalidate_homepage_datasets()
+    helpers.invalidate_top_groups()
+    pagecache.purge()
+    fragmentcache.invalidate_tags('datasets', 'groups')
+
+
+def _invalidate_groups():
+    helpers.invalidate_top_groups()
+    pagecache.purge()
+    fragmentcache.invalidate_tags('groups')
+
+
+# The caches are cleared once the changes are committed, so they can't be
+# filled again with the old data in between.
+_groups_changed = after_commit_listener(_invalidate_groups)
+_blog_post_changed = after_commit_listener(pagecache.purge)
+
+
 class ThemePlugin(p.SingletonPlugin):
     '''This extension adds the ckanext_sweden theme to ckan.
 
-    This extension implements four interfaces
+    This extension implements these interfaces
 
       - ``IConfigurer`` allows to modify the configuration
       - ``IConfigurable`` get the configuration
       - ``ITemplateHelpers`` make helper methods available to templates
       - ``IActions`` add custom API endpoints
       - ``IAuthFunctions`` add authentication methods for use by actions
+      - ``IRoutes`` add the JSON endpoint of the homepage stats charts
+      - ``IMiddleware`` add the ``{% cache %}`` template tag, and cache the
+        homepage and news pages for anonymous users, if enabled
+      - ``IPackageController`` keep the weekly dataset stats and the cached
+        category index, homepage datasets and top groups up to date
     '''
 
     p.implements(p.IConfigurer, inherit=True)
@@ -56,6 +70,9 @@ class ThemePlugin(p.SingletonPlugin):
     p.implements(p.ITemplateHelpers, inherit=False)
     p.implements(p.IActions)
     p.implements(p.IAuthFunctions)
+    p.implements(p.IRoutes, inherit=True)
+    p.implements(p.IMiddleware, inherit=True)
+    p.implements(p.IPackageController, inherit=True)
 
     # IConfigurer
     def update_config(self, config):
@@ -68,13 +85,59 @@ class ThemePlugin(p.SingletonPlugin):
         p.toolkit.add_public_directory(config, 'public')
         p.toolkit.add_resource('resources', 'theme')
 
+    # IRoutes
+    def before_map(self, _map):
+        _map.connect('sweden_stats_chart', '/stats/chart/{chart}.json',
+                     controller='ckanext.sweden.theme.controllers:'
+                                'StatsController',
+                     action='chart',
+                     requirements={'chart': '|'.join(helpers.CHARTS)})
+        return _map
+
+    # IConfigurable
+    def configure(self, config):
+        from ckanext.sweden.blog.model.post import Post
+
+        # Datasets can be added to or removed from groups without updating
+        # them (e.g. with member_create), so the caches showing groups are
+        # invalidated on any change to a membership or group.
+        listeners = [
+            (model.Member, _groups_changed),
+            (model.Group, _groups_changed),
+            (Post, _blog_post_changed),
+        ]
+        for target, listener in listeners:
+            for identifier in ('after_insert', 'after_update',
+                               'after_delete'):
+                if not event.contains(target, identifier, listener):
+                    event.listen(target, identifier, listener)
+
+    # IMiddleware
+    def make_middleware(self, app, config):
+        fragmentcache.configure_backend(config)
+        fragmentcache.install(config)
+        if p.toolkit.asbool(
+                config.get('ckanext.sweden.page_cache.enabled', False)):
+            ttl = p.toolkit.asint(
+                config.get('ckanext.sweden.page_cache.ttl', 300))
+            pagecache.configure(p.toolkit.asint(
+                config.get('ckanext.sweden.page_cache.max_entries', 200)))
+            app = pagecache.PageCacheMiddleware(app, ttl=ttl)
+        return app
+
     # IActions
     def get_actions(self):
         return {
             'total_datasets_by_week': actions.total_datasets_by_week,
             'weekly_dataset_activity': actions.weekly_dataset_activity,
             'weekly_dataset_activity_new':
-                actions.weekly_dataset_activity_new
+                actions.weekly_dataset_activity_new,
+            'weekly_dataset_totals_by_eurovoc_label':
+                actions.weekly_dataset_totals_by_eurovoc_label,
+            'sweden_org_weekly_stats': actions.sweden_org_weekly_stats,
+            'distinct_active_datasets': actions.distinct_active_datasets,
+            'sweden_most_viewed': actions.sweden_most_viewed,
+            'sweden_top_groups': actions.sweden_top_groups,
         }
 
     # ITemplateHelpers
@@ -82,7 +145,7 @@ class ThemePlugin(p.SingletonPlugin):
         return {
             'get_most_viewed_datasets': get_most_viewed_datasets,
             'get_recently_updated_datasets': get_recently_updated_datasets,
-            'get_top_groups': get_top_groups,
+            'get_top_groups': helpers.get_top_groups,
             'get_recent_blog_posts': get_recent_blog_posts,
             'get_weekly_new_dataset_totals':
                 helpers.get_weekly_new_dataset_totals,
@@ -91,8 +154,11 @@ class ThemePlugin(p.SingletonPlugin):
                 helpers.get_weekly_dataset_activity_new,
             'get_weekly_new_dataset_totals_for_eurovoc_label':
                 helpers.get_weekly_new_dataset_totals_for_eurovoc_label,
+            'get_weekly_new_dataset_totals_by_eurovoc_label':
+                helpers.get_weekly_new_dataset_totals_by_eurovoc_label,
             'get_random_active_eurovoc_label':
-                helpers.get_random_active_eurovoc_label
+                helpers.get_random_active_eurovoc_label,
+            'get_most_viewed_ranking': helpers.get_most_viewed_ranking,
         }
 
     # IAuthFunctions
@@ -100,3 +166,19 @@ class ThemePlugin(p.SingletonPlugin):
         return {
             'sweden_stats_show': auth.sweden_stats_show,
         }
+
+    # IPackageController
+    def _dataset_changed(self, pkg_dict, new=False):
+        helpers.record_dataset_change(pkg_dict, new=new)
+        # The dataset is indexed and committed after this hook, so the caches
+        # built from the search index are only cleared afterwards
+        call_after_commit(model.Session(), _invalidate_datasets)
+
+    def after_create(self, context, pkg_dict):
+        self._dataset_changed(pkg_dict, new=True)
+
+    def after_update(self, context, pkg_dict):
+        self._dataset_changed(pkg_dict)
+
+    def after_delete(self, context, pkg_dict):
+        self._dataset_changed(pkg_dict)
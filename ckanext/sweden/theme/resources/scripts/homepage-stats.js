@@ -1 +1 @@
-!function(i){i.module("homepage-stats",function(i){return{options:{rawdata:[],xaxis:{},yaxis:{},legend:{position:"nw"},colors:["#ffcc33","#ff8844"],grid:{show:!1},series:{lines:{show:!0,lineWidth:1},shadowSize:0}},initialize:function(){var o=this.options.rawdata;i.plot(this.el.find(".demo-placeholder"),o,this.options)}}})}(window.ckan);
\ No newline at end of file
+!function(o){o.module("homepage-stats",function(o){return{options:{url:null,rawdata:[],xaxis:{},yaxis:{},legend:{position:"nw"},colors:["#ffcc33","#ff8844"],grid:{show:!1},series:{lines:{show:!0,lineWidth:1},shadowSize:0}},initialize:function(){o.proxyAll(this,/_on/),this.options.url?o.getJSON(this.options.url,this._onData):this._onData(this.options.rawdata)},_onData:function(t){var i=this.el.find(".demo-placeholder");return t.length?void o.plot(i,t,this.options):void i.remove()}}})}(window.ckan);
\ No newline at end of file
@@ -0,0 +1,184 @@
+from sqlalchemy import Table, select, func
+from pylons import config
+
+import ckan.model as model
+
+PACKAGE_ACTIVITY_TYPES = ('new package', 'changed package', 'deleted package')
+
+
+def table(name):
+    return Table(name, model.meta.metadata, autoload=True)
+
+
+class StatsSource(object):
+    '''
+    The tables the dataset stats are computed from.
+
+    Subclasses return the rows with a dataset id and a timestamp for each
+    change to a dataset, and this class builds the selects used by the stats
+    helpers from them. They implement:
+
+    * `_from_obj(join_orgs=False)`: the tables to select from, also joining
+      the `package` and `group` tables if `join_orgs` is True
+    * `_id_column()` and `_timestamp_column()`: the dataset id and the time
+      of each change
+    * `_dataset_filter()`: the clause limiting the rows to changes to
+      datasets
+    '''
+
+    def new_datasets_select(self, pkg_ids=None):
+        '''
+        Return a select of (id, timestamp) rows with the date each dataset
+        was created.
+
+        If pkg_ids list is passed, limit query to just those packages.
+        '''
+        # Can't filter by time in select because 'min' function has to
+        # be 'for all time' else you get first revision in the time period.
+        id_column = self._id_column()
+        s = select([id_column.label('id'),
+                    func.min(self._timestamp_column()).label('timestamp')],
+                   from_obj=[self._from_obj()]).\
+            where(self._dataset_filter())
+        if pkg_ids:
+            s = s.where(id_column.in_(pkg_ids))
+        return s.group_by(id_column)
+
+    def package_revisions_select(self):
+        '''
+        Return a select of (id, timestamp) rows, one for each change to a
+        dataset.
+        '''
+        return select([self._id_column().label('id'),
+                       self._timestamp_column().label('timestamp')],
+                      from_obj=[self._from_obj()]).\
+            where(self._dataset_filter())
+
+    def org_datasets_select(self, series, org_id=None):
+        '''
+        Return a select of (id, org, timestamp) rows for the `new` or
+        `active` series, where `org` is the name of the organization that
+        currently owns the dataset.
+
+        If org_id is passed, limit query to the datasets of that
+        organization.
+        '''
+        group = table('group')
+        id_column = self._id_column()
+        timestamp = self._timestamp_column()
+        from_obj = self._from_obj(join_orgs=True)
+        if series == 'active':
+            s = select([id_column.label('id'), group.c.name.label('org'),
+                        timestamp.label('timestamp')], from_obj=[from_obj])
+        else:
+            s = select([id_column.label('id'), group.c.name.label('org'),
+                        func.min(timestamp).label('timestamp')],
+                       from_obj=[from_obj]).\
+                group_by(id_column, group.c.name)
+        s = s.where(self._dataset_filter())
+        if org_id:
+            s = s.where(group.c.id == org_id)
+        return s
+
+
+class RevisionStatsSource(StatsSource):
+    '''Dataset stats from the `package_revision` and `revision` tables.'''
+
+    def __init__(self):
+        self.package_revision = table('package_revision')
+        self.revision = table('revision')
+
+    def _from_obj(self, join_orgs=False):
+        from_obj = self.package_revision.join(self.revision)
+        if join_orgs:
+            package = table('package')
+            group = table('group')
+            from_obj = from_obj.\
+                join(package, package.c.id == self.package_revision.c.id).\
+                join(group, group.c.id == package.c.owner_org)
+        return from_obj
+
+    def _id_column(self):
+        return self.package_revision.c.id
+
+    def _timestamp_column(self):
+        return self.revision.c.timestamp
+
+    def _dataset_filter(self):
+        return self.package_revision.c.type == 'dataset'
+
+
+class ActivityStatsSource(StatsSource):
+    '''Dataset stats from the `activity` table.
+
+    The activity table is much smaller than the revision tables, and is
+    still around in the CKAN versions that drop them. CKAN records no
+    activities for private datasets, so the datasets are dated from their
+    `metadata_created` instead of their first activity, and the changes made
+    while a dataset was private are missing from the activity counts.
+    '''
+
+    def __init__(self):
+        self.activity = table('activity')
+        self.package = table('package')
+
+    def _from_obj(self, join_orgs=False):
+        from_obj = self.activity.join(
+            self.package, self.package.c.id == self.activity.c.object_id)
+        if join_orgs:
+            group = table('group')
+            from_obj = from_obj.join(
+                group, group.c.id == self.package.c.owner_org)
+        return from_obj
+
+    def _id_column(self):
+        return self.activity.c.object_id
+
+    def _timestamp_column(self):
+        return self.activity.c.timestamp
+
+    def _dataset_filter(self):
+        return (self.activity.c.activity_type.in_(PACKAGE_ACTIVITY_TYPES) &
+                (self.package.c.type == 'dataset'))
+
+    def new_datasets_select(self, pkg_ids=None):
+        s = select([self.package.c.id.label('id'),
+                    self.package.c.metadata_created.label('timestamp')]).\
+            where(self.package.c.type == 'dataset')
+        if pkg_ids:
+            s = s.where(self.package.c.id.in_(pkg_ids))
+        return s
+
+    def org_datasets_select(self, series, org_id=None):
+        if series == 'active':
+            return super(ActivityStatsSource, self).org_datasets_select(
+                series, org_id=org_id)
+        group = table('group')
+        s = select([self.package.c.id.label('id'), group.c.name.label('org'),
+                    self.package.c.metadata_created.label('timestamp')],
+                   from_obj=[self.package.join(
+                       group, group.c.id == self.package.c.owner_org)]).\
+            where(self.package.c.type == 'dataset')
+        if org_id:
+            s = s.where(group.c.id == org_id)
+        return s
+
+
+STATS_SOURCES = {
+    'revision': RevisionStatsSource,
+    'activity': ActivityStatsSource,
+}
+
+
+def get_stats_source(name=None):
+    '''
+    Return the stats source with the given name, or the one set in the
+    `ckanext.sweden.stats.source` config option (default: `revision`).
+    '''
+    if name is None:
+        name = config.get('ckanext.sweden.stats.source', 'revision')
+    try:
+        return STATS_SOURCES[name]()
+    except KeyError:
+        raise ValueError('Unknown stats source: {0}. Valid sources are: '
+                         '{1}'.format(name, ', '.join(sorted(STATS_SOURCES))))
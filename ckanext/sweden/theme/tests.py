@@ -1,14 +1,42 @@
 import datetime
+import random
 
 from nose import tools as nosetools
+from nose.plugins.skip import SkipTest
+from pylons import config
 
 try:
+    import ckan.tests.factories as factories
     import ckan.tests.helpers as helpers
 except ImportError:
     # CKAN 2.3
+    import ckan.new_tests.factories as factories
     import ckan.new_tests.helpers as helpers
+import ckan.model as model
+import ckan.plugins as p
+import ckan.plugins.toolkit as toolkit
 
 from ckanext.sweden.theme import helpers as swe_helpers
+from ckanext.sweden.theme import sources
+from ckanext.sweden.theme.downsample import largest_triangle_three_buckets
+from ckanext.sweden.theme import fragmentcache
+from ckanext.sweden.theme import pagecache
+from ckanext.sweden.theme.model import stats as stats_model
+from ckanext.sweden.theme.hyperloglog import HyperLogLog
+
+
+class ThemeFunctionalTestBase(helpers.FunctionalTestBase):
+    '''Functional tests with the sweden_theme plugin loaded.'''
+
+    @classmethod
+    def setup_class(cls):
+        super(ThemeFunctionalTestBase, cls).setup_class()
+        p.load('sweden_theme')
+
+    @classmethod
+    def teardown_class(cls):
+        p.unload('sweden_theme')
+        super(ThemeFunctionalTestBase, cls).teardown_class()
 
 
 class TestWeeklyTotalsHelpers(helpers.FunctionalTestBase):
@@ -90,3 +118,719 @@ class TestWeeklyTotalsHelpers(helpers.FunctionalTestBase):
         # 4 in w/c 9 feb 2015
         nosetools.assert_equal(weekly_totals[2][0], 1423440000000)
         nosetools.assert_equal(weekly_totals[2][1], 4)
+
+    def test_format_week_totals_zero_week(self):
+        '''
+        Pre-aggregated (date, count) pairs are formatted like the output of
+        _weekly_totals, including the zero week.
+        '''
+        pairs = [(datetime.date(2014, 12, 29), 2),
+                 (datetime.date(2015, 1, 19), 1)]
+
+        week_totals = swe_helpers._format_week_totals(pairs, timestamp=True)
+
+        nosetools.assert_equal(week_totals, [(1419206400000, 0),
+                                             (1419811200000, 2),
+                                             (1421625600000, 1)])
+        nosetools.assert_equal(
+            swe_helpers._format_week_totals(pairs, zero_week=True)[0],
+            (datetime.date(2014, 12, 22), 0))
+
+    def test_range_facet_week_counts(self):
+        '''
+        A flat list of Solr range facet counts is turned into cumulative
+        (date, count) pairs, skipping empty weeks.
+        '''
+        counts = ['2014-12-29T00:00:00Z', 2,
+                  '2015-01-05T00:00:00Z', 0,
+                  '2015-01-12T00:00:00Z', 3]
+
+        week_counts = swe_helpers._range_facet_week_counts(counts)
+
+        nosetools.assert_equal(week_counts,
+                               [(datetime.date(2014, 12, 29), 2),
+                                (datetime.date(2015, 1, 12), 3)])
+        nosetools.assert_equal(swe_helpers._cumulative(week_counts),
+                               [(datetime.date(2014, 12, 29), 2),
+                                (datetime.date(2015, 1, 12), 5)])
+
+    def test_weekly_totals_month_granularity(self):
+        '''
+        A list of (datetime, id) tuples is correctly grouped into monthly
+        batches, with a zero month before the first one.
+        '''
+        monthly_totals = swe_helpers._weekly_totals(self.l, cumulative=True,
+                                                    granularity='month')
+
+        nosetools.assert_equal(monthly_totals,
+                               [(datetime.date(2014, 12, 1), 0),
+                                (datetime.date(2015, 1, 1), 3),
+                                (datetime.date(2015, 2, 1), 7)])
+
+
+class TestWeeklyTotalsNumpy(object):
+
+    @classmethod
+    def setup_class(cls):
+        if swe_helpers.numpy is None:
+            raise SkipTest('numpy is not installed')
+
+    def _revisions(self, count):
+        '''Return a sorted list of `count` synthetic (id, datetime) revisions
+        spread over five years.'''
+        rand = random.Random(count)
+        start = datetime.datetime(2012, 1, 1)
+        dates = sorted(
+            start + datetime.timedelta(seconds=rand.randint(0, 157680000))
+            for i in xrange(count))
+        return [(str(i), date) for i, date in enumerate(dates)]
+
+    def test_parity_with_python_implementation(self):
+        '''
+        The numpy implementation returns the same totals as the pure Python
+        one, for every combination of options.
+        '''
+        revisions = self._revisions(2000)
+
+        for granularity in ('day', 'week', 'month'):
+            for cumulative in (False, True):
+                for timestamp in (False, True):
+                    kwargs = {'cumulative': cumulative,
+                              'timestamp': timestamp,
+                              'granularity': granularity}
+                    nosetools.assert_equal(
+                        swe_helpers._weekly_totals_numpy(revisions, **kwargs),
+                        swe_helpers._weekly_totals_python(revisions,
+                                                          **kwargs))
+
+
+class TestHyperLogLog(object):
+
+    def test_count_is_close(self):
+        sketch = HyperLogLog()
+        for i in xrange(10000):
+            sketch.add('dataset-{0}'.format(i))
+            sketch.add('dataset-{0}'.format(i))
+
+        nosetools.assert_true(abs(sketch.count() - 10000) < 500)
+
+    def test_merge_counts_union(self):
+        sketch1 = HyperLogLog()
+        sketch2 = HyperLogLog()
+        for i in xrange(0, 600):
+            sketch1.add(str(i))
+        for i in xrange(400, 1000):
+            sketch2.add(str(i))
+
+        sketch1.merge(HyperLogLog.from_bytes(sketch2.to_bytes()))
+
+        nosetools.assert_true(abs(sketch1.count() - 1000) < 50)
+
+
+class TestDownsample(object):
+
+    def test_short_data_is_not_downsampled(self):
+        data = [(i, i) for i in range(10)]
+        nosetools.assert_equal(largest_triangle_three_buckets(data, 10), data)
+        nosetools.assert_equal(largest_triangle_three_buckets(data, 20), data)
+
+    def test_keeps_first_last_and_peaks(self):
+        data = [(i, 0) for i in range(100)]
+        data[42] = (42, 50)
+        data[77] = (77, -50)
+
+        sampled = largest_triangle_three_buckets(data, 10)
+
+        nosetools.assert_equal(len(sampled), 10)
+        nosetools.assert_equal(sampled[0], data[0])
+        nosetools.assert_equal(sampled[-1], data[-1])
+        nosetools.assert_true((42, 50) in sampled)
+        nosetools.assert_true((77, -50) in sampled)
+        nosetools.assert_equal(sampled, sorted(sampled))
+
+
+class TestStatsChart(ThemeFunctionalTestBase):
+
+    def setup(self):
+        super(TestStatsChart, self).setup()
+        swe_helpers.invalidate_chart_cache()
+        self.app = helpers._get_test_app()
+
+    def test_chart_json(self):
+        for i in range(3):
+            factories.Dataset()
+
+        response = self.app.get('/stats/chart/growth.json')
+
+        nosetools.assert_equal(response.content_type, 'application/json')
+        nosetools.assert_true(
+            'max-age' in response.headers['Cache-Control'])
+        nosetools.assert_equal(
+            response.json[0]['data'],
+            [list(point)
+             for point in swe_helpers.get_weekly_new_dataset_totals()])
+
+    def test_category_chart_is_not_cached(self):
+        factories.Dataset()
+
+        response = self.app.get('/stats/chart/category.json')
+
+        nosetools.assert_equal(response.headers['Cache-Control'], 'no-cache')
+
+    def test_chart_points(self):
+        factories.Dataset()
+
+        response = self.app.get('/stats/chart/activity.json?points=3')
+
+        nosetools.assert_equal(len(response.json), 2)
+        for line in response.json:
+            nosetools.assert_true(len(line['data']) <= 3)
+
+    def test_invalid_points(self):
+        self.app.get('/stats/chart/growth.json?points=1', status=400)
+
+    def test_homepage_does_not_inline_stats(self):
+        factories.Dataset()
+
+        response = self.app.get('/')
+
+        nosetools.assert_true('/stats/chart/growth.json' in response.body)
+        nosetools.assert_false('data-module-rawdata' in response.body)
+
+
+class TestHomepageDatasets(ThemeFunctionalTestBase):
+
+    def setup(self):
+        super(TestHomepageDatasets, self).setup()
+        swe_helpers.invalidate_homepage_datasets()
+
+    def test_recently_updated(self):
+        datasets = [factories.Dataset() for i in range(4)]
+        helpers.call_action('package_patch', id=datasets[0]['id'],
+                            notes='Updated')
+
+        recently_updated = \
+            swe_helpers.get_homepage_datasets()['recently_updated']
+
+        nosetools.assert_equal(
+            [dataset['name'] for dataset in recently_updated],
+            [datasets[0]['name'], datasets[3]['name'], datasets[2]['name']])
+        nosetools.assert_equal(recently_updated[0]['notes'], 'Updated')
+
+    def test_cache_is_invalidated_on_create(self):
+        factories.Dataset()
+        swe_helpers.get_homepage_datasets()
+
+        dataset = factories.Dataset()
+
+        recently_updated = \
+            swe_helpers.get_homepage_datasets()['recently_updated']
+        nosetools.assert_equal(recently_updated[0]['id'], dataset['id'])
+
+    def test_cache_is_invalidated_after_commit(self):
+        old = factories.Dataset()
+        swe_helpers.get_homepage_datasets()
+
+        dataset = helpers.call_action('package_create',
+                                      context={'defer_commit': True},
+                                      name='not-committed-yet')
+
+        recently_updated = \
+            swe_helpers.get_homepage_datasets()['recently_updated']
+        nosetools.assert_equal(recently_updated[0]['id'], old['id'])
+
+        model.Session.commit()
+
+        recently_updated = \
+            swe_helpers.get_homepage_datasets()['recently_updated']
+        nosetools.assert_equal(recently_updated[0]['id'], dataset['id'])
+
+    def test_private_datasets_are_not_listed(self):
+        org = factories.Organization()
+        factories.Dataset(owner_org=org['id'], private=True)
+
+        datasets = swe_helpers.get_homepage_datasets()
+
+        nosetools.assert_equal(datasets['recently_updated'], [])
+        nosetools.assert_equal(datasets['most_viewed'], [])
+
+
+class TestMostViewed(ThemeFunctionalTestBase):
+
+    def setup(self):
+        super(TestMostViewed, self).setup()
+        stats_model.init_tables(model.meta.engine)
+        model.Session.query(stats_model.MostViewed).delete()
+        model.Session.commit()
+
+    def _add_views(self, dataset, days_ago, count):
+        tracking_summary = sources.table('tracking_summary')
+        model.Session.execute(tracking_summary.insert().values(
+            url='/dataset/{0}'.format(dataset['name']),
+            package_id=dataset['id'],
+            tracking_type='page',
+            count=count,
+            running_total=count,
+            recent_views=count,
+            tracking_date=datetime.date.today() -
+            datetime.timedelta(days=days_ago)))
+        model.Session.commit()
+
+    def test_most_viewed(self):
+        old_favourite = factories.Dataset()
+        trending = factories.Dataset()
+        private = factories.Dataset(owner_org=factories.Organization()['id'],
+                                    private=True)
+        self._add_views(old_favourite, 100, 50)
+        self._add_views(old_favourite, 1, 1)
+        self._add_views(trending, 2, 10)
+        self._add_views(trending, 1, 10)
+        self._add_views(private, 1, 1000)
+
+        swe_helpers.rebuild_most_viewed()
+
+        nosetools.assert_equal(
+            [(dataset['name'], dataset['views']) for dataset in
+             helpers.call_action('sweden_most_viewed')],
+            [(old_favourite['name'], 51), (trending['name'], 20)])
+        nosetools.assert_equal(
+            [dataset['name'] for dataset in
+             helpers.call_action('sweden_most_viewed', period='7d',
+                                 limit=1)],
+            [trending['name']])
+
+    def test_not_built(self):
+        nosetools.assert_equal(helpers.call_action('sweden_most_viewed'), [])
+
+    def test_invalid_period(self):
+        nosetools.assert_raises(toolkit.ValidationError, helpers.call_action,
+                                'sweden_most_viewed', period='1y')
+
+
+class TestWeeklyStatsTable(ThemeFunctionalTestBase):
+
+    def setup(self):
+        super(TestWeeklyStatsTable, self).setup()
+        stats_model.init_tables(model.meta.engine)
+        model.Session.query(stats_model.WeeklyStats).delete()
+        model.Session.commit()
+
+    def _stats(self, week_start):
+        model.Session.expire_all()
+        stats = stats_model.WeeklyStats.get(week_start)
+        return (stats.new, stats.active, stats.total)
+
+    def test_new_datasets(self):
+        week = datetime.date(2015, 1, 5)
+        stats_model.record_new_dataset(week, 'a')
+        stats_model.record_new_dataset(week, 'b')
+        model.Session.commit()
+
+        nosetools.assert_equal(self._stats(week), (2, 2, 2))
+
+    def test_new_week_starts_from_previous_total(self):
+        stats_model.record_new_dataset(datetime.date(2015, 1, 5), 'a')
+        stats_model.record_new_dataset(datetime.date(2015, 1, 19), 'b')
+        model.Session.commit()
+
+        nosetools.assert_equal(self._stats(datetime.date(2015, 1, 19)),
+                               (1, 1, 2))
+
+    def test_later_weeks_are_updated(self):
+        stats_model.record_new_dataset(datetime.date(2015, 1, 19), 'a')
+        stats_model.record_new_dataset(datetime.date(2015, 1, 5), 'b')
+        model.Session.commit()
+
+        nosetools.assert_equal(self._stats(datetime.date(2015, 1, 5)),
+                               (1, 1, 1))
+        nosetools.assert_equal(self._stats(datetime.date(2015, 1, 19)),
+                               (1, 1, 2))
+
+    def test_dataset_activity(self):
+        week = datetime.date(2015, 1, 5)
+        stats_model.record_new_dataset(week, 'a')
+        stats_model.record_dataset_activity(week, 'a')
+        stats_model.record_dataset_activity(week, 'b')
+        model.Session.commit()
+
+        nosetools.assert_equal(self._stats(week), (1, 3, 1))
+        nosetools.assert_equal(
+            stats_model.WeeklyStats.get(week).get_active_sketch().count(), 2)
+
+    def test_existing_row_is_used(self):
+        '''
+        A row added by another transaction is updated, not added again.
+        '''
+        week = datetime.date(2015, 1, 5)
+        model.meta.engine.execute(
+            stats_model.WeeklyStats.__table__.insert().values(
+                week_start=week, new=1, active=1, total=10))
+
+        stats_model.record_new_dataset(week, 'a')
+        model.Session.commit()
+
+        nosetools.assert_equal(self._stats(week), (2, 2, 11))
+
+    def test_failure_does_not_break_dataset_create(self):
+        '''
+        Datasets can still be created if the stats can't be updated, e.g.
+        because the table is missing.
+        '''
+        stats_model.WeeklyStats.__table__.drop(model.meta.engine)
+        original = config.get('ckanext.sweden.stats.materialized')
+        config['ckanext.sweden.stats.materialized'] = 'true'
+        try:
+            dataset = factories.Dataset()
+        finally:
+            if original is None:
+                config.pop('ckanext.sweden.stats.materialized', None)
+            else:
+                config['ckanext.sweden.stats.materialized'] = original
+            stats_model.init_tables(model.meta.engine)
+
+        nosetools.assert_equal(
+            helpers.call_action('package_show', id=dataset['id'])['name'],
+            dataset['name'])
+
+
+class TestTopGroups(ThemeFunctionalTestBase):
+
+    def setup(self):
+        super(TestTopGroups, self).setup()
+        swe_helpers.invalidate_top_groups()
+
+    def test_top_groups(self):
+        small = factories.Group(title='Small group')
+        large = factories.Group(title='Large group')
+        factories.Group()
+        factories.Dataset(groups=[{'name': small['name']}])
+        for i in range(2):
+            factories.Dataset(groups=[{'name': large['name']}])
+
+        top_groups = helpers.call_action('sweden_top_groups')
+
+        nosetools.assert_equal(
+            [(group['name'], group['title'], group['package_count'])
+             for group in top_groups],
+            [(large['name'], 'Large group', 2),
+             (small['name'], 'Small group', 1)])
+        nosetools.assert_equal(
+            len(helpers.call_action('sweden_top_groups', limit=1)), 1)
+
+    def test_cache_is_invalidated_on_membership_change(self):
+        group = factories.Group()
+        dataset = factories.Dataset()
+        helpers.call_action('sweden_top_groups')
+
+        helpers.call_action('member_create', id=group['id'],
+                            object=dataset['id'], object_type='package',
+                            capacity='public')
+
+        nosetools.assert_equal(swe_helpers._top_groups.get('groups'), None)
+
+
+class TestPageCache(ThemeFunctionalTestBase):
+
+    @classmethod
+    def setup_class(cls):
+        super(TestPageCache, cls).setup_class()
+        cls._page_cache_enabled = config.get(
+            'ckanext.sweden.page_cache.enabled')
+        config['ckanext.sweden.page_cache.enabled'] = True
+
+    @classmethod
+    def teardown_class(cls):
+        if cls._page_cache_enabled is None:
+            config.pop('ckanext.sweden.page_cache.enabled', None)
+        else:
+            config['ckanext.sweden.page_cache.enabled'] = \
+                cls._page_cache_enabled
+        pagecache.configure(200)
+        super(TestPageCache, cls).teardown_class()
+
+    def setup(self):
+        super(TestPageCache, self).setup()
+        pagecache.purge()
+        self.app = helpers._get_test_app()
+
+    def test_homepage_is_cached(self):
+        response = self.app.get('/')
+        nosetools.assert_equal(response.headers['X-Page-Cache'], 'MISS')
+
+        cached_response = self.app.get('/')
+        nosetools.assert_equal(cached_response.headers['X-Page-Cache'],
+                               'HIT')
+        nosetools.assert_equal(cached_response.body, response.body)
+
+    def test_cache_is_keyed_by_language(self):
+        self.app.get('/')
+
+        response = self.app.get('/sv/')
+
+        nosetools.assert_equal(response.headers['X-Page-Cache'], 'MISS')
+
+    def test_purged_on_dataset_change(self):
+        self.app.get('/')
+
+        factories.Dataset()
+
+        response = self.app.get('/')
+        nosetools.assert_equal(response.headers['X-Page-Cache'], 'MISS')
+
+    def test_purged_on_organization_change(self):
+        self.app.get('/')
+
+        factories.Organization()
+
+        response = self.app.get('/')
+        nosetools.assert_equal(response.headers['X-Page-Cache'], 'MISS')
+
+    def test_logged_in_users_are_not_served_from_cache(self):
+        user = factories.User()
+        self.app.get('/')
+
+        response = self.app.get(
+            '/', extra_environ={'REMOTE_USER': str(user['name'])})
+
+        nosetools.assert_true('X-Page-Cache' not in response.headers)
+
+    def test_other_pages_are_not_cached(self):
+        response = self.app.get('/dataset')
+
+        nosetools.assert_true('X-Page-Cache' not in response.headers)
+
+    def test_unknown_query_parameters_are_not_cached(self):
+        for i in range(3):
+            response = self.app.get('/', params={'x': i})
+
+            nosetools.assert_true('X-Page-Cache' not in response.headers)
+
+    def test_cache_is_bounded(self):
+        pagecache.configure(1)
+        self.app.get('/')
+        self.app.get('/sv/')
+
+        response = self.app.get('/')
+
+        nosetools.assert_equal(response.headers['X-Page-Cache'], 'MISS')
+        nosetools.assert_equal(len(pagecache._page_cache._entries), 1)
+
+
+class TestFragmentCacheLRUBackend(object):
+
+    def test_get_and_set(self):
+        backend = fragmentcache.LRUBackend()
+        backend.set('key', 'value', 60)
+
+        nosetools.assert_equal(backend.get('key'), 'value')
+        nosetools.assert_equal(backend.get('other'), None)
+
+    def test_expired(self):
+        backend = fragmentcache.LRUBackend()
+        backend.set('key', 'value', -1)
+
+        nosetools.assert_equal(backend.get('key'), None)
+
+    def test_least_recently_used_is_dropped(self):
+        backend = fragmentcache.LRUBackend(max_entries=2)
+        backend.set('a', 'A', 60)
+        backend.set('b', 'B', 60)
+        backend.get('a')
+        backend.set('c', 'C', 60)
+
+        nosetools.assert_equal(backend.get('a'), 'A')
+        nosetools.assert_equal(backend.get('b'), None)
+        nosetools.assert_equal(backend.get('c'), 'C')
+
+    def test_invalidate_tags(self):
+        backend = fragmentcache.LRUBackend()
+        backend.set('a', 'A', 60, tags=('datasets',))
+        backend.set('b', 'B', 60, tags=('blog',))
+
+        backend.invalidate_tags(('datasets',))
+
+        nosetools.assert_equal(backend.get('a'), None)
+        nosetools.assert_equal(backend.get('b'), 'B')
+
+
+class TestFragmentCache(ThemeFunctionalTestBase):
+
+    def setup(self):
+        super(TestFragmentCache, self).setup()
+        self.app = helpers._get_test_app()
+        fragmentcache.get_backend().clear()
+
+    def test_homepage_fragments_are_cached(self):
+        self.app.get('/')
+
+        nosetools.assert_true(
+            'Most viewed datasets' in
+            fragmentcache.get_backend().get(u'en:most_viewed'))
+
+    def test_dataset_fragments_are_invalidated(self):
+        self.app.get('/')
+
+        factories.Dataset()
+
+        nosetools.assert_equal(
+            fragmentcache.get_backend().get(u'en:most_viewed'), None)
+
+
+class TestWeeklyCountsSQL(helpers.FunctionalTestBase):
+
+    def setup(self):
+        super(TestWeeklyCountsSQL, self).setup()
+        for i in range(3):
+            dataset = factories.Dataset()
+        helpers.call_action('package_patch', id=dataset['id'],
+                            notes='Updated')
+
+    def test_new_datasets_match_python_bucketing(self):
+        '''
+        Weekly counts computed by the database match the ones computed by
+        _weekly_totals.
+        '''
+        nosetools.assert_equal(
+            swe_helpers.get_period_counts(
+                swe_helpers._new_datasets_select(), cumulative=True),
+            swe_helpers._weekly_totals(swe_helpers.get_new_datasets(),
+                                       cumulative=True, zero_week=False))
+
+    def test_package_revisions_match_python_bucketing(self):
+        '''
+        Weekly activity counts computed by the database match the ones
+        computed by _weekly_totals.
+        '''
+        nosetools.assert_equal(
+            swe_helpers.get_period_counts(
+                swe_helpers._package_revisions_select()),
+            swe_helpers._weekly_totals(swe_helpers.get_package_revisions(),
+                                       zero_week=False))
+
+    def test_distinct_activity(self):
+        '''
+        Distinct activity counts each updated dataset once per week.
+        '''
+        this_week = swe_helpers._transform_to_week_start(
+            datetime.datetime.utcnow())
+        nosetools.assert_equal(
+            swe_helpers.get_weekly_dataset_activity(
+                timestamp=False, zero_week=False, distinct='exact'),
+            [(this_week, 3)])
+        nosetools.assert_equal(
+            swe_helpers.get_distinct_active_datasets(),
+            {'count': 3, 'approximate': False})
+
+    def test_since_and_granularity(self):
+        '''
+        Cumulative monthly counts computed by the database can be limited to
+        the periods starting after a given date.
+        '''
+        monthly_totals = swe_helpers.get_period_counts(
+            swe_helpers._new_datasets_select(), cumulative=True,
+            granularity='month')
+        since = monthly_totals[-1][0]
+
+        nosetools.assert_equal(
+            swe_helpers.get_period_counts(
+                swe_helpers._new_datasets_select(), cumulative=True,
+                granularity='month', since=since),
+            monthly_totals[-1:])
+
+
+class TestActivityStatsSource(helpers.FunctionalTestBase):
+
+    def setup(self):
+        super(TestActivityStatsSource, self).setup()
+        org = factories.Organization()
+        for i in range(3):
+            dataset = factories.Dataset(owner_org=org['id'])
+        helpers.call_action('package_patch', id=dataset['id'],
+                            notes='Updated')
+        self.revision = sources.get_stats_source('revision')
+        self.activity = sources.get_stats_source('activity')
+
+    def _rows(self, s):
+        return sorted((row.id, swe_helpers._transform_to_week_start(
+            row.timestamp)) for row in model.Session.execute(s))
+
+    def test_new_datasets_match_revision_source(self):
+        nosetools.assert_equal(
+            self._rows(self.activity.new_datasets_select()),
+            self._rows(self.revision.new_datasets_select()))
+
+    def test_active_datasets_match_revision_source(self):
+        '''
+        Both sources give the same number of dataset changes each week.
+        '''
+        nosetools.assert_equal(
+            swe_helpers.get_period_counts(
+                self.activity.package_revisions_select()),
+            swe_helpers.get_period_counts(
+                self.revision.package_revisions_select()))
+
+    def test_org_datasets_match_revision_source(self):
+        activity_rows = model.Session.execute(
+            self.activity.org_datasets_select('new')).fetchall()
+        revision_rows = model.Session.execute(
+            self.revision.org_datasets_select('new')).fetchall()
+        nosetools.assert_equal(
+            sorted((row.id, row.org) for row in activity_rows),
+            sorted((row.id, row.org) for row in revision_rows))
+
+    def test_private_dataset_matches_revision_source(self):
+        '''
+        A dataset created private and published later is dated from its
+        creation, although it has no activities from before it was public.
+        '''
+        org = factories.Organization()
+        dataset = factories.Dataset(owner_org=org['id'], private=True)
+        helpers.call_action('package_patch', id=dataset['id'], private=False)
+
+        nosetools.assert_equal(
+            self._rows(self.activity.new_datasets_select()),
+            self._rows(self.revision.new_datasets_select()))
+        nosetools.assert_equal(
+            self._rows(self.activity.new_datasets_select([dataset['id']])),
+            self._rows(self.revision.new_datasets_select([dataset['id']])))
+        activity_rows = model.Session.execute(
+            self.activity.org_datasets_select('new')).fetchall()
+        revision_rows = model.Session.execute(
+            self.revision.org_datasets_select('new')).fetchall()
+        nosetools.assert_equal(
+            sorted((row.id, row.org) for row in activity_rows),
+            sorted((row.id, row.org) for row in revision_rows))
+
+    def test_unknown_source(self):
+        nosetools.assert_raises(ValueError, sources.get_stats_source, 'foo')
+
+
+class TestOrgWeeklyStats(ThemeFunctionalTestBase):
+
+    def test_org_weekly_stats(self):
+        '''
+        The weekly stats of each organization only count its own datasets.
+        '''
+        org1 = factories.Organization()
+        org2 = factories.Organization()
+        factories.Dataset(owner_org=org1['id'])
+        factories.Dataset(owner_org=org1['id'])
+        factories.Dataset(owner_org=org2['id'])
+
+        org_stats = helpers.call_action('sweden_org_weekly_stats')
+
+        nosetools.assert_equal(sorted(org_stats.keys()),
+                               sorted([org1['name'], org2['name']]))
+        nosetools.assert_equal(org_stats[org1['name']]['total'][-1][1], 2)
+        nosetools.assert_equal(org_stats[org2['name']]['total'][-1][1], 1)
+
+    def test_org_weekly_stats_for_one_org(self):
+        org1 = factories.Organization()
+        org2 = factories.Organization()
+        factories.Dataset(owner_org=org1['id'])
+        factories.Dataset(owner_org=org2['id'])
+
+        org_stats = helpers.call_action('sweden_org_weekly_stats',
+                                        id=org2['name'])
+
+        nosetools.assert_equal(org_stats.keys(), [org2['name']])
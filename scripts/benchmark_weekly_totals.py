@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+'''
+Time the pure Python and the numpy implementations of the weekly totals of
+the stats charts on synthetic dataset revisions:
+
+    python scripts/benchmark_weekly_totals.py [COUNT]
+
+COUNT is the number of revisions (default: 1000000). It needs CKAN,
+ckanext-sweden and numpy installed in the current virtualenv.
+'''
+import datetime
+import random
+import sys
+import time
+
+from ckanext.sweden.theme import helpers
+
+
+def revisions(count):
+    '''Return a sorted list of `count` synthetic (id, datetime) revisions
+    spread over five years.'''
+    rand = random.Random(count)
+    start = datetime.datetime(2012, 1, 1)
+    dates = sorted(
+        start + datetime.timedelta(seconds=rand.randint(0, 157680000))
+        for i in xrange(count))
+    return [(str(i), date) for i, date in enumerate(dates)]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    if helpers.numpy is None:
+        sys.exit('numpy is not installed')
+    data = revisions(count)
+
+    for name, weekly_totals in (
+            ('python', helpers._weekly_totals_python),
+            ('numpy', helpers._weekly_totals_numpy)):
+        start = time.time()
+        weekly_totals(data, cumulative=True, timestamp=True)
+        print '{0}: {1:.2f}s'.format(name, time.time() - start)
+
+
+if __name__ == '__main__':
+    main()
@@ -35,6 +35,10 @@ setup(
 
         [paste.paster_command]
         sweden_blog_init = ckanext.sweden.blog.commands.blog_init:InitDB
+        sweden_blog_render = ckanext.sweden.blog.commands.blog_render:RenderPosts
+        sweden_blog_export = ckanext.sweden.blog.commands.blog_export:ExportNews
+        sweden_stats = ckanext.sweden.theme.commands.stats:StatsCommand
+        sweden_harvest_init = ckanext.sweden.dcat.commands.harvest_init:InitDB
 
         [babel.extractors]
         ckan = ckan.lib.extract:extract_ckan